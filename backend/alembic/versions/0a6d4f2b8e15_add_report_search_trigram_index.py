@@ -0,0 +1,39 @@
+"""Add computed search text with trigram GIN index to reports
+
+Revision ID: 0a6d4f2b8e15
+Revises: f3c8d1e5a972
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a6d4f2b8e15'
+down_revision = 'f3c8d1e5a972'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 日本語をトライグラムに分解するには、DBの LC_CTYPE が C 以外（ja_JP.UTF-8 等）である必要がある
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.add_column('reports', sa.Column(
+        'search_text',
+        sa.Text(),
+        sa.Computed("content || ' ' || coalesce(tasks_completed, '') || ' ' || coalesce(issues, '')", persisted=True),
+        nullable=True
+    ))
+    op.create_index(
+        'ix_reports_search_text_trgm',
+        'reports',
+        ['search_text'],
+        postgresql_using='gin',
+        postgresql_ops={'search_text': 'gin_trgm_ops'}
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_reports_search_text_trgm', table_name='reports')
+    op.drop_column('reports', 'search_text')
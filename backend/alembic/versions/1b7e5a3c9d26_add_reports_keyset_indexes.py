@@ -0,0 +1,26 @@
+"""Add keyset pagination indexes to reports
+
+Revision ID: 1b7e5a3c9d26
+Revises: 0a6d4f2b8e15
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1b7e5a3c9d26'
+down_revision = '0a6d4f2b8e15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_reports_report_date_id', 'reports', ['report_date', 'id'], unique=False)
+    op.create_index('ix_reports_user_id_report_date_id', 'reports', ['user_id', 'report_date', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_reports_user_id_report_date_id', table_name='reports')
+    op.drop_index('ix_reports_report_date_id', table_name='reports')
@@ -0,0 +1,29 @@
+"""Add trigram GIN indexes for employee search
+
+Revision ID: 2c9f6b4d1e37
+Revises: 1b7e5a3c9d26
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c9f6b4d1e37'
+down_revision = '1b7e5a3c9d26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index('ix_users_full_name_trgm', 'users', ['full_name'], postgresql_using='gin', postgresql_ops={'full_name': 'gin_trgm_ops'})
+    op.create_index('ix_users_email_trgm', 'users', ['email'], postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'})
+    op.create_index('ix_users_employee_code_trgm', 'users', ['employee_code'], postgresql_using='gin', postgresql_ops={'employee_code': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_employee_code_trgm', table_name='users')
+    op.drop_index('ix_users_email_trgm', table_name='users')
+    op.drop_index('ix_users_full_name_trgm', table_name='users')
@@ -0,0 +1,26 @@
+"""Add indexes for shift and attendance reconciliation
+
+Revision ID: 3b8d0f6a2c41
+Revises: e780b3e72707
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8d0f6a2c41'
+down_revision = 'e780b3e72707'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_attendances_check_in_time', 'attendances', ['check_in_time'])
+    op.create_index('ix_shifts_date_status', 'shifts', ['date', 'status'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_shifts_date_status', table_name='shifts')
+    op.drop_index('ix_attendances_check_in_time', table_name='attendances')
@@ -0,0 +1,28 @@
+"""Add keyset pagination indexes to users
+
+Revision ID: 3d1a7c5e2f48
+Revises: 2c9f6b4d1e37
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d1a7c5e2f48'
+down_revision = '2c9f6b4d1e37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_users_created_at_id', 'users', ['created_at', 'id'], unique=False)
+    op.create_index('ix_users_full_name_id', 'users', ['full_name', 'id'], unique=False)
+    op.create_index('ix_users_hire_date_id', 'users', ['hire_date', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_hire_date_id', table_name='users')
+    op.drop_index('ix_users_full_name_id', table_name='users')
+    op.drop_index('ix_users_created_at_id', table_name='users')
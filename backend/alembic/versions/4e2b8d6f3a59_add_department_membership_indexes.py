@@ -0,0 +1,26 @@
+"""Add department membership indexes
+
+Revision ID: 4e2b8d6f3a59
+Revises: 3d1a7c5e2f48
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e2b8d6f3a59'
+down_revision = '3d1a7c5e2f48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_user_departments_department_id_user_id', 'user_departments', ['department_id', 'user_id'], unique=False)
+    op.create_index('ix_users_department_id_full_name_id', 'users', ['department_id', 'full_name', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_department_id_full_name_id', table_name='users')
+    op.drop_index('ix_user_departments_department_id_user_id', table_name='user_departments')
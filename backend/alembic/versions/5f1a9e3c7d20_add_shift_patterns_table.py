@@ -0,0 +1,48 @@
+"""Add shift_patterns table for recurring weekly shifts
+
+Revision ID: 5f1a9e3c7d20
+Revises: 9c4e27d1b5a8
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f1a9e3c7d20'
+down_revision = '9c4e27d1b5a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'shift_patterns',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('admin_id', sa.Integer(), nullable=True),
+        sa.Column('template_id', sa.Integer(), nullable=True),
+        sa.Column('weekday', sa.Integer(), nullable=False),
+        sa.Column('start_time', sa.Time(), nullable=True),
+        sa.Column('end_time', sa.Time(), nullable=True),
+        sa.Column('availability', sa.String(length=20), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('memo', sa.String(length=255), nullable=True),
+        sa.Column('valid_from', sa.Date(), nullable=False),
+        sa.Column('valid_to', sa.Date(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['admin_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['template_id'], ['shift_templates.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_shift_patterns_id'), 'shift_patterns', ['id'], unique=False)
+    op.create_index(op.f('ix_shift_patterns_user_id'), 'shift_patterns', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_shift_patterns_user_id'), table_name='shift_patterns')
+    op.drop_index(op.f('ix_shift_patterns_id'), table_name='shift_patterns')
+    op.drop_table('shift_patterns')
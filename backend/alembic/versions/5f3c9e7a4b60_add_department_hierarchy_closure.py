@@ -0,0 +1,42 @@
+"""Add department parent and closure table
+
+Revision ID: 5f3c9e7a4b60
+Revises: 4e2b8d6f3a59
+Create Date: 2026-10-19 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f3c9e7a4b60'
+down_revision = '4e2b8d6f3a59'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('departments', sa.Column('parent_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('departments_parent_id_fkey', 'departments', 'departments', ['parent_id'], ['id'])
+    op.create_index(op.f('ix_departments_parent_id'), 'departments', ['parent_id'], unique=False)
+    op.create_table(
+        'department_closure',
+        sa.Column('ancestor_id', sa.Integer(), nullable=False),
+        sa.Column('descendant_id', sa.Integer(), nullable=False),
+        sa.Column('depth', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['ancestor_id'], ['departments.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['descendant_id'], ['departments.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id')
+    )
+    op.create_index('ix_department_closure_descendant_id', 'department_closure', ['descendant_id', 'ancestor_id'], unique=False)
+    # 既存の部署はすべて最上位のため、自分自身の行のみ作成する
+    op.execute("INSERT INTO department_closure (ancestor_id, descendant_id, depth) SELECT id, id, 0 FROM departments")
+
+
+def downgrade() -> None:
+    op.drop_index('ix_department_closure_descendant_id', table_name='department_closure')
+    op.drop_table('department_closure')
+    op.drop_index(op.f('ix_departments_parent_id'), table_name='departments')
+    op.drop_constraint('departments_parent_id_fkey', 'departments', type_='foreignkey')
+    op.drop_column('departments', 'parent_id')
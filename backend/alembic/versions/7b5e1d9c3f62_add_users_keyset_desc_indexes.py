@@ -0,0 +1,29 @@
+"""Add descending keyset pagination indexes to users
+
+Revision ID: 7b5e1d9c3f62
+Revises: 6a4d0f8b5c71
+Create Date: 2026-10-20 01:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b5e1d9c3f62'
+down_revision = '6a4d0f8b5c71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 降順の一覧（ORDER BY 列 DESC NULLS LAST, id DESC）は昇順インデックスの逆走査では NULL の位置が合わないため専用に作成する
+    op.create_index('ix_users_created_at_desc_id', 'users', [sa.text('created_at DESC NULLS LAST'), sa.text('id DESC')], unique=False)
+    op.create_index('ix_users_full_name_desc_id', 'users', [sa.text('full_name DESC NULLS LAST'), sa.text('id DESC')], unique=False)
+    op.create_index('ix_users_hire_date_desc_id', 'users', [sa.text('hire_date DESC NULLS LAST'), sa.text('id DESC')], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_hire_date_desc_id', table_name='users')
+    op.drop_index('ix_users_full_name_desc_id', table_name='users')
+    op.drop_index('ix_users_created_at_desc_id', table_name='users')
@@ -0,0 +1,47 @@
+"""Add computed shift period with per-user exclusion constraint
+
+Revision ID: 9c4e27d1b5a8
+Revises: 3b8d0f6a2c41
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4e27d1b5a8'
+down_revision = '3b8d0f6a2c41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # integer の = をGiSTで扱うために必要
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    op.add_column('shifts', sa.Column(
+        'period',
+        postgresql.TSRANGE(),
+        sa.Computed(
+            "CASE WHEN start_time IS NULL OR end_time IS NULL THEN NULL "
+            "WHEN end_time < start_time THEN tsrange(\"date\" + start_time, (\"date\" + 1) + end_time) "
+            "ELSE tsrange(\"date\" + start_time, \"date\" + end_time) END",
+            persisted=True
+        ),
+        nullable=True
+    ))
+    # 既存データに重複がある場合は、先に解消しないと作成に失敗する
+    op.create_exclude_constraint(
+        'excl_shifts_user_period',
+        'shifts',
+        ('user_id', '='),
+        ('period', '&&'),
+        using='gist',
+        where="status != 'rejected' AND availability != 'unavailable'"
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('excl_shifts_user_period', 'shifts', type_='exclude')
+    op.drop_column('shifts', 'period')
@@ -0,0 +1,26 @@
+"""Add half-day flags to leaves
+
+Revision ID: a7d3c5e9f012
+Revises: 5f1a9e3c7d20
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3c5e9f012'
+down_revision = '5f1a9e3c7d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('leaves', sa.Column('start_half_day', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.add_column('leaves', sa.Column('end_half_day', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('leaves', 'end_half_day')
+    op.drop_column('leaves', 'start_half_day')
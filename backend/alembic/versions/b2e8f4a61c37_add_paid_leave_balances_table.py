@@ -0,0 +1,35 @@
+"""Add paid_leave_balances ledger table
+
+Revision ID: b2e8f4a61c37
+Revises: a7d3c5e9f012
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2e8f4a61c37'
+down_revision = 'a7d3c5e9f012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'paid_leave_balances',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('allocated_days', sa.Float(), nullable=False),
+        sa.Column('used_days', sa.Float(), nullable=False),
+        sa.Column('pending_days', sa.Float(), nullable=False),
+        sa.Column('next_expiry_date', sa.Date(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+    # 既存データは python -m src.scripts.reconcile_leave_balances で集計する
+
+
+def downgrade() -> None:
+    op.drop_table('paid_leave_balances')
@@ -0,0 +1,24 @@
+"""Add (start_date, id) index on leaves for keyset pagination
+
+Revision ID: c4f1a8b7d253
+Revises: b2e8f4a61c37
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f1a8b7d253'
+down_revision = 'b2e8f4a61c37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_leaves_start_date_id', 'leaves', ['start_date', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_leaves_start_date_id', table_name='leaves')
@@ -0,0 +1,32 @@
+"""Add computed daterange period with GiST index to leaves
+
+Revision ID: d9a2e6c3b814
+Revises: c4f1a8b7d253
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9a2e6c3b814'
+down_revision = 'c4f1a8b7d253'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('leaves', sa.Column(
+        'period',
+        postgresql.DATERANGE(),
+        sa.Computed("daterange(start_date, end_date, '[]')", persisted=True),
+        nullable=True
+    ))
+    op.create_index('ix_leaves_period', 'leaves', ['period'], postgresql_using='gist')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_leaves_period', table_name='leaves')
+    op.drop_column('leaves', 'period')
@@ -0,0 +1,34 @@
+"""Add weekly work days and statutory leave allocation source
+
+Revision ID: e5b7c2d94a61
+Revises: d9a2e6c3b814
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b7c2d94a61'
+down_revision = 'd9a2e6c3b814'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('weekly_work_days', sa.Integer(), nullable=True))
+    op.add_column('leave_allocations', sa.Column('source', sa.String(length=20), server_default='manual', nullable=False))
+    op.create_index(
+        'uq_leave_allocations_statutory',
+        'leave_allocations',
+        ['user_id', 'effective_date'],
+        unique=True,
+        postgresql_where=sa.text("source = 'statutory'")
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_leave_allocations_statutory', table_name='leave_allocations')
+    op.drop_column('leave_allocations', 'source')
+    op.drop_column('users', 'weekly_work_days')
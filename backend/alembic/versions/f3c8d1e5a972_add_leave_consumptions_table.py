@@ -0,0 +1,152 @@
+"""Add leave_consumptions table and per-allocation used days
+
+Revision ID: f3c8d1e5a972
+Revises: e5b7c2d94a61
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8d1e5a972'
+down_revision = 'e5b7c2d94a61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('leave_allocations', sa.Column('used_days', sa.Float(), server_default='0', nullable=False))
+    op.create_index('ix_leave_allocations_user_expiry', 'leave_allocations', ['user_id', 'expiry_date'], unique=False)
+    op.create_index(
+        'ix_leave_allocations_open_expiry',
+        'leave_allocations',
+        ['expiry_date'],
+        unique=False,
+        postgresql_where=sa.text('used_days < allocated_days')
+    )
+    op.create_table(
+        'leave_consumptions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('leave_id', sa.Integer(), nullable=False),
+        sa.Column('allocation_id', sa.Integer(), nullable=False),
+        sa.Column('days', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['leave_id'], ['leaves.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['allocation_id'], ['leave_allocations.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_leave_consumptions_id'), 'leave_consumptions', ['id'], unique=False)
+    op.create_index(op.f('ix_leave_consumptions_leave_id'), 'leave_consumptions', ['leave_id'], unique=False)
+    op.create_index(op.f('ix_leave_consumptions_allocation_id'), 'leave_consumptions', ['allocation_id'], unique=False)
+    backfill_leave_consumptions()
+
+
+# 既存の承認済み有給休暇を付与に割り当てる（routers/leave.py の rebuild_leave_consumptions と同じ順序）
+# 残高台帳は used_days の合計で再計算されるため、未設定のまま残すと消化済み日数が0に戻る。
+# アプリのモデルは後続のマイグレーションで列が増えるため、ここでは必要な列だけを定義して使う
+def backfill_leave_consumptions() -> None:
+    bind = op.get_bind()
+    allocations = sa.table(
+        'leave_allocations',
+        sa.column('id', sa.Integer),
+        sa.column('user_id', sa.Integer),
+        sa.column('allocated_days', sa.Float),
+        sa.column('effective_date', sa.Date),
+        sa.column('expiry_date', sa.Date),
+        sa.column('used_days', sa.Float)
+    )
+    leaves = sa.table(
+        'leaves',
+        sa.column('id', sa.Integer),
+        sa.column('user_id', sa.Integer),
+        sa.column('start_date', sa.Date),
+        sa.column('days_count', sa.Float),
+        sa.column('leave_type', sa.String),
+        sa.column('status', sa.String)
+    )
+    consumptions = sa.table(
+        'leave_consumptions',
+        sa.column('leave_id', sa.Integer),
+        sa.column('allocation_id', sa.Integer),
+        sa.column('days', sa.Float),
+        sa.column('created_at', sa.DateTime)
+    )
+
+    # 有効期限の早い付与から順に消化する（期限なしは最後）
+    allocations_by_user = {}
+    rows = bind.execute(
+        sa.select(
+            allocations.c.id,
+            allocations.c.user_id,
+            allocations.c.allocated_days,
+            allocations.c.effective_date,
+            allocations.c.expiry_date
+        ).order_by(
+            allocations.c.expiry_date.asc().nulls_last(),
+            allocations.c.effective_date.asc(),
+            allocations.c.id.asc()
+        )
+    )
+    for row in rows:
+        allocations_by_user.setdefault(row.user_id, []).append({
+            "id": row.id,
+            "allocated_days": row.allocated_days,
+            "effective_date": row.effective_date,
+            "expiry_date": row.expiry_date,
+            "used_days": 0
+        })
+
+    now = datetime.now()
+    values = []
+    rows = bind.execute(
+        sa.select(leaves.c.id, leaves.c.user_id, leaves.c.start_date, leaves.c.days_count)
+        .where(leaves.c.leave_type == 'paid', leaves.c.status == 'approved')
+        .order_by(leaves.c.start_date.asc(), leaves.c.id.asc())
+    )
+    for leave in rows:
+        remaining = leave.days_count
+        for allocation in allocations_by_user.get(leave.user_id, []):
+            if remaining <= 0:
+                break
+            if allocation["effective_date"] > leave.start_date:
+                continue
+            if allocation["expiry_date"] is not None and allocation["expiry_date"] < leave.start_date:
+                continue
+
+            days = min(remaining, allocation["allocated_days"] - allocation["used_days"])
+            if days <= 0:
+                continue
+            allocation["used_days"] += days
+            values.append({"leave_id": leave.id, "allocation_id": allocation["id"], "days": days, "created_at": now})
+            remaining -= days
+
+    if values:
+        bind.execute(consumptions.insert(), values)
+
+    used = [
+        {"allocation_id": allocation["id"], "used": allocation["used_days"]}
+        for user_allocations in allocations_by_user.values()
+        for allocation in user_allocations
+        if allocation["used_days"]
+    ]
+    if used:
+        bind.execute(
+            allocations.update()
+            .where(allocations.c.id == sa.bindparam('allocation_id'))
+            .values(used_days=sa.bindparam('used')),
+            used
+        )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_leave_consumptions_allocation_id'), table_name='leave_consumptions')
+    op.drop_index(op.f('ix_leave_consumptions_leave_id'), table_name='leave_consumptions')
+    op.drop_index(op.f('ix_leave_consumptions_id'), table_name='leave_consumptions')
+    op.drop_table('leave_consumptions')
+    op.drop_index('ix_leave_allocations_open_expiry', table_name='leave_allocations')
+    op.drop_index('ix_leave_allocations_user_expiry', table_name='leave_allocations')
+    op.drop_column('leave_allocations', 'used_days')
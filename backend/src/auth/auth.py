@@ -1,22 +1,47 @@
-from datetime import datetime, timedelta
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from ..database import get_db
-from ..models.models import User
+from ..database import get_db, get_async_db, AsyncSessionLocal
+from ..models.models import RefreshToken, User
+from ..cache import TTLCache
+from .revocation import revocation_filter
+import asyncio
+import hashlib
 import os
+import secrets
+import threading
+import time
+import uuid
 
 # JWTの設定
 SECRET_KEY = os.getenv("JWT_SECRET", "your_jwt_secret_key_here")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24時間
+# アクセストークンは短命にし、失効はリフレッシュトークンの更新時と失効リスト（revocation.py）で反映する
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+# 複数タブから同時に更新された場合など、使用済みのリフレッシュトークンを漏えいとみなさない猶予
+REFRESH_TOKEN_REUSE_GRACE_SECONDS = 10
+
+# 認証済みユーザー（Principal）のキャッシュ設定
+# 他のワーカーでの無効化・権限変更は検知できないため、反映までの遅れは最大 PRINCIPAL_CACHE_TTL_SECONDS 秒
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_MAX_SIZE = int(os.getenv("PRINCIPAL_CACHE_MAX_SIZE", "10000"))
 
 # パスワードハッシュ化の設定
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt の実行スレッド数と、実行待ちを含めて受け付ける上限
+# 上限を超えた要求は待たせずに 503 を返す（ログインが集中してもイベントループと他のAPIを止めない）
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", str(PASSWORD_HASH_WORKERS * 8)))
+
 # トークン取得のためのエンドポイントの設定
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token")
 
@@ -28,48 +53,226 @@ def get_password_hash(password):
     """パスワードのハッシュ化"""
     return pwd_context.hash(password)
 
+# bcrypt はGILを解放するため、スレッドでも複数コアで並列に実行できる
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_password_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_LIMIT)
+
+async def run_password_task(func: Callable[..., Any], *args: Any) -> Any:
+    """
+    パスワードのハッシュ化・検証を専用スレッドプールで実行する
+
+    実行中と実行待ちの合計が上限に達している場合は、キューに積まずに 503 を返す。
+    枠はスレッドでの処理が終わった時点で解放する（クライアントが切断しても実行中の処理は数えたまま）。
+    """
+    if not _password_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="アクセスが集中しています。しばらくしてから再度お試しください",
+            headers={"Retry-After": "1"},
+        )
+    
+    try:
+        future = _password_executor.submit(func, *args)
+    except BaseException:
+        _password_slots.release()
+        raise
+    future.add_done_callback(lambda _: _password_slots.release())
+    return await asyncio.wrap_future(future)
+
+async def verify_password_async(plain_password, hashed_password):
+    """パスワードの検証（イベントループを止めない）"""
+    return await run_password_task(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    """パスワードのハッシュ化（イベントループを止めない）"""
+    return await run_password_task(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    """JWTトークンの生成"""
+    """JWTトークンの生成（失効させられるよう jti と発行時刻を含める）"""
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    # 失効基準時刻との比較に使うため、発行時刻は秒未満も含める
+    to_encode.update({"exp": expire, "iat": time.time(), "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """現在のユーザーを取得"""
-    credentials_exception = HTTPException(
+class Principal:
+    """
+    認証済みユーザーの識別情報と権限
+
+    リクエストごとの認可に必要な列だけを保持する。パスワードハッシュや給与情報など、
+    その他の列が必要なエンドポイントは get_current_active_user_record で User を取得すること。
+    """
+
+    __slots__ = ("id", "username", "full_name", "role", "is_active", "employee_code", "department_id")
+
+    def __init__(
+        self,
+        id: int,
+        username: str,
+        full_name: str,
+        role: Optional[str],
+        is_active: Optional[bool],
+        employee_code: Optional[str],
+        department_id: Optional[int]
+    ):
+        self.id = id
+        self.username = username
+        self.full_name = full_name
+        self.role = role
+        self.is_active = is_active
+        self.employee_code = employee_code
+        self.department_id = department_id
+
+
+PRINCIPAL_COLUMNS = (
+    User.id,
+    User.username,
+    User.full_name,
+    User.role,
+    User.is_active,
+    User.employee_code,
+    User.department_id
+)
+
+# ユーザーID → Principal
+# ユーザー名・権限・有効状態・パスワードを変更する処理では必ず invalidate_principal() を呼ぶこと
+_principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_MAX_SIZE, ttl_seconds=PRINCIPAL_CACHE_TTL_SECONDS)
+
+
+def invalidate_principal(user_id: int) -> None:
+    """キャッシュ済みの Principal を破棄し、次のリクエストでDBから読み込み直す"""
+    _principal_cache.invalidate(user_id)
+
+
+def create_user_access_token(user: User, expires_delta: Optional[timedelta] = None):
+    """ユーザーID・権限をクレームに含めたアクセストークンを生成"""
+    return create_access_token(
+        data={"sub": user.username, "uid": user.id, "role": user.role},
+        expires_delta=expires_delta
+    )
+
+
+def hash_refresh_token(token: str) -> str:
+    """リフレッシュトークンの保存用ハッシュ（十分な長さの乱数のため、ソルトなしの SHA-256 で足りる）"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def issue_refresh_token(db: Session, user_id: int) -> str:
+    """リフレッシュトークンを発行する（コミットは呼び出し側で行う）"""
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        user_id=user_id,
+        token_hash=hash_refresh_token(token),
+        expires_at=datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    ))
+    return token
+
+def create_token_pair(db: Session, user: User) -> dict:
+    """アクセストークンとリフレッシュトークンを発行する（コミットは呼び出し側で行う）"""
+    return {
+        "access_token": create_user_access_token(user),
+        "refresh_token": issue_refresh_token(db, user.id),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+def access_token_lifetime() -> timedelta:
+    return timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="認証情報が無効です",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_access_token(token: str) -> dict:
+    """アクセストークンを検証してクレームを返す（無効な場合は 401）"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
+        raise credentials_exception()
+    if payload.get("sub") is None:
+        raise credentials_exception()
+    return payload
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
+    """
+    現在のユーザーを取得
+
+    トークンの uid クレームでキャッシュを引き、キャッシュにあればDBへ問い合わせずに認可する。
+    権限は失効を反映するためトークンの role クレームではなくキャッシュ（DB）の値を使う。
+    失効の確認はメモリ上の失効リストで行い、DBからの取り込みは数秒に1回だけ行う。
+    uid を含まない旧形式のトークンはユーザー名で検索する。
+    DBへの問い合わせが必要な場合だけ非同期セッションを開き、問い合わせ後すぐに接続を返す
+    （リクエストの処理中は接続を保持しない。同期のエンドポイントでも同期プールを使わない）。
+    """
+    payload = decode_access_token(token)
+    username: str = payload["sub"]
+    user_id: Optional[int] = payload.get("uid")
     
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
-        raise credentials_exception
-    return user
+    principal = _principal_cache.get(user_id) if user_id is not None else None
+    
+    if principal is None or revocation_filter.is_refresh_due():
+        async with AsyncSessionLocal() as db:
+            if principal is None:
+                version = _principal_cache.version
+                query = select(*PRINCIPAL_COLUMNS)
+                if user_id is not None:
+                    query = query.where(User.id == user_id)
+                else:
+                    query = query.where(User.username == username)
+                row = (await db.execute(query)).first()
+                if row is None:
+                    raise credentials_exception()
+                
+                principal = Principal(*row)
+                _principal_cache.set(principal.id, principal, version)
+            
+            await revocation_filter.refresh_if_due(db)
+    
+    # ユーザー名が変更された後の古いトークンは無効
+    if principal.username != username:
+        raise credentials_exception()
+    
+    if revocation_filter.is_revoked(principal.id, payload.get("jti"), payload.get("iat")):
+        raise credentials_exception()
+    return principal
 
-def get_current_active_user(current_user: User = Depends(get_current_user)):
+def get_current_active_user(current_user: Principal = Depends(get_current_user)) -> Principal:
     """現在のアクティブユーザーを取得"""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="アカウントが無効です")
     return current_user
 
-def get_current_admin_user(current_user: User = Depends(get_current_user)):
+def get_current_admin_user(current_user: Principal = Depends(get_current_user)) -> Principal:
     """現在の管理者ユーザーを取得"""
     if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="この操作を行う権限がありません",
         )
-    return current_user 
\ No newline at end of file
+    return current_user
+
+def get_current_active_user_record(
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+) -> User:
+    """現在のアクティブユーザーの User レコードを取得（Principal にない列を使う場合）"""
+    user = db.get(User, current_user.id)
+    if user is None:
+        raise credentials_exception()
+    return user
+
+async def get_current_active_user_record_async(
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """現在のアクティブユーザーの User レコードを取得（async def のエンドポイント用）"""
+    user = await db.get(User, current_user.id)
+    if user is None:
+        raise credentials_exception()
+    return user
@@ -0,0 +1,148 @@
+"""
+アクセストークンの失効リスト
+
+失効記録（token_revocations）を各ワーカーのメモリに保持し、リクエストごとの失効確認はメモリ上で行う。
+DBからは REVOCATION_REFRESH_SECONDS ごとに前回以降の追加分だけを取り込むため、他のワーカーでの失効も
+数秒で反映される。同時に実行中のトランザクションが遅れてコミットした行を取りこぼさないよう、
+REVOCATION_FULL_RELOAD_SECONDS ごとに有効な記録をすべて読み込み直す。
+
+失効記録はアクセストークンの有効期限（最大 ACCESS_TOKEN_EXPIRE_MINUTES 分）を過ぎると不要になるため、
+件数は直近の失効数程度に収まる。誤判定のあるブルームフィルタではなく集合で保持する。
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..models.models import RefreshToken, TokenRevocation
+
+REVOCATION_REFRESH_SECONDS = float(os.getenv("REVOCATION_REFRESH_SECONDS", "2"))
+REVOCATION_FULL_RELOAD_SECONDS = float(os.getenv("REVOCATION_FULL_RELOAD_SECONDS", "60"))
+
+
+def to_timestamp(value: Optional[datetime]) -> Optional[float]:
+    """DBの日時をエポック秒に変換（タイムゾーンのない値はUTCとして扱う）"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class RevocationFilter:
+    """失効した jti と、ユーザーごとの失効基準時刻（これより前に発行されたトークンは無効）"""
+
+    def __init__(self, refresh_seconds: float, full_reload_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self.full_reload_seconds = full_reload_seconds
+        self._lock = threading.Lock()
+        self._jtis: Dict[str, float] = {}                # jti → 記録の有効期限
+        self._not_before: Dict[int, tuple] = {}          # user_id → (失効基準時刻, 記録の有効期限)
+        self._last_id = 0
+        self._refreshed_at = float("-inf")
+        self._reloaded_at = float("-inf")
+
+    def add(self, revocation: TokenRevocation) -> None:
+        """失効記録を取り込む（同じワーカーで失効させた場合はコミット直後に呼び、即時に反映する）"""
+        expires_at = to_timestamp(revocation.expires_at)
+        with self._lock:
+            self._add(revocation.user_id, revocation.jti, to_timestamp(revocation.not_before), expires_at)
+
+    def _add(self, user_id: int, jti: Optional[str], not_before: Optional[float], expires_at: float) -> None:
+        if jti:
+            self._jtis[jti] = max(expires_at, self._jtis.get(jti, 0))
+        if not_before is not None:
+            current = self._not_before.get(user_id)
+            if current is None or current[0] < not_before:
+                self._not_before[user_id] = (not_before, expires_at)
+
+    def is_revoked(self, user_id: int, jti: Optional[str], issued_at: Optional[float]) -> bool:
+        if jti and jti in self._jtis:
+            return True
+
+        entry = self._not_before.get(user_id)
+        if entry is None:
+            return False
+        # 発行時刻のない旧形式のトークンは、失効基準時刻が設定されていれば無効とする
+        return issued_at is None or issued_at < entry[0]
+
+    def is_refresh_due(self) -> bool:
+        """前回の取り込みから refresh_seconds 以上経過しているか（DBセッションを開くかの判定用）"""
+        return time.monotonic() - self._refreshed_at >= self.refresh_seconds
+
+    async def refresh_if_due(self, db: AsyncSession) -> None:
+        """前回の取り込みから refresh_seconds 以上経過していれば、DBの失効記録を取り込む"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._refreshed_at < self.refresh_seconds:
+                return
+            # 同時に届いたリクエストが重複して問い合わせないよう、先に時刻を更新する
+            self._refreshed_at = now
+            full_reload = now - self._reloaded_at >= self.full_reload_seconds
+            last_id = self._last_id
+
+        query = select(
+            TokenRevocation.id,
+            TokenRevocation.user_id,
+            TokenRevocation.jti,
+            TokenRevocation.not_before,
+            TokenRevocation.expires_at
+        )
+        if full_reload:
+            query = query.where(TokenRevocation.expires_at > datetime.now(timezone.utc))
+        else:
+            query = query.where(TokenRevocation.id > last_id).order_by(TokenRevocation.id)
+        rows = (await db.execute(query)).all()
+
+        with self._lock:
+            if full_reload:
+                self._jtis = {}
+                self._not_before = {}
+                self._reloaded_at = now
+            for revocation_id, user_id, jti, not_before, expires_at in rows:
+                self._add(user_id, jti, to_timestamp(not_before), to_timestamp(expires_at))
+                self._last_id = max(self._last_id, revocation_id)
+
+            if not full_reload:
+                self._purge_expired()
+
+    def _purge_expired(self) -> None:
+        current = time.time()
+        self._jtis = {jti: expires_at for jti, expires_at in self._jtis.items() if expires_at > current}
+        self._not_before = {
+            user_id: entry for user_id, entry in self._not_before.items() if entry[1] > current
+        }
+
+
+revocation_filter = RevocationFilter(REVOCATION_REFRESH_SECONDS, REVOCATION_FULL_RELOAD_SECONDS)
+
+
+def revoke_access_token(db: Session, user_id: int, jti: str, expires_at: datetime) -> TokenRevocation:
+    """アクセストークンを1つ失効させる（コミット後に revocation_filter.add() を呼ぶこと）"""
+    revocation = TokenRevocation(user_id=user_id, jti=jti, expires_at=expires_at)
+    db.add(revocation)
+    return revocation
+
+
+def revoke_user_tokens(db: Session, user_id: int, access_token_lifetime: timedelta) -> TokenRevocation:
+    """
+    ユーザーの発行済みトークンをすべて失効させる（無効化・パスワード変更時）
+
+    リフレッシュトークンを失効させ、現在時刻より前に発行されたアクセストークンを無効にする。
+    コミット後に revocation_filter.add() を呼ぶこと。
+    """
+    now = datetime.now(timezone.utc)
+
+    db.query(RefreshToken).filter(
+        RefreshToken.user_id == user_id,
+        RefreshToken.revoked_at == None
+    ).update({RefreshToken.revoked_at: now}, synchronize_session=False)
+
+    revocation = TokenRevocation(user_id=user_id, not_before=now, expires_at=now + access_token_lifetime)
+    db.add(revocation)
+    return revocation
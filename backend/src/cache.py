@@ -0,0 +1,130 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+
+class VersionedCache:
+    """
+    プロセス内のバージョン付きキャッシュ
+
+    書き込み時に invalidate() を呼ぶとバージョンが進み、次回の get() で再読み込みされる。
+    他のプロセス（ワーカー）での更新は検知できないため、ttl_seconds で古さの上限を設ける。
+    """
+
+    def __init__(self, ttl_seconds: float = 300):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._version = 0
+        self._value: Any = None
+        self._loaded_at = 0.0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def peek(self) -> Optional[Any]:
+        """読み込み済みで有効期限内の値を返す（なければNone）"""
+        with self._lock:
+            if self._value is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+                return self._value
+            return None
+
+    def get(self, loader: Callable[[], Any]) -> Any:
+        """キャッシュ済みの値を返す。無効な場合は loader() の結果を保存して返す"""
+        value = self.peek()
+        if value is not None:
+            return value
+
+        version = self._version
+        value = loader()
+
+        with self._lock:
+            # 読み込み中に invalidate() された場合は保存しない
+            if self._version == version:
+                self._value = value
+                self._loaded_at = time.monotonic()
+
+        return value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._value = None
+
+
+class TTLCache:
+    """
+    キー単位の有効期限付きLRUキャッシュ
+
+    maxsize を超えると最も長く参照されていないキーから破棄する。
+    VersionedCache と同様に、読み込み開始時の version を set() に渡すと、読み込み中に invalidate() された値は保存しない。
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: float = 60):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._version = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """有効期限内の値を返す（なければNone）"""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, version: Optional[int] = None) -> None:
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._version += 1
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+
+def make_etag(body: bytes) -> str:
+    """レスポンス本文から強いETagを生成"""
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match ヘッダーが ETag に一致するか判定"""
+    if not if_none_match:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    # 弱いETag（W/"..."）も比較対象とする
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag == etag or tag == "W/" + etag for tag in candidates)
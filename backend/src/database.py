@@ -1,27 +1,73 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+import asyncio
 import os
 
 # 環境変数からデータベースURLを取得
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5433/timeflowconnect")
 
+def to_async_url(url: str) -> str:
+    """同期ドライバ（psycopg2）のURLを asyncpg 用に変換"""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+
+# 接続プール
+# 非同期セッション（AsyncSession）を使うのは認証（ログイン・トークン検証の依存関係）と勤怠打刻・勤怠一覧のみで、
+# その他のルーターは同期セッションを使う def のエンドポイント（スレッドプールで実行）のため、各ワーカーは両方のプールを持つ。
+# 1ワーカーあたりの最大接続数は (SYNC_DB_POOL_SIZE + SYNC_DB_MAX_OVERFLOW) + (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+# （既定値で 15 + 20 = 35）。ワーカー数 × この値が Postgres の max_connections（既定100）を超えないように設定すること
+SYNC_DB_POOL_SIZE = int(os.getenv("SYNC_DB_POOL_SIZE", "5"))
+SYNC_DB_MAX_OVERFLOW = int(os.getenv("SYNC_DB_MAX_OVERFLOW", "10"))
+# 非同期エンジン（1ワーカーで同時に処理できるDB問い合わせ数の上限）
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
 # SQLAlchemyエンジンを作成
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, pool_size=SYNC_DB_POOL_SIZE, max_overflow=SYNC_DB_MAX_OVERFLOW)
 
 # セッションローカルを作成
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 非同期エンジン（async def のエンドポイントはこちらを使い、イベントループを止めずにDBを待つ）
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW
+)
+
+# コミット後に属性を再読み込みしない（非同期セッションでは暗黙のDBアクセスができないため）
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 # モデル定義用のベースクラス
 Base = declarative_base()
 
-# DBセッションの依存関係
-def get_db():
-    db = SessionLocal()
-    try:
+# 同期セッションを同時に渡すリクエスト数の上限（同期プールの最大接続数と同じ）
+# def のエンドポイントはスレッドプールの枠を持ったまま接続を待つため、接続数を超えるリクエストにセッションを渡すと、
+# 接続を持つリクエストがレスポンスの生成に使う枠を得られず、プールの待ち時間切れまで全体が止まる。
+# 枠を取る前に（イベントループ上で）接続数分だけに絞り込み、プールで待つことがないようにする
+_sync_db_slots = asyncio.Semaphore(SYNC_DB_POOL_SIZE + SYNC_DB_MAX_OVERFLOW)
+
+# DBセッションの依存関係（同期。def のエンドポイントはスレッドプールで実行される）
+async def get_db():
+    async with _sync_db_slots:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            # 接続をプールへ返す際の ROLLBACK でイベントループを止めないよう、スレッドで閉じる
+            await run_in_threadpool(db.close)
+
+# 非同期DBセッションの依存関係（async def のエンドポイント用）
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 # データベース初期化関数
 def init_db():
@@ -29,6 +75,11 @@ def init_db():
     from .models.models import Base, User, PayrollSetting
     from .auth.auth import get_password_hash
     
+    # シフト重複の排他制約と日報のキーワード検索に必要な拡張を有効化
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    
     # テーブルの作成
     Base.metadata.create_all(bind=engine)
     
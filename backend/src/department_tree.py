@@ -0,0 +1,89 @@
+"""
+部署階層（閉包テーブル department_closure）の保守と検索
+
+閉包テーブルには祖先・子孫のすべての組み合わせを保持するため、
+部署の追加・移動時にここの関数で更新し、配下の検索は ancestor_id の索引で1回の結合で行う。
+"""
+from typing import Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, delete, insert, literal, select
+from sqlalchemy.orm import Session
+
+from .models.models import Department, DepartmentClosure
+
+
+def subtree_department_ids(department_id: int):
+    """指定部署と配下のすべての部署IDを返す副問い合わせ"""
+    return select(DepartmentClosure.descendant_id).where(DepartmentClosure.ancestor_id == department_id)
+
+
+def in_department_subtree(column, department_id: int):
+    """部署ID列が指定部署の配下（自身を含む）に含まれる条件"""
+    return column.in_(subtree_department_ids(department_id))
+
+
+def add_department_node(db: Session, department: Department) -> None:
+    """新しい部署を閉包テーブルに追加（自分自身と、上位部署の祖先すべて）"""
+    db.execute(insert(DepartmentClosure).values(
+        ancestor_id=department.id,
+        descendant_id=department.id,
+        depth=0
+    ))
+
+    if department.parent_id is not None:
+        db.execute(insert(DepartmentClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(
+                DepartmentClosure.ancestor_id,
+                literal(department.id),
+                DepartmentClosure.depth + 1
+            ).where(DepartmentClosure.descendant_id == department.parent_id)
+        ))
+
+
+def move_department_node(db: Session, department: Department, new_parent_id: Optional[int]) -> None:
+    """部署を配下ごと新しい上位部署の下へ移動（new_parent_id=None で最上位）"""
+    if new_parent_id is not None:
+        # 自分自身や配下の部署を上位部署にはできない
+        cycle = db.query(DepartmentClosure).filter(
+            DepartmentClosure.ancestor_id == department.id,
+            DepartmentClosure.descendant_id == new_parent_id
+        ).first()
+        if cycle:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="自分自身または配下の部署/現場を上位に指定することはできません"
+            )
+
+    subtree = select(DepartmentClosure.descendant_id).where(DepartmentClosure.ancestor_id == department.id)
+
+    # 配下の部署と、移動前の上位部署との関係を削除
+    db.execute(
+        delete(DepartmentClosure)
+        .where(
+            DepartmentClosure.descendant_id.in_(subtree),
+            DepartmentClosure.ancestor_id.not_in(subtree)
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    # 新しい上位部署の祖先すべて × 配下の部署すべての関係を追加
+    if new_parent_id is not None:
+        ancestors = DepartmentClosure.__table__.alias("ancestors")
+        descendants = DepartmentClosure.__table__.alias("descendants")
+        db.execute(insert(DepartmentClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(
+                ancestors.c.ancestor_id,
+                descendants.c.descendant_id,
+                ancestors.c.depth + descendants.c.depth + 1
+            )
+            .select_from(ancestors.join(descendants, literal(True)))
+            .where(and_(
+                ancestors.c.descendant_id == new_parent_id,
+                descendants.c.ancestor_id == department.id
+            ))
+        ))
+
+    department.parent_id = new_parent_id
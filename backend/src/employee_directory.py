@@ -0,0 +1,93 @@
+"""
+一覧APIで使う従業員ディレクトリ（ユーザーID → 氏名・社員コード・部署名）
+
+勤怠・シフト・給与明細・日報の管理者向け一覧は、氏名などを表示するためだけに users / departments を
+結合していた。従業員数は数百〜数千件程度で更新頻度も低いため、プロセス内にまとめて保持して結合を省く。
+"""
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from .cache import VersionedCache
+from .models.models import Department, User
+
+
+class DirectoryEntry:
+    """一覧表示用の従業員情報（__slots__ でインスタンス辞書を持たず、1人あたりのメモリを抑える）"""
+
+    __slots__ = ("full_name", "employee_code", "department_id", "department_name")
+
+    def __init__(
+        self,
+        full_name: str,
+        employee_code: Optional[str],
+        department_id: Optional[int],
+        department_name: Optional[str]
+    ):
+        self.full_name = full_name
+        self.employee_code = employee_code
+        self.department_id = department_id
+        self.department_name = department_name
+
+
+class EmployeeDirectory:
+    """ユーザーID → 氏名・社員コード・部署名のスナップショット"""
+
+    def __init__(self, entries: Dict[int, DirectoryEntry]):
+        self._entries = entries
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: int) -> Optional[DirectoryEntry]:
+        return self._entries.get(user_id)
+
+    def full_name(self, user_id: int) -> str:
+        entry = self._entries.get(user_id)
+        return entry.full_name if entry else ""
+
+
+def load_employee_directory(db: Session) -> EmployeeDirectory:
+    """全従業員の表示用情報を1クエリで読み込む"""
+    rows = (
+        db.query(User.id, User.full_name, User.employee_code, User.department_id, Department.name)
+        .outerjoin(Department, User.department_id == Department.id)
+        .all()
+    )
+
+    # 部署名は同じ文字列オブジェクトを共有する
+    department_names: Dict[int, str] = {}
+    entries = {}
+    for user_id, full_name, employee_code, department_id, department_name in rows:
+        if department_id is not None and department_name is not None:
+            department_name = department_names.setdefault(department_id, department_name)
+        entries[user_id] = DirectoryEntry(full_name, employee_code, department_id, department_name)
+
+    return EmployeeDirectory(entries)
+
+
+# 従業員ディレクトリのキャッシュ
+# User（氏名・社員コード・所属）や Department（名前）を更新する処理では必ず invalidate_employee_directory() を呼ぶこと
+_directory_cache = VersionedCache(ttl_seconds=300)
+
+
+def get_employee_directory(db: Session, user_ids: Iterable[int] = ()) -> EmployeeDirectory:
+    """
+    従業員ディレクトリを取得する。
+
+    user_ids に未登録のIDが含まれる場合（他のワーカーで追加された従業員など）は1度だけ読み込み直す。
+    """
+    directory = _directory_cache.get(lambda: load_employee_directory(db))
+
+    if any(user_id not in directory for user_id in user_ids):
+        _directory_cache.invalidate()
+        directory = _directory_cache.get(lambda: load_employee_directory(db))
+
+    return directory
+
+
+def invalidate_employee_directory() -> None:
+    _directory_cache.invalidate()
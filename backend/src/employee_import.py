@@ -0,0 +1,188 @@
+"""
+従業員の一括登録（CSV / JSON）
+
+1. 各行を EmployeeCreate で検証する
+2. 一意性の確認に必要な列だけを一時テーブルへ COPY し、ファイル内の重複と既存ユーザーとの重複を集合演算で判定する
+   （判定が終わったらトランザクションを終える）
+3. 初期パスワードをログインと同じパスワード用スレッドプール（同時実行数の上限つき）でハッシュ化する
+   （トランザクション・接続を持たずに行う）
+4. 問題のない行を新しい1トランザクションでまとめて登録する（2 の後に他の登録処理で同じ値が使われた行は、ON CONFLICT DO NOTHING で飛ばして重複として返す）
+"""
+import asyncio
+import csv
+import io
+import json
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .auth.auth import PASSWORD_HASH_WORKERS, get_password_hash_async
+from .models.models import User
+from .schemas.employee import EmployeeCreate
+
+# 1回の取り込みで受け付ける最大行数
+MAX_IMPORT_ROWS = 10000
+
+# 一意性を確認する列と、重複時のメッセージ
+UNIQUE_COLUMNS = {
+    "username": "このユーザー名は既に使用されています",
+    "email": "このメールアドレスは既に使用されています",
+    "employee_code": "この社員コードは既に使用されています",
+}
+
+def parse_import_file(content: bytes, filename: str) -> List[dict]:
+    """CSV（1行目がヘッダー）または JSON 配列を行の辞書のリストに変換する"""
+    text_content = content.decode("utf-8-sig")
+
+    if filename.lower().endswith(".json"):
+        rows = json.loads(text_content)
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError("JSONはオブジェクトの配列である必要があります")
+        return rows
+
+    reader = csv.DictReader(io.StringIO(text_content))
+    # 空欄は未指定として扱う
+    return [
+        {key: value for key, value in row.items() if key and value not in (None, "")}
+        for row in reader
+    ]
+
+
+def validate_rows(rows: List[dict]) -> Tuple[Dict[int, EmployeeCreate], List[dict]]:
+    """各行を EmployeeCreate で検証する。行番号は1始まり（CSVのヘッダー行を除く）"""
+    valid = {}
+    errors = []
+
+    for row_no, row in enumerate(rows, start=1):
+        try:
+            valid[row_no] = EmployeeCreate(**row)
+        except ValidationError as e:
+            for error in e.errors():
+                errors.append({
+                    "row": row_no,
+                    "field": ".".join(str(loc) for loc in error["loc"]),
+                    "message": error["msg"]
+                })
+
+    return valid, errors
+
+
+def find_conflicts(db: Session, employees: Dict[int, EmployeeCreate]) -> List[dict]:
+    """一時テーブルに COPY した一意列を、ファイル内の重複・既存ユーザー・部署の存在について一括で検証する"""
+    if not employees:
+        return []
+
+    db.execute(text(
+        "CREATE TEMP TABLE employee_import_staging ("
+        " row_no integer PRIMARY KEY,"
+        " username text NOT NULL,"
+        " email text NOT NULL,"
+        " employee_code text,"
+        " department_id integer"
+        ") ON COMMIT DROP"
+    ))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row_no, employee in employees.items():
+        writer.writerow([
+            row_no,
+            employee.username,
+            employee.email,
+            employee.employee_code if employee.employee_code is not None else "\\N",
+            employee.department_id if employee.department_id is not None else "\\N",
+        ])
+    buffer.seek(0)
+
+    # セッションと同じ接続・トランザクションで COPY する
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            "COPY employee_import_staging (row_no, username, email, employee_code, department_id) "
+            "FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+    conflicts = []
+    for column, message in UNIQUE_COLUMNS.items():
+        # ファイル内で同じ値が複数行にある場合は、2行目以降をエラーにする
+        duplicated = db.execute(text(
+            f"SELECT row_no FROM ("
+            f" SELECT row_no, row_number() OVER (PARTITION BY {column} ORDER BY row_no) AS n"
+            f" FROM employee_import_staging WHERE {column} IS NOT NULL"
+            f") s WHERE n > 1"
+        ))
+        for (row_no,) in duplicated:
+            conflicts.append({"row": row_no, "field": column, "message": "ファイル内で重複しています"})
+
+        existing = db.execute(text(
+            f"SELECT s.row_no FROM employee_import_staging s"
+            f" JOIN users u ON u.{column} = s.{column}"
+        ))
+        for (row_no,) in existing:
+            conflicts.append({"row": row_no, "field": column, "message": message})
+
+    missing_departments = db.execute(text(
+        "SELECT s.row_no FROM employee_import_staging s"
+        " WHERE s.department_id IS NOT NULL"
+        " AND NOT EXISTS (SELECT 1 FROM departments d WHERE d.id = s.department_id)"
+    ))
+    for (row_no,) in missing_departments:
+        conflicts.append({"row": row_no, "field": "department_id", "message": "指定された部署が見つかりません"})
+
+    return conflicts
+
+
+async def hash_passwords(passwords: List[str]) -> List[str]:
+    """
+    パスワードをログインと同じパスワード用スレッドプールでハッシュ化する
+
+    一度に投入するのはスレッド数分だけにし、実行待ちの枠をログインのために残す。
+    ログインの集中で枠が空いていない場合は 503 となり、何も登録しない。
+    """
+    hashed_passwords = []
+    for start in range(0, len(passwords), PASSWORD_HASH_WORKERS):
+        chunk = passwords[start:start + PASSWORD_HASH_WORKERS]
+        hashed_passwords.extend(await asyncio.gather(*(get_password_hash_async(password) for password in chunk)))
+    return hashed_passwords
+
+
+def insert_employees(db: Session, employees: List[EmployeeCreate], hashed_passwords: List[str]) -> List[Optional[int]]:
+    """
+    従業員をまとめて登録し、作成されたIDを入力順で返す
+
+    find_conflicts の後に他の登録処理で同じユーザー名・メールアドレス・社員コードが使われた行は
+    登録せずに None を返す（一意制約違反でトランザクション全体を失敗させない）。
+    """
+    values = []
+    for employee, hashed_password in zip(employees, hashed_passwords):
+        data = {
+            key: value.value if isinstance(value, Enum) else value
+            for key, value in employee.dict(exclude={"password"}).items()
+        }
+        data["hashed_password"] = hashed_password
+        data["force_password_change"] = True  # 新規登録時は初回パスワード変更を必須にする
+        values.append(data)
+
+    result = db.execute(
+        pg_insert(User).on_conflict_do_nothing().returning(User.id, User.username),
+        values
+    )
+    # 飛ばされた行は返らないため、一意なユーザー名で入力と対応付ける
+    user_ids = {row.username: row.id for row in result}
+    return [user_ids.get(employee.username) for employee in employees]
+
+
+def find_conflicting_column(db: Session, employee: EmployeeCreate) -> str:
+    """登録時に重複していた一意列を返す（insert_employees で飛ばされた行のエラー表示用）"""
+    for column in UNIQUE_COLUMNS:
+        value = getattr(employee, column)
+        if value is not None and db.query(User.id).filter(getattr(User, column) == value).first():
+            return column
+    return "username"
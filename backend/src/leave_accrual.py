@@ -0,0 +1,196 @@
+"""
+年次有給休暇の法定付与（労働基準法第39条）を計算・登録するモジュール
+
+入社日から6か月、以降1年ごとの基準日に、勤続年数と週所定労働日数に応じた日数を付与する。
+出勤率（8割以上）の要件は勤怠データから判定していないため、全員が要件を満たすものとして扱う。
+
+自動付与を始める前の付与は手入力（source='manual'）で登録されているため、付与日が
+LEAVE_ACCRUAL_START_DATE（未設定の場合は基準日当日）より前の法定付与は登録しない。
+バッチが止まっていた期間の付与を補う場合は、自動付与を開始した日をこの環境変数に設定する。
+"""
+import calendar
+import os
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .models.models import LeaveAllocation, User
+
+# 週所定労働日数ごとの付与日数（勤続0.5年, 1.5年, 2.5年, 3.5年, 4.5年, 5.5年, 6.5年以上）
+STATUTORY_GRANT_TABLE: Dict[int, List[int]] = {
+    5: [10, 11, 12, 14, 16, 18, 20],
+    4: [7, 8, 9, 10, 12, 13, 15],
+    3: [5, 6, 6, 8, 9, 10, 11],
+    2: [3, 4, 4, 5, 6, 6, 7],
+    1: [1, 2, 2, 2, 3, 3, 3],
+}
+
+# 付与日から時効（2年）で消滅するまでの月数
+GRANT_VALID_MONTHS = 24
+
+# 週所定労働日数が未設定の場合に週5日として扱う雇用形態
+DEFAULT_FULL_TIME_TYPES = ("full_time", "contract", "intern")
+
+# 一括登録のチャンクサイズ（バインドパラメータ数の上限対策）
+INSERT_CHUNK_SIZE = 1000
+
+STATUTORY_SOURCE = "statutory"
+
+# 自動付与の対象とする最初の付与日（YYYY-MM-DD）
+LEAVE_ACCRUAL_START_DATE = os.getenv("LEAVE_ACCRUAL_START_DATE")
+
+
+@dataclass
+class AccrualResult:
+    as_of: date
+    granted_count: int = 0
+    granted_days: float = 0
+    skipped_user_ids: List[int] = field(default_factory=list)
+    affected_user_ids: List[int] = field(default_factory=list)
+
+
+def add_months(base: date, months: int) -> date:
+    """月数を加算する（存在しない日は月末に丸める）"""
+    month_index = base.month - 1 + months
+    year = base.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(base.day, calendar.monthrange(year, month)[1])
+    return date(year, month, day)
+
+
+def statutory_grant_days(weekly_work_days: int, grant_index: int) -> int:
+    """週所定労働日数と付与回数（0始まり）から法定付与日数を返す"""
+    table = STATUTORY_GRANT_TABLE[min(max(weekly_work_days, 1), 5)]
+    return table[min(grant_index, len(table) - 1)]
+
+
+def resolve_weekly_work_days(employment_type: Optional[str], weekly_work_days: Optional[int]) -> Optional[int]:
+    """付与区分の判定に使う週所定労働日数を返す（判定できない場合は None）"""
+    if weekly_work_days:
+        return weekly_work_days
+    if employment_type is None or employment_type in DEFAULT_FULL_TIME_TYPES:
+        return 5
+    return None
+
+
+def due_statutory_grants(hire_date: date, weekly_work_days: int, as_of: date) -> List[dict]:
+    """基準日 as_of 時点で有効な（時効前の）法定付与を列挙する"""
+    grants = []
+    grant_index = 0
+
+    while True:
+        effective_date = add_months(hire_date, 6 + 12 * grant_index)
+        if effective_date > as_of:
+            break
+
+        expiry_date = add_months(effective_date, GRANT_VALID_MONTHS)
+        if expiry_date > as_of:
+            grants.append({
+                "effective_date": effective_date,
+                "expiry_date": expiry_date,
+                "allocated_days": statutory_grant_days(weekly_work_days, grant_index),
+                "tenure_years": (6 + 12 * grant_index) / 12,
+            })
+        grant_index += 1
+
+    return grants
+
+
+def run_statutory_accrual(
+    db: Session,
+    as_of: Optional[date] = None,
+    user_ids: Optional[List[int]] = None,
+    dry_run: bool = False,
+    start_date: Optional[date] = None
+) -> AccrualResult:
+    """
+    在籍中の全従業員について法定付与を計算し、未登録のものを一括登録する
+
+    付与日が start_date から as_of までの付与のみを対象とする。同じユーザー・同じ付与日の付与が
+    登録元（手入力・法定付与）にかかわらず既にあれば付与済みとして扱い、法定付与どうしは
+    (user_id, effective_date) の部分ユニークインデックスでも重複を防ぐ。コミットは呼び出し側で行う。
+    """
+    # 循環インポートを避けるため関数内でインポート
+    from .routers.leave import rebuild_paid_leave_balances
+
+    as_of = as_of or date.today()
+    if start_date is None:
+        start_date = date.fromisoformat(LEAVE_ACCRUAL_START_DATE) if LEAVE_ACCRUAL_START_DATE else as_of
+    result = AccrualResult(as_of=as_of)
+
+    # 必要な列だけを1クエリで取得
+    query = db.query(
+        User.id,
+        User.hire_date,
+        User.employment_type,
+        User.weekly_work_days
+    ).filter(
+        User.is_active == True,
+        User.hire_date != None,
+        User.hire_date <= as_of
+    )
+    if user_ids is not None:
+        query = query.filter(User.id.in_(user_ids))
+
+    rows = []
+    for user_id, hire_date, employment_type, weekly_work_days in query:
+        work_days = resolve_weekly_work_days(employment_type, weekly_work_days)
+        if work_days is None:
+            result.skipped_user_ids.append(user_id)
+            continue
+
+        for grant in due_statutory_grants(hire_date, work_days, as_of):
+            if grant["effective_date"] < start_date:
+                continue
+            rows.append({
+                "user_id": user_id,
+                "allocated_days": grant["allocated_days"],
+                "effective_date": grant["effective_date"],
+                "expiry_date": grant["expiry_date"],
+                "reason": f"法定付与（勤続{grant['tenure_years']:g}年）",
+                "source": STATUTORY_SOURCE,
+            })
+
+    # 手入力を含め、同じ付与日の付与が既にあるものは除く
+    existing_query = db.query(LeaveAllocation.user_id, LeaveAllocation.effective_date).filter(
+        LeaveAllocation.effective_date >= start_date,
+        LeaveAllocation.effective_date <= as_of
+    )
+    if user_ids is not None:
+        existing_query = existing_query.filter(LeaveAllocation.user_id.in_(user_ids))
+    existing = set(existing_query.all())
+    pending = [row for row in rows if (row["user_id"], row["effective_date"]) not in existing]
+
+    if dry_run:
+        result.granted_count = len(pending)
+        result.granted_days = sum(row["allocated_days"] for row in pending)
+        result.affected_user_ids = sorted({row["user_id"] for row in pending})
+        return result
+
+    affected = set()
+    for offset in range(0, len(pending), INSERT_CHUNK_SIZE):
+        chunk = pending[offset:offset + INSERT_CHUNK_SIZE]
+        stmt = (
+            pg_insert(LeaveAllocation)
+            .values(chunk)
+            .on_conflict_do_nothing(
+                index_elements=[LeaveAllocation.user_id, LeaveAllocation.effective_date],
+                index_where=(LeaveAllocation.source == STATUTORY_SOURCE)
+            )
+            .returning(LeaveAllocation.user_id, LeaveAllocation.allocated_days)
+        )
+        for user_id, allocated_days in db.execute(stmt):
+            affected.add(user_id)
+            result.granted_count += 1
+            result.granted_days += allocated_days
+
+    result.affected_user_ids = sorted(affected)
+
+    # 付与があったユーザーの残高台帳を同じトランザクションで再集計
+    if affected:
+        rebuild_paid_leave_balances(db, result.affected_user_ids)
+
+    return result
@@ -5,9 +5,9 @@ from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from .database import init_db
-from .routers import auth, attendance, shift, employee, payslip, insurance_rate
+from .routers import auth, attendance, shift, employee, payslip, insurance_rate, leave, report, department
 # 一時的にコメントアウト - 問題解決後に戻す
-# from .routers import users, payroll, department, leave, report
+# from .routers import users, payroll
 
 # テスト用の一時的なデータストア
 attendance_records = []
@@ -47,12 +47,12 @@ app.include_router(shift.router)
 app.include_router(employee.router)
 app.include_router(payslip.router)
 app.include_router(insurance_rate.router)
+app.include_router(leave.router)
+app.include_router(report.router)
+app.include_router(department.router)
 # 一時的にコメントアウト - 問題解決後に戻す
 # app.include_router(users.router)
 # app.include_router(payroll.router)
-# app.include_router(department.router)
-# app.include_router(leave.router)
-# app.include_router(report.router)
 
 # データベースの初期化
 @app.on_event("startup")
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Date, Time, Text, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Date, Time, Text, Index, Computed, Enum as SQLEnum
+from sqlalchemy.dialects.postgresql import TSRANGE, DATERANGE, ExcludeConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime, date, time
 from typing import Optional
@@ -72,6 +73,10 @@ class Leave(Base):
     start_date = Column(Date, nullable=False)
     end_date = Column(Date, nullable=False)
     days_count = Column(Float, nullable=False)  # 休暇日数（0.5日単位も可）
+    start_half_day = Column(Boolean, default=False, server_default=expression.false(), nullable=False)  # 開始日を半日休とする
+    end_half_day = Column(Boolean, default=False, server_default=expression.false(), nullable=False)  # 終了日を半日休とする
+    # 休暇期間（終了日を含む）。DB側で自動計算し、期間の重複検索（&&）に使う
+    period = Column(DATERANGE, Computed("daterange(start_date, end_date, '[]')", persisted=True))
     
     leave_type = Column(String(20), nullable=False, default="paid")
     reason = Column(Text, nullable=True)
@@ -82,6 +87,13 @@ class Leave(Base):
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
     # リレーションシップは後で設定
+    
+    __table_args__ = (
+        # 休暇申請一覧のキーセットページネーション用
+        Index("ix_leaves_start_date_id", "start_date", "id"),
+        # 期間の重複検索用
+        Index("ix_leaves_period", "period", postgresql_using="gist"),
+    )
 
 class User(Base):
     __tablename__ = "users"
@@ -102,6 +114,7 @@ class User(Base):
     position = Column(String(100), nullable=True)  # 役職
     employment_type = Column(String(50), default="full_time")  # full_time, part_time, contract, intern
     hire_date = Column(Date, nullable=True)  # 入社日
+    weekly_work_days = Column(Integer, nullable=True)  # 週所定労働日数（有給休暇の比例付与用、NULL=週5日）
     
     # 給与情報
     hourly_rate = Column(Integer, default=1000)  # 時給（円）
@@ -127,6 +140,23 @@ class User(Base):
     leave_allocations = relationship("LeaveAllocation", back_populates="user")
     reports = relationship("Report", back_populates="user")
     payslips = relationship("Payslip", foreign_keys="Payslip.user_id", back_populates="user")
+    
+    __table_args__ = (
+        # 従業員一覧のキーセットページネーション用（email, employee_code は一意インデックスを利用）
+        # 昇順は (列 ASC NULLS LAST, id ASC)、降順は (列 DESC NULLS LAST, id DESC) の ORDER BY にそれぞれ一致させる
+        Index("ix_users_created_at_id", "created_at", "id"),
+        Index("ix_users_full_name_id", "full_name", "id"),
+        Index("ix_users_hire_date_id", "hire_date", "id"),
+        Index("ix_users_created_at_desc_id", created_at.desc().nulls_last(), id.desc()),
+        Index("ix_users_full_name_desc_id", full_name.desc().nulls_last(), id.desc()),
+        Index("ix_users_hire_date_desc_id", hire_date.desc().nulls_last(), id.desc()),
+        # 部署メンバー一覧（氏名順）用
+        Index("ix_users_department_id_full_name_id", "department_id", "full_name", "id"),
+        # 従業員検索・オートコンプリート用（ILIKE '%...%' と類似度順の並び替えをトライグラムで処理する）
+        Index("ix_users_full_name_trgm", "full_name", postgresql_using="gin", postgresql_ops={"full_name": "gin_trgm_ops"}),
+        Index("ix_users_email_trgm", "email", postgresql_using="gin", postgresql_ops={"email": "gin_trgm_ops"}),
+        Index("ix_users_employee_code_trgm", "employee_code", postgresql_using="gin", postgresql_ops={"employee_code": "gin_trgm_ops"}),
+    )
 
 
 class Attendance(Base):
@@ -148,6 +178,11 @@ class Attendance(Base):
     user = relationship("User", back_populates="attendances")
     adjustment_requests = relationship("TimeAdjustmentRequest", back_populates="attendance")
 
+    __table_args__ = (
+        # 期間指定での全社集計（シフト突合など）用
+        Index("ix_attendances_check_in_time", "check_in_time"),
+    )
+
 
 class Shift(Base):
     __tablename__ = "shifts"
@@ -165,6 +200,14 @@ class Shift(Base):
     status = Column(String(20), default="pending")
     admin_comment = Column(String(255), nullable=True)
     
+    # 勤務時間帯（日をまたぐシフトは翌日の終了時刻まで）。DB側で自動計算
+    period = Column(TSRANGE, Computed(
+        "CASE WHEN start_time IS NULL OR end_time IS NULL THEN NULL "
+        "WHEN end_time < start_time THEN tsrange(\"date\" + start_time, (\"date\" + 1) + end_time) "
+        "ELSE tsrange(\"date\" + start_time, \"date\" + end_time) END",
+        persisted=True
+    ))
+    
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
@@ -172,6 +215,19 @@ class Shift(Base):
     user = relationship("User", back_populates="shifts", foreign_keys=[user_id])
     admin = relationship("User", foreign_keys=[admin_id])
 
+    __table_args__ = (
+        # 確定シフトの期間検索用
+        Index("ix_shifts_date_status", "date", "status"),
+        # 同一ユーザーの勤務時間帯の重複を禁止（btree_gist拡張が必要）
+        ExcludeConstraint(
+            ("user_id", "="),
+            ("period", "&&"),
+            name="excl_shifts_user_period",
+            using="gist",
+            where="status != 'rejected' AND availability != 'unavailable'"
+        ),
+    )
+
 
 class PayrollSetting(Base):
     __tablename__ = "payroll_settings"
@@ -284,6 +340,35 @@ class ShiftTemplate(Base):
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
 
+# 固定シフトパターン（毎週の繰り返し）
+# 個々の日付のシフトは保存せず、取得時に期間内へ展開する。
+# 同じユーザー・日付の Shift 行（例外・確定）がある場合はそちらが優先される。
+class ShiftPattern(Base):
+    __tablename__ = "shift_patterns"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    admin_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    template_id = Column(Integer, ForeignKey("shift_templates.id"), nullable=True)
+    
+    weekday = Column(Integer, nullable=False)  # 0: 月曜 〜 6: 日曜
+    start_time = Column(Time, nullable=True)  # 未指定の場合はテンプレートの時刻
+    end_time = Column(Time, nullable=True)
+    availability = Column(String(20), default="available")
+    status = Column(String(20), default="confirmed")
+    memo = Column(String(255), nullable=True)
+    
+    valid_from = Column(Date, nullable=False)
+    valid_to = Column(Date, nullable=True)  # NULL=無期限
+    
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    # リレーションシップ
+    user = relationship("User", foreign_keys=[user_id])
+    template = relationship("ShiftTemplate")
+
+
 # 部署モデル
 class Department(Base):
     __tablename__ = "departments"
@@ -293,6 +378,7 @@ class Department(Base):
     description = Column(Text, nullable=True)
     location = Column(String(255), nullable=True)
     is_active = Column(Boolean, default=True)
+    parent_id = Column(Integer, ForeignKey("departments.id"), nullable=True, index=True)  # 上位部署（NULL=最上位）
     
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
@@ -301,6 +387,20 @@ class Department(Base):
     users = relationship("User", foreign_keys="User.department_id", back_populates="department")
     user_departments = relationship("UserDepartment", back_populates="department")
 
+# 部署階層の閉包テーブル（祖先・子孫のすべての組み合わせと深さ。自分自身も depth=0 で保持）
+# 「部署X配下の全ユーザー」を ancestor_id の索引付き結合1回で取得するために使う
+class DepartmentClosure(Base):
+    __tablename__ = "department_closure"
+    
+    ancestor_id = Column(Integer, ForeignKey("departments.id", ondelete="CASCADE"), primary_key=True)
+    descendant_id = Column(Integer, ForeignKey("departments.id", ondelete="CASCADE"), primary_key=True)
+    depth = Column(Integer, nullable=False)  # 祖先からの階層の深さ
+    
+    __table_args__ = (
+        # 上位部署の一覧（祖先の検索）用
+        Index("ix_department_closure_descendant_id", "descendant_id", "ancestor_id"),
+    )
+
 
 # ユーザーと部署の関連モデル（多対多）
 class UserDepartment(Base):
@@ -314,6 +414,11 @@ class UserDepartment(Base):
     # リレーションシップ
     user = relationship("User", back_populates="user_departments")
     department = relationship("Department", back_populates="user_departments")
+    
+    __table_args__ = (
+        # 部署ごとの兼務者の集計・一覧用（主キーは user_id が先頭のため）
+        Index("ix_user_departments_department_id_user_id", "department_id", "user_id"),
+    )
 
 
 # 有給休暇付与記録モデル
@@ -327,12 +432,72 @@ class LeaveAllocation(Base):
     effective_date = Column(Date, nullable=False)   # 付与日
     expiry_date = Column(Date, nullable=True)      # 有効期限
     reason = Column(Text, nullable=True)           # 付与理由
+    source = Column(String(20), nullable=False, default="manual", server_default="manual")  # manual, statutory
+    used_days = Column(Float, nullable=False, default=0, server_default="0")  # この付与から消化した日数（LeaveConsumption の合計）
     
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
     # リレーションシップ
     user = relationship("User", back_populates="leave_allocations")
+    consumptions = relationship("LeaveConsumption", back_populates="allocation")
+    
+    @property
+    def remaining_days(self) -> float:
+        return self.allocated_days - self.used_days
+    
+    __table_args__ = (
+        # ユーザーごとの失効予定日数の集計用
+        Index("ix_leave_allocations_user_expiry", "user_id", "expiry_date"),
+        # 残日数のある付与を失効日順に走査する（失効予定一覧用）
+        Index(
+            "ix_leave_allocations_open_expiry",
+            "expiry_date",
+            postgresql_where=(used_days < allocated_days)
+        ),
+        # 法定付与は同じユーザー・付与日に1件のみ（自動付与の冪等性を保証）
+        Index(
+            "uq_leave_allocations_statutory",
+            "user_id",
+            "effective_date",
+            unique=True,
+            postgresql_where=(source == "statutory")
+        ),
+    )
+
+# 有給休暇の消化明細（承認済みの有給休暇をどの付与から何日消化したか）
+# 承認時に有効期限の近い付与から順に割り当て（FIFO）、取り消し時に削除する
+class LeaveConsumption(Base):
+    __tablename__ = "leave_consumptions"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    leave_id = Column(Integer, ForeignKey("leaves.id", ondelete="CASCADE"), nullable=False, index=True)
+    allocation_id = Column(Integer, ForeignKey("leave_allocations.id", ondelete="CASCADE"), nullable=False, index=True)
+    days = Column(Float, nullable=False)  # 消化日数
+    
+    created_at = Column(DateTime, default=datetime.now)
+    
+    # リレーションシップ
+    leave = relationship("Leave")
+    allocation = relationship("LeaveAllocation", back_populates="consumptions")
+
+# 有給休暇残高台帳（LeaveAllocation と Leave の集計値をユーザーごとに保持）
+# 付与・申請・承認と同じトランザクションで更新し、残高確認は主キー参照のみで行う
+class PaidLeaveBalance(Base):
+    __tablename__ = "paid_leave_balances"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    
+    allocated_days = Column(Float, nullable=False, default=0)  # 有効期限内の付与日数
+    used_days = Column(Float, nullable=False, default=0)       # 有効期限内の付与から消化済みの日数
+    pending_days = Column(Float, nullable=False, default=0)    # 申請中の有給日数
+    next_expiry_date = Column(Date, nullable=True)             # 集計対象の付与のうち最も早い有効期限
+    
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    @property
+    def remaining_days(self) -> float:
+        return self.allocated_days - self.used_days
 
 # 日報・作業記録モデル
 class Report(Base):
@@ -346,12 +511,30 @@ class Report(Base):
     tasks_completed = Column(Text, nullable=True)
     tasks_planned = Column(Text, nullable=True)
     issues = Column(Text, nullable=True)
+    # 検索対象の本文（本文・完了タスク・課題を連結）。DB側で自動計算し、pg_trgm のGINインデックスで部分一致検索する
+    search_text = Column(
+        Text,
+        Computed("content || ' ' || coalesce(tasks_completed, '') || ' ' || coalesce(issues, '')", persisted=True)
+    )
     
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
     # リレーションシップ
     user = relationship("User", back_populates="reports")
+    
+    __table_args__ = (
+        # 日報一覧のキーセットページネーション用
+        Index("ix_reports_report_date_id", "report_date", "id"),
+        Index("ix_reports_user_id_report_date_id", "user_id", "report_date", "id"),
+        # 日報のキーワード検索用（ILIKE '%...%' をトライグラムで絞り込む）
+        Index(
+            "ix_reports_search_text_trgm",
+            "search_text",
+            postgresql_using="gin",
+            postgresql_ops={"search_text": "gin_trgm_ops"}
+        ),
+    )
 
 # 保険料率マスタモデル
 class InsuranceRate(Base):
@@ -391,6 +574,33 @@ class IncomeTaxRate(Base):
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
 
+# リフレッシュトークン（トークン本体は保存せず SHA-256 ハッシュのみ保持）
+# 使用するたびに失効させて新しいトークンを発行する（ローテーション）
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    token_hash = Column(String(64), unique=True, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# アクセストークンの失効記録（各ワーカーがメモリ上の失効リストへ差分で取り込む）
+# jti あり: そのトークンのみ失効、jti なし: not_before より前に発行されたそのユーザーのトークンをすべて失効
+class TokenRevocation(Base):
+    __tablename__ = "token_revocations"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    jti = Column(String(64), nullable=True)
+    not_before = Column(DateTime(timezone=True), nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)  # 対象のアクセストークンがすべて期限切れになる日時
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 # リレーションシップを後で設定
 Leave.user = relationship("User", foreign_keys=[Leave.user_id], back_populates="leaves")
 Leave.admin = relationship("User", foreign_keys=[Leave.admin_id])
@@ -0,0 +1,49 @@
+import base64
+import json
+from typing import Any, Callable, List, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Query
+
+
+def encode_cursor(*values: Any) -> str:
+    """キーセットページネーション用のカーソル文字列を生成（日付はISO形式で保持）"""
+    raw = [value.isoformat() if hasattr(value, "isoformat") else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(raw).encode()).decode()
+
+
+def optional(parser: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """NULLを許容するカーソル値の型変換"""
+    return lambda value: None if value is None else parser(value)
+
+
+def decode_cursor(cursor: Optional[str], *parsers: Callable[[Any], Any]) -> Optional[List[Any]]:
+    """
+    カーソル文字列を値のリストに戻す（各値を parsers の型変換で順に変換する）
+
+    値の個数が合わない場合や型変換に失敗した場合は400エラー
+    """
+    if not cursor:
+        return None
+
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError
+        return [parser(value) for parser, value in zip(parsers, values)]
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="カーソルが不正です"
+        )
+
+
+def estimate_count(query: Query) -> int:
+    """実行計画の推定行数から件数を概算する（COUNT(*) の全件走査を避ける。PostgreSQL専用）"""
+    session = query.session
+    statement = query.order_by(None).statement
+    compiled = statement.compile(dialect=session.bind.dialect)
+    plan = session.connection().exec_driver_sql(
+        "EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params
+    ).scalar()
+    return int(plan[0]["Plan"]["Plan Rows"])
@@ -0,0 +1,228 @@
+"""
+トークンバケットによるレート制限
+
+バケットは capacity 個のトークンを持ち、毎秒 refill_per_second 個ずつ補充される。
+1回の試行でトークンを1つ消費し、足りない場合は補充されるまでの秒数を返して拒否する。
+
+既定ではプロセス内（ワーカーごと）にバケットを持つ。環境変数 RATE_LIMIT_REDIS_URL を設定すると、
+Redis プロトコルのサーバー（Redis / Valkey / KeyDB など）にバケットを置き、全ワーカーで共有する。
+ログイン処理のイベントループを止めないよう、バケットの操作はすべて非同期で行う。
+
+リバースプロキシ（nginx など）経由の場合、接続元は常にプロキシのアドレスになる。
+環境変数 TRUSTED_PROXIES（カンマ区切りのIPアドレスまたはCIDR）に含まれる接続元からの要求に限り、
+X-Forwarded-For から実際のクライアントのIPアドレスを求める。
+"""
+import ipaddress
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+logger = logging.getLogger(__name__)
+
+# ログイン試行の上限（ユーザー名・IPアドレスごと）: 連続10回まで、以降は6秒に1回
+LOGIN_USERNAME_CAPACITY = int(os.getenv("LOGIN_USERNAME_CAPACITY", "10"))
+LOGIN_USERNAME_REFILL_PER_SECOND = float(os.getenv("LOGIN_USERNAME_REFILL_PER_SECOND", str(1 / 6)))
+
+# ログイン試行の上限（IPアドレスごと）: 事業所のNAT配下で始業時刻に集中しても通る程度
+LOGIN_IP_CAPACITY = int(os.getenv("LOGIN_IP_CAPACITY", "60"))
+LOGIN_IP_REFILL_PER_SECOND = float(os.getenv("LOGIN_IP_REFILL_PER_SECOND", "2"))
+
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+
+# X-Forwarded-For を信頼するプロキシ（カンマ区切りのIPアドレスまたはCIDR。未設定なら信頼しない）
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(value.strip(), strict=False)
+    for value in os.getenv("TRUSTED_PROXIES", "").split(",")
+    if value.strip()
+]
+
+
+def is_trusted_proxy(address: str, trusted_proxies=None) -> bool:
+    """接続元が信頼するプロキシか"""
+    networks = TRUSTED_PROXIES if trusted_proxies is None else trusted_proxies
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in networks)
+
+
+def get_client_ip(request: Request, trusted_proxies=None) -> Optional[str]:
+    """
+    クライアントのIPアドレスを返す
+
+    接続元が信頼するプロキシの場合のみ X-Forwarded-For を右から辿り、信頼するプロキシ以外で
+    最初に現れたアドレスを返す（クライアントが付けた左側の値は偽装できるため使わない）。
+    """
+    peer = request.client.host if request.client else None
+    if not peer or not is_trusted_proxy(peer, trusted_proxies):
+        return peer
+
+    forwarded = [
+        value.strip()
+        for header in request.headers.getlist("x-forwarded-for")
+        for value in header.split(",")
+        if value.strip()
+    ]
+    for address in reversed(forwarded):
+        if not is_trusted_proxy(address, trusted_proxies):
+            return address
+    return forwarded[0] if forwarded else peer
+
+
+class TokenBucketBackend(ABC):
+    """バケットの保存先"""
+
+    @abstractmethod
+    async def consume(self, key: str, capacity: int, refill_per_second: float, cost: float = 1) -> float:
+        """
+        トークンを消費する。
+
+        消費できた場合は 0、できなかった場合は必要なトークンが補充されるまでの秒数を返す。
+        """
+
+    @abstractmethod
+    async def reset(self, key: str) -> None:
+        """バケットを削除して満杯の状態に戻す"""
+
+
+class InMemoryTokenBucketBackend(TokenBucketBackend):
+    """プロセス内のバケット（max_keys を超えると最も古いキーから破棄する）"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def consume(self, key: str, capacity: int, refill_per_second: float, cost: float = 1) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+
+            retry_after = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                retry_after = (cost - tokens) / refill_per_second
+
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        return retry_after
+
+    async def reset(self, key: str) -> None:
+        with self._lock:
+            self._buckets.pop(key, None)
+
+
+# 補充と消費を1回の往復でアトミックに行う（満杯まで補充される時間が過ぎたキーは自動で削除）
+_TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(retry_after)
+"""
+
+
+class RedisTokenBucketBackend(TokenBucketBackend):
+    """
+    Redis プロトコルのサーバー上のバケット（全ワーカーで共有）
+
+    client は EVAL と DELETE をコルーチンとして持つクライアント（redis-py の redis.asyncio.Redis など）。
+    サーバーに接続できない場合はログイン自体を止めないよう、制限せずに通す。
+    """
+
+    def __init__(self, client, prefix: str = "rate_limit:"):
+        self.client = client
+        self.prefix = prefix
+
+    async def consume(self, key: str, capacity: int, refill_per_second: float, cost: float = 1) -> float:
+        try:
+            result = await self.client.eval(
+                _TOKEN_BUCKET_SCRIPT, 1, self.prefix + key,
+                capacity, refill_per_second, time.time(), cost
+            )
+        except Exception:
+            logger.warning("レート制限のバケットを更新できませんでした: %s", key, exc_info=True)
+            return 0.0
+
+        if isinstance(result, bytes):
+            result = result.decode()
+        return float(result)
+
+    async def reset(self, key: str) -> None:
+        try:
+            await self.client.delete(self.prefix + key)
+        except Exception:
+            logger.warning("レート制限のバケットを削除できませんでした: %s", key, exc_info=True)
+
+
+def create_backend(redis_url: Optional[str] = None) -> TokenBucketBackend:
+    """redis_url が指定されていれば共有バケット、なければプロセス内のバケットを返す"""
+    if not redis_url:
+        return InMemoryTokenBucketBackend()
+
+    # 共有バケットを使う場合のみ必要な依存関係
+    from redis import asyncio as redis_asyncio
+
+    return RedisTokenBucketBackend(redis_asyncio.Redis.from_url(redis_url, socket_timeout=0.2))
+
+
+class LoginThrottle:
+    """
+    ログイン試行をIPアドレスごと・(ユーザー名, IPアドレス) ごとのバケットで制限する
+
+    ユーザー名だけのバケットにすると、第三者が失敗を繰り返すだけで本人をログインできなくできるため、
+    ユーザー名のバケットもIPアドレスごとに分ける（多数のIPアドレスからの試行はIPアドレスごとの上限で抑える）。
+    """
+
+    def __init__(self, backend: TokenBucketBackend):
+        self.backend = backend
+
+    async def check(self, username: str, client_ip: Optional[str]) -> None:
+        """上限を超えている場合は 429 を返す（DB問い合わせやパスワード検証より前に呼ぶ）"""
+        retry_after = 0.0
+
+        if client_ip:
+            retry_after = await self.backend.consume(
+                f"login:ip:{client_ip}", LOGIN_IP_CAPACITY, LOGIN_IP_REFILL_PER_SECOND
+            )
+
+        if not retry_after:
+            # 大文字・小文字違いで別のバケットにならないよう正規化する
+            retry_after = await self.backend.consume(
+                f"login:user:{username.strip().lower()}:{client_ip or ''}",
+                LOGIN_USERNAME_CAPACITY, LOGIN_USERNAME_REFILL_PER_SECOND
+            )
+
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="ログインの試行回数が多すぎます。しばらくしてから再度お試しください",
+                headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+            )
+
+
+login_throttle = LoginThrottle(create_backend(RATE_LIMIT_REDIS_URL))
@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime, date, timedelta
 import calendar
 
-from ..database import get_db
+from ..database import get_async_db
 from ..models.models import Attendance, User, PayrollSetting, TimeAdjustmentRequest
 from ..schemas.attendance import (
     AttendanceCreate, 
@@ -16,7 +17,9 @@ from ..schemas.attendance import (
     TimeAdjustmentRequestUpdate,
     TimeAdjustmentRequestResponse
 )
-from ..auth.auth import get_current_active_user, get_current_admin_user
+from ..auth.auth import get_current_active_user, get_current_admin_user, Principal
+from ..department_tree import in_department_subtree
+from ..employee_directory import get_employee_directory
 
 router = APIRouter(prefix="/api/attendance", tags=["attendance"])
 
@@ -24,19 +27,21 @@ router = APIRouter(prefix="/api/attendance", tags=["attendance"])
 @router.post("/check-in", response_model=AttendanceResponse)
 async def check_in(
     attendance: AttendanceCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
     # 同じ日にすでにチェックインしていないか確認
     today = datetime.now().date()
     today_start = datetime.combine(today, datetime.min.time())
     today_end = datetime.combine(today, datetime.max.time())
     
-    existing_attendance = db.query(Attendance).filter(
-        Attendance.user_id == current_user.id,
-        Attendance.check_in_time >= today_start,
-        Attendance.check_in_time <= today_end
-    ).first()
+    existing_attendance = await db.scalar(
+        select(Attendance.id).where(
+            Attendance.user_id == current_user.id,
+            Attendance.check_in_time >= today_start,
+            Attendance.check_in_time <= today_end
+        ).limit(1)
+    )
     
     if existing_attendance:
         raise HTTPException(
@@ -66,8 +71,8 @@ async def check_in(
         new_attendance.total_break_hours = working_hours["break_hours"]
     
     db.add(new_attendance)
-    db.commit()
-    db.refresh(new_attendance)
+    await db.commit()
+    await db.refresh(new_attendance)
     
     return new_attendance
 
@@ -76,18 +81,18 @@ async def check_in(
 async def check_out(
     attendance_id: int,
     update_data: AttendanceUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
     # 勤怠記録の取得と所有者の確認
-    attendance = db.query(Attendance).filter(Attendance.id == attendance_id).first()
+    attendance = await db.get(Attendance, attendance_id)
     if not attendance:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="指定された勤怠記録が見つかりません"
         )
     
-    if attendance.user_id != current_user.id and not current_user.is_admin:
+    if attendance.user_id != current_user.id and current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="この勤怠記録を更新する権限がありません"
@@ -117,8 +122,8 @@ async def check_out(
         attendance.total_working_hours = working_hours["working_hours"]
         attendance.total_break_hours = working_hours["break_hours"]
     
-    db.commit()
-    db.refresh(attendance)
+    await db.commit()
+    await db.refresh(attendance)
     
     return attendance
 
@@ -127,30 +132,30 @@ async def check_out(
 async def get_my_attendance_records(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
-    query = db.query(Attendance).filter(Attendance.user_id == current_user.id)
+    query = select(Attendance).where(Attendance.user_id == current_user.id)
     
     # 日付範囲でフィルタリング
     if start_date:
-        query = query.filter(Attendance.check_in_time >= datetime.combine(start_date, datetime.min.time()))
+        query = query.where(Attendance.check_in_time >= datetime.combine(start_date, datetime.min.time()))
     
     if end_date:
-        query = query.filter(Attendance.check_in_time <= datetime.combine(end_date, datetime.max.time()))
+        query = query.where(Attendance.check_in_time <= datetime.combine(end_date, datetime.max.time()))
     
     # 日付の降順でソート
     query = query.order_by(Attendance.check_in_time.desc())
     
-    return query.all()
+    return (await db.scalars(query)).all()
 
 # 自分の月間勤怠記録を取得
 @router.get("/my-monthly-records", response_model=List[AttendanceResponse])
 async def get_my_monthly_attendance_records(
     year: int = Query(..., description="年（例：2023）"),
     month: int = Query(..., description="月（1-12）"),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
     # 月の開始日と終了日を計算
     start_date = date(year, month, 1)
@@ -158,11 +163,13 @@ async def get_my_monthly_attendance_records(
     end_date = date(year, month, last_day)
     
     # 指定した月の勤怠記録を取得
-    records = db.query(Attendance).filter(
-        Attendance.user_id == current_user.id,
-        Attendance.check_in_time >= datetime.combine(start_date, datetime.min.time()),
-        Attendance.check_in_time <= datetime.combine(end_date, datetime.max.time())
-    ).order_by(Attendance.check_in_time).all()
+    records = (await db.scalars(
+        select(Attendance).where(
+            Attendance.user_id == current_user.id,
+            Attendance.check_in_time >= datetime.combine(start_date, datetime.min.time()),
+            Attendance.check_in_time <= datetime.combine(end_date, datetime.max.time())
+        ).order_by(Attendance.check_in_time)
+    )).all()
     
     return records
 
@@ -172,37 +179,41 @@ async def get_all_attendance_records(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
     user_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    department_id: Optional[int] = Query(None, description="部署ID（配下の部署を含む）"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_admin_user)
 ):
-    # 基本クエリ
-    query = (
-        db.query(
-            Attendance,
-            User.full_name.label("user_full_name")
-        )
-        .join(User, Attendance.user_id == User.id)
-    )
+    # 基本クエリ（氏名は従業員ディレクトリから補完するため User は結合しない）
+    query = select(Attendance)
     
     # フィルタリング
     if start_date:
-        query = query.filter(Attendance.check_in_time >= datetime.combine(start_date, datetime.min.time()))
+        query = query.where(Attendance.check_in_time >= datetime.combine(start_date, datetime.min.time()))
     
     if end_date:
-        query = query.filter(Attendance.check_in_time <= datetime.combine(end_date, datetime.max.time()))
+        query = query.where(Attendance.check_in_time <= datetime.combine(end_date, datetime.max.time()))
     
     if user_id:
-        query = query.filter(Attendance.user_id == user_id)
+        query = query.where(Attendance.user_id == user_id)
+    
+    # 配下の部署を含めて絞り込む
+    if department_id:
+        query = query.join(User, Attendance.user_id == User.id).where(
+            in_department_subtree(User.department_id, department_id)
+        )
     
     # 日付の降順、ユーザーIDの昇順でソート
-    query = query.order_by(Attendance.check_in_time.desc(), User.id)
+    query = query.order_by(Attendance.check_in_time.desc(), Attendance.user_id)
     
     # 結果を整形
+    records = (await db.scalars(query)).all()
+    directory = await db.run_sync(get_employee_directory, {record.user_id for record in records})
+    
     result = []
-    for record, user_full_name in query.all():
+    for record in records:
         attendance_dict = {
             **vars(record),
-            "user_full_name": user_full_name
+            "user_full_name": directory.full_name(record.user_id)
         }
         # SQLAlchemyの内部属性を削除
         if "_sa_instance_state" in attendance_dict:
@@ -217,8 +228,8 @@ async def get_all_attendance_records(
 async def get_monthly_attendance_stats(
     year: int = Query(..., description="年（例：2023）"),
     month: int = Query(..., description="月（1-12）"),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
     # 月の開始日と終了日を計算
     start_date = date(year, month, 1)
@@ -226,15 +237,17 @@ async def get_monthly_attendance_stats(
     end_date = date(year, month, last_day)
     
     # 勤怠記録を取得
-    records = db.query(Attendance).filter(
-        Attendance.user_id == current_user.id,
-        Attendance.check_in_time >= datetime.combine(start_date, datetime.min.time()),
-        Attendance.check_in_time <= datetime.combine(end_date, datetime.max.time()),
-        Attendance.check_out_time.isnot(None)  # 退勤済みの記録のみ
-    ).all()
+    records = (await db.scalars(
+        select(Attendance).where(
+            Attendance.user_id == current_user.id,
+            Attendance.check_in_time >= datetime.combine(start_date, datetime.min.time()),
+            Attendance.check_in_time <= datetime.combine(end_date, datetime.max.time()),
+            Attendance.check_out_time.isnot(None)  # 退勤済みの記録のみ
+        )
+    )).all()
     
     # 給与計算設定を取得
-    payroll_setting = db.query(PayrollSetting).first()
+    payroll_setting = await db.scalar(select(PayrollSetting).limit(1))
     if not payroll_setting:
         payroll_setting = PayrollSetting()
     
@@ -247,7 +260,9 @@ async def get_monthly_attendance_stats(
     overtime_hours = max(0, total_hours - regular_hours)
     
     # 給与の計算
-    hourly_rate = getattr(current_user, 'hourly_rate', 1000)  # デフォルト値として1000円を設定
+    hourly_rate = await db.scalar(select(User.hourly_rate).where(User.id == current_user.id))
+    if hourly_rate is None:
+        hourly_rate = 1000  # デフォルト値として1000円を設定
     regular_pay = regular_hours * hourly_rate
     overtime_pay = overtime_hours * hourly_rate * payroll_setting.overtime_rate
     total_salary = regular_pay + overtime_pay
@@ -287,13 +302,13 @@ def calculate_working_hours(check_in, check_out, break_start=None, break_end=Non
 @router.post("/adjustment-request", response_model=TimeAdjustmentRequestResponse)
 async def create_adjustment_request(
     request_data: TimeAdjustmentRequestCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
     # 勤怠記録を取得（存在する場合）
     attendance = None
     if request_data.attendance_id:
-        attendance = db.query(Attendance).filter(Attendance.id == request_data.attendance_id).first()
+        attendance = await db.get(Attendance, request_data.attendance_id)
         if not attendance:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -327,8 +342,8 @@ async def create_adjustment_request(
         adjustment_request.original_break_end = attendance.break_end_time
     
     db.add(adjustment_request)
-    db.commit()
-    db.refresh(adjustment_request)
+    await db.commit()
+    await db.refresh(adjustment_request)
     
     return adjustment_request
 
@@ -336,52 +351,50 @@ async def create_adjustment_request(
 @router.get("/my-adjustment-requests", response_model=List[TimeAdjustmentRequestResponse])
 async def get_my_adjustment_requests(
     status: Optional[str] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
-    query = db.query(TimeAdjustmentRequest).filter(TimeAdjustmentRequest.user_id == current_user.id)
+    query = select(TimeAdjustmentRequest).where(TimeAdjustmentRequest.user_id == current_user.id)
     
     if status:
-        query = query.filter(TimeAdjustmentRequest.status == status)
+        query = query.where(TimeAdjustmentRequest.status == status)
     
     # 日付の降順でソート
     query = query.order_by(TimeAdjustmentRequest.created_at.desc())
     
-    return query.all()
+    return (await db.scalars(query)).all()
 
 # 管理者用：打刻修正申請の一覧取得
 @router.get("/admin/adjustment-requests", response_model=List[TimeAdjustmentRequestResponse])
 async def get_all_adjustment_requests(
     status: Optional[str] = None,
     user_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_admin_user)
 ):
-    query = db.query(TimeAdjustmentRequest)
+    query = select(TimeAdjustmentRequest)
     
     if status:
-        query = query.filter(TimeAdjustmentRequest.status == status)
+        query = query.where(TimeAdjustmentRequest.status == status)
     
     if user_id:
-        query = query.filter(TimeAdjustmentRequest.user_id == user_id)
+        query = query.where(TimeAdjustmentRequest.user_id == user_id)
     
     # 日付の降順でソート
     query = query.order_by(TimeAdjustmentRequest.created_at.desc())
     
-    return query.all()
+    return (await db.scalars(query)).all()
 
 # 管理者用：打刻修正申請の承認/拒否
 @router.put("/admin/adjustment-requests/{request_id}", response_model=TimeAdjustmentRequestResponse)
 async def update_adjustment_request(
     request_id: int,
     update_data: TimeAdjustmentRequestUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     # 修正申請の取得
-    adjustment_request = db.query(TimeAdjustmentRequest).filter(
-        TimeAdjustmentRequest.id == request_id
-    ).first()
+    adjustment_request = await db.get(TimeAdjustmentRequest, request_id)
     
     if not adjustment_request:
         raise HTTPException(
@@ -397,9 +410,7 @@ async def update_adjustment_request(
     
     # 承認の場合、勤怠記録を更新
     if update_data.status == "approved" and adjustment_request.attendance_id:
-        attendance = db.query(Attendance).filter(
-            Attendance.id == adjustment_request.attendance_id
-        ).first()
+        attendance = await db.get(Attendance, adjustment_request.attendance_id)
         
         if attendance:
             # 申請された値で更新
@@ -426,7 +437,7 @@ async def update_adjustment_request(
                 attendance.total_working_hours = working_hours["working_hours"]
                 attendance.total_break_hours = working_hours["break_hours"]
     
-    db.commit()
-    db.refresh(adjustment_request)
+    await db.commit()
+    await db.refresh(adjustment_request)
     
     return adjustment_request 
\ No newline at end of file
@@ -1,32 +1,48 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Form
+from fastapi import APIRouter, Depends, HTTPException, status, Form, Request
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from datetime import timedelta
-from typing import Any, Dict
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
 import secrets
 import string
 
-from ..database import get_db
-from ..models.models import User
+from ..database import get_async_db
+from ..models.models import RefreshToken, User
 from ..auth.auth import (
-    verify_password, 
-    create_access_token, 
-    ACCESS_TOKEN_EXPIRE_MINUTES,
-    get_password_hash,
-    get_current_active_user
+    verify_password_async, 
+    create_token_pair, 
+    REFRESH_TOKEN_REUSE_GRACE_SECONDS,
+    access_token_lifetime,
+    credentials_exception,
+    decode_access_token,
+    hash_refresh_token,
+    get_password_hash_async,
+    get_current_active_user,
+    get_current_active_user_record_async,
+    invalidate_principal,
+    oauth2_scheme,
+    Principal
 )
-from ..schemas.auth import Token, UserCreate, UserResponse, ChangePasswordRequest
+from ..auth.revocation import revocation_filter, revoke_access_token, revoke_user_tokens, to_timestamp
+from ..schemas.auth import Token, RefreshTokenRequest, LogoutRequest, UserCreate, UserResponse, ChangePasswordRequest
+from ..employee_directory import invalidate_employee_directory
+from ..rate_limit import login_throttle, get_client_ip
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
+    request: Request,
     username: str = Form(...), 
     password: str = Form(...), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(User).filter(User.username == username).first()
-    if not user or not verify_password(password, user.hashed_password):
+    # 試行回数の上限を超えた場合は、DB問い合わせやパスワード検証の前に拒否する
+    await login_throttle.check(username, get_client_ip(request))
+    
+    user = await db.scalar(select(User).where(User.username == username))
+    if not user or not await verify_password_async(password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -34,15 +50,83 @@ async def login_for_access_token(
         )
     if not user.is_active:
          raise HTTPException(status_code=400, detail="Inactive user")
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+    tokens = create_token_pair(db, user)
+    await db.commit()
+    return tokens
+
+# リフレッシュトークンでアクセストークンを再発行（リフレッシュトークンも使い捨てで再発行する）
+@router.post("/refresh", response_model=Token)
+async def refresh_access_token(
+    refresh_data: RefreshTokenRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    now = datetime.now(timezone.utc)
+    
+    stored = await db.scalar(
+        select(RefreshToken).where(
+            RefreshToken.token_hash == hash_refresh_token(refresh_data.refresh_token),
+            RefreshToken.expires_at > now
+        ).with_for_update()
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    
+    if not stored:
+        raise credentials_exception()
+    
+    if stored.revoked_at is not None:
+        # 猶予を過ぎて使用済みのトークンが再利用された場合は漏えいとみなし、そのユーザーのトークンをすべて失効させる
+        if to_timestamp(stored.revoked_at) < now.timestamp() - REFRESH_TOKEN_REUSE_GRACE_SECONDS:
+            revocation = await db.run_sync(revoke_user_tokens, stored.user_id, access_token_lifetime())
+            await db.commit()
+            revocation_filter.add(revocation)
+        raise credentials_exception()
+    
+    user = await db.get(User, stored.user_id)
+    if not user or not user.is_active:
+        raise credentials_exception()
+    
+    stored.revoked_at = now
+    tokens = create_token_pair(db, user)
+    await db.commit()
+    return tokens
+
+# ログアウト（現在のアクセストークンと、指定されたリフレッシュトークンを失効させる）
+@router.post("/logout", status_code=status.HTTP_200_OK)
+async def logout(
+    logout_data: Optional[LogoutRequest] = None,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> Dict[str, str]:
+    payload = decode_access_token(token)
+    user_id = payload.get("uid")
+    if user_id is None:
+        raise credentials_exception()
+    
+    revocation = None
+    if payload.get("jti"):
+        revocation = revoke_access_token(
+            db, user_id, payload["jti"], datetime.fromtimestamp(payload["exp"], timezone.utc)
+        )
+    
+    if logout_data and logout_data.refresh_token:
+        await db.execute(
+            update(RefreshToken)
+            .where(
+                RefreshToken.token_hash == hash_refresh_token(logout_data.refresh_token),
+                RefreshToken.user_id == user_id,
+                RefreshToken.revoked_at == None
+            )
+            .values(revoked_at=datetime.now(timezone.utc))
+        )
+    
+    await db.commit()
+    if revocation is not None:
+        revocation_filter.add(revocation)
+    
+    return {"message": "ログアウトしました"}
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user(
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user_record_async)
 ) -> User:
     """現在のログインユーザーの情報を取得"""
     return current_user
@@ -50,24 +134,24 @@ async def get_current_user(
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def register_user(
     user_data: UserCreate, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # 重複チェック (ユーザー名)
-    existing_user = db.query(User).filter(User.username == user_data.username).first()
+    existing_user = await db.scalar(select(User.id).where(User.username == user_data.username))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered",
         )
     # 重複チェック (メール)
-    existing_email = db.query(User).filter(User.email == user_data.email).first()
+    existing_email = await db.scalar(select(User.id).where(User.email == user_data.email))
     if existing_email:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered",
         )
 
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     db_user = User(
         username=user_data.username,
         email=user_data.email,
@@ -77,27 +161,35 @@ async def register_user(
         is_active=True
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    invalidate_employee_directory()
     return db_user
 
 @router.post("/change-password", status_code=status.HTTP_200_OK)
 async def change_password(
     password_data: ChangePasswordRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
-) -> Dict[str, str]:
-    """パスワード変更"""
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
+) -> Dict[str, Any]:
+    """パスワード変更（他の端末のセッションは失効させ、この端末には新しいトークンを発行する）"""
+    user = await db.get(User, current_user.id)
+    
     # 現在のパスワードを検証
-    if not verify_password(password_data.current_password, current_user.hashed_password):
+    if not await verify_password_async(password_data.current_password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="現在のパスワードが正しくありません",
         )
     
     # パスワードの更新
-    current_user.hashed_password = get_password_hash(password_data.new_password)
+    user.hashed_password = await get_password_hash_async(password_data.new_password)
+    
+    revocation = await db.run_sync(revoke_user_tokens, user.id, access_token_lifetime())
+    tokens = create_token_pair(db, user)
     
-    db.commit()
+    await db.commit()
+    revocation_filter.add(revocation)
+    invalidate_principal(user.id)
     
-    return {"message": "パスワードが正常に変更されました"} 
\ No newline at end of file
+    return {"message": "パスワードが正常に変更されました", **tokens} 
\ No newline at end of file
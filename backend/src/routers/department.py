@@ -1,29 +1,46 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, literal, select, tuple_, union_all
 from typing import List, Optional
 from datetime import datetime
 
 from ..database import get_db
-from ..models.models import Department, UserDepartment, User
+from ..models.models import Department, DepartmentClosure, UserDepartment, User
 from ..schemas.department import (
     DepartmentCreate,
     DepartmentUpdate,
     DepartmentResponse,
     DepartmentWithUsers,
+    DepartmentMemberListResponse,
+    DepartmentTreeNode,
     UserDepartmentAssign,
     UserDepartmentResponse
 )
-from ..auth.auth import get_current_active_user, get_current_admin_user
+from ..auth.auth import get_current_active_user, get_current_admin_user, Principal
+from ..pagination import encode_cursor, decode_cursor
+from ..department_tree import add_department_node, move_department_node
+from ..employee_directory import invalidate_employee_directory
 
 router = APIRouter(prefix="/api/departments", tags=["departments"])
 
+# 部署を取得し、存在しない場合は404を返すヘルパー関数
+def get_department_or_404(db: Session, department_id: int) -> Department:
+    department = db.query(Department).filter(Department.id == department_id).first()
+    
+    if not department:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="指定された部署/現場が見つかりません"
+        )
+    
+    return department
+
 # 部署の作成（管理者のみ）
 @router.post("", response_model=DepartmentResponse)
-async def create_department(
+def create_department(
     department: DepartmentCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     # 同じ名前の部署が存在しないか確認
     existing_department = db.query(Department).filter(
@@ -36,15 +53,24 @@ async def create_department(
             detail="同じ名前の部署/現場が既に存在します"
         )
     
+    # 上位部署の存在確認
+    if department.parent_id is not None:
+        get_department_or_404(db, department.parent_id)
+    
     # 新しい部署を作成
     new_department = Department(
         name=department.name,
         description=department.description,
         location=department.location,
+        parent_id=department.parent_id,
         is_active=True
     )
     
     db.add(new_department)
+    db.flush()
+    
+    # 部署階層（閉包テーブル）に追加
+    add_department_node(db, new_department)
     db.commit()
     db.refresh(new_department)
     
@@ -52,10 +78,10 @@ async def create_department(
 
 # 部署の一覧取得
 @router.get("", response_model=List[DepartmentResponse])
-async def get_departments(
+def get_departments(
     include_inactive: bool = False,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     query = db.query(Department)
     
@@ -70,10 +96,10 @@ async def get_departments(
 
 # 部署詳細の取得
 @router.get("/{department_id}", response_model=DepartmentResponse)
-async def get_department(
+def get_department(
     department_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     department = db.query(Department).filter(Department.id == department_id).first()
     
@@ -87,11 +113,11 @@ async def get_department(
 
 # 部署情報の更新（管理者のみ）
 @router.put("/{department_id}", response_model=DepartmentResponse)
-async def update_department(
+def update_department(
     department_id: int,
     department_data: DepartmentUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     department = db.query(Department).filter(Department.id == department_id).first()
     
@@ -127,26 +153,48 @@ async def update_department(
     if department_data.is_active is not None:
         department.is_active = department_data.is_active
     
+    # 上位部署の変更（null を明示した場合は最上位に移動）
+    if "parent_id" in department_data.model_fields_set and department_data.parent_id != department.parent_id:
+        if department_data.parent_id is not None:
+            get_department_or_404(db, department_data.parent_id)
+        move_department_node(db, department, department_data.parent_id)
+    
     department.updated_at = datetime.now()
     
     db.commit()
     db.refresh(department)
+    invalidate_employee_directory()
     
     return department
 
 # 部署とユーザー数を取得（管理者用）
+# 主所属（User.department_id）と兼務（UserDepartment、主所属と同じ部署は除く）を1クエリで集計する
 @router.get("/admin/with-user-count", response_model=List[DepartmentWithUsers])
-async def get_departments_with_user_count(
+def get_departments_with_user_count(
     include_inactive: bool = False,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
-    # サブクエリで部署ごとのユーザー数を取得
-    user_count_subq = (
+    # 部署ごとの主所属人数
+    primary_subq = (
         db.query(
-            UserDepartment.department_id,
-            func.count(UserDepartment.user_id).label("user_count")
+            User.department_id.label("department_id"),
+            func.count(User.id).label("primary_count"),
+            func.count(User.id).filter(User.is_active == True).label("active_count")
         )
+        .filter(User.department_id != None)
+        .group_by(User.department_id)
+        .subquery()
+    )
+    
+    # 部署ごとの兼務人数
+    secondary_subq = (
+        db.query(
+            UserDepartment.department_id.label("department_id"),
+            func.count(UserDepartment.user_id).label("secondary_count")
+        )
+        .join(User, UserDepartment.user_id == User.id)
+        .filter(User.department_id.is_distinct_from(UserDepartment.department_id))
         .group_by(UserDepartment.department_id)
         .subquery()
     )
@@ -155,9 +203,12 @@ async def get_departments_with_user_count(
     query = (
         db.query(
             Department,
-            func.coalesce(user_count_subq.c.user_count, 0).label("user_count")
+            func.coalesce(primary_subq.c.primary_count, 0).label("primary_count"),
+            func.coalesce(secondary_subq.c.secondary_count, 0).label("secondary_count"),
+            func.coalesce(primary_subq.c.active_count, 0).label("active_count")
         )
-        .outerjoin(user_count_subq, Department.id == user_count_subq.c.department_id)
+        .outerjoin(primary_subq, Department.id == primary_subq.c.department_id)
+        .outerjoin(secondary_subq, Department.id == secondary_subq.c.department_id)
     )
     
     # 非アクティブな部署をフィルタリング
@@ -169,10 +220,13 @@ async def get_departments_with_user_count(
     
     # 結果を整形
     result = []
-    for department, user_count in query.all():
+    for department, primary_count, secondary_count, active_count in query.all():
         department_dict = {
             **vars(department),
-            "user_count": user_count
+            "user_count": primary_count + secondary_count,
+            "primary_count": primary_count,
+            "secondary_count": secondary_count,
+            "active_count": active_count
         }
         # SQLAlchemyの内部属性を削除
         if "_sa_instance_state" in department_dict:
@@ -184,10 +238,10 @@ async def get_departments_with_user_count(
 
 # ユーザーを部署に割り当て（管理者のみ）
 @router.post("/assign", response_model=UserDepartmentResponse)
-async def assign_user_to_department(
+def assign_user_to_department(
     assignment: UserDepartmentAssign,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     # ユーザーと部署の存在確認
     user = db.query(User).filter(User.id == assignment.user_id).first()
@@ -238,11 +292,11 @@ async def assign_user_to_department(
 
 # ユーザーの部署割り当てを解除（管理者のみ）
 @router.delete("/unassign/{user_id}/{department_id}")
-async def unassign_user_from_department(
+def unassign_user_from_department(
     user_id: int,
     department_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     # 割り当ての確認
     assignment = db.query(UserDepartment).filter(
@@ -263,14 +317,19 @@ async def unassign_user_from_department(
     return {"message": "ユーザーの部署割り当てを解除しました"}
 
 # 部署に属するユーザー一覧を取得
-@router.get("/{department_id}/users", response_model=List[UserDepartmentResponse])
-async def get_department_users(
+# 主所属と兼務を UNION ALL でまとめ、(氏名, ユーザーID) のキーセットでページネーションする
+@router.get("/{department_id}/users", response_model=DepartmentMemberListResponse)
+def get_department_users(
     department_id: int,
+    membership: str = Query("all", regex="^(all|primary|secondary)$", description="所属区分"),
+    include_inactive: bool = Query(False, description="無効なユーザーも含める"),
+    cursor: Optional[str] = Query(None, description="前ページのnext_cursor"),
+    limit: int = Query(100, ge=1, le=500, description="1ページあたりの件数"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     # 部署の存在確認
-    department = db.query(Department).filter(Department.id == department_id).first()
+    department = db.query(Department.id, Department.name).filter(Department.id == department_id).first()
     
     if not department:
         raise HTTPException(
@@ -278,37 +337,117 @@ async def get_department_users(
             detail="指定された部署/現場が見つかりません"
         )
     
-    # 部署に属するユーザーを取得
+    member_columns = (
+        User.id.label("user_id"),
+        User.full_name.label("user_name"),
+        User.employee_code,
+        User.position,
+        User.is_active
+    )
+    
+    # 主所属（User.department_id）
+    primary = select(*member_columns, literal("primary").label("membership")).where(
+        User.department_id == department_id
+    )
+    
+    # 兼務（主所属と同じ部署の割り当ては主所属として扱う）
+    secondary = (
+        select(*member_columns, literal("secondary").label("membership"))
+        .join(UserDepartment, UserDepartment.user_id == User.id)
+        .where(
+            UserDepartment.department_id == department_id,
+            User.department_id.is_distinct_from(department_id)
+        )
+    )
+    
+    if not include_inactive:
+        primary = primary.where(User.is_active == True)
+        secondary = secondary.where(User.is_active == True)
+    
+    if membership == "primary":
+        members = primary.subquery()
+    elif membership == "secondary":
+        members = secondary.subquery()
+    else:
+        members = union_all(primary, secondary).subquery()
+    
+    query = db.query(members)
+    
+    # カーソル位置より後ろの行のみ
+    cursor_values = decode_cursor(cursor, str, int)
+    if cursor_values:
+        cursor_name, cursor_id = cursor_values
+        query = query.filter(tuple_(members.c.user_name, members.c.user_id) > tuple_(cursor_name, cursor_id))
+    
+    # 氏名順にソート（次ページの有無を判定するため1件多く取得）
+    rows = query.order_by(members.c.user_name, members.c.user_id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    result = [
+        {
+            "user_id": row.user_id,
+            "department_id": department.id,
+            "user_name": row.user_name,
+            "department_name": department.name,
+            "employee_code": row.employee_code,
+            "position": row.position,
+            "is_active": row.is_active,
+            "membership": row.membership
+        }
+        for row in rows
+    ]
+    
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(rows[-1].user_name, rows[-1].user_id)
+    
+    return {"items": result, "next_cursor": next_cursor}
+
+# 部署と配下の部署一覧を取得（階層の深さ順）
+@router.get("/{department_id}/subtree", response_model=List[DepartmentTreeNode])
+def get_department_subtree(
+    department_id: int,
+    include_inactive: bool = False,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    get_department_or_404(db, department_id)
+    
     query = (
         db.query(
-            UserDepartment.user_id,
-            UserDepartment.department_id,
-            User.full_name.label("user_name"),
-            Department.name.label("department_name")
+            Department.id,
+            Department.name,
+            Department.parent_id,
+            Department.is_active,
+            DepartmentClosure.depth
         )
-        .join(User, UserDepartment.user_id == User.id)
-        .join(Department, UserDepartment.department_id == Department.id)
-        .filter(UserDepartment.department_id == department_id)
-        .order_by(User.full_name)
+        .join(DepartmentClosure, DepartmentClosure.descendant_id == Department.id)
+        .filter(DepartmentClosure.ancestor_id == department_id)
     )
     
-    result = []
-    for user_id, department_id, user_name, department_name in query.all():
-        result.append({
-            "user_id": user_id,
-            "department_id": department_id,
-            "user_name": user_name,
-            "department_name": department_name
-        })
+    if not include_inactive:
+        query = query.filter(Department.is_active == True)
     
-    return result
+    rows = query.order_by(DepartmentClosure.depth, Department.name).all()
+    
+    return [
+        {
+            "id": row.id,
+            "name": row.name,
+            "parent_id": row.parent_id,
+            "is_active": row.is_active,
+            "depth": row.depth
+        }
+        for row in rows
+    ]
 
 # ユーザーが所属する部署一覧を取得
 @router.get("/user/{user_id}", response_model=List[DepartmentResponse])
-async def get_user_departments(
+def get_user_departments(
     user_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     # ユーザーの存在確認
     user = db.query(User).filter(User.id == user_id).first()
@@ -1,49 +1,98 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, or_
+from sqlalchemy import func, and_, or_, literal, tuple_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, date
+import csv
 
-from ..database import get_db
+from ..database import get_db, get_async_db
 from ..models.models import User, Department
 from ..schemas.employee import (
     EmployeeCreate,
     EmployeeUpdate,
     EmployeeResponse,
     EmployeeListResponse,
+    EmployeeSuggestion,
+    EmployeeImportResult,
     PasswordChange,
     AdminPasswordReset
 )
-from ..auth.auth import get_current_admin_user, get_current_active_user, get_password_hash, verify_password
+from ..auth.auth import (
+    get_current_admin_user,
+    get_current_active_user,
+    get_password_hash_async,
+    verify_password_async,
+    invalidate_principal,
+    access_token_lifetime,
+    create_token_pair,
+    Principal
+)
+from ..auth.revocation import revocation_filter, revoke_user_tokens
+from ..search import escape_like
+from ..employee_directory import invalidate_employee_directory
+from ..pagination import encode_cursor, decode_cursor, optional, estimate_count
+from ..employee_import import (
+    MAX_IMPORT_ROWS,
+    UNIQUE_COLUMNS,
+    parse_import_file,
+    validate_rows,
+    find_conflicts,
+    hash_passwords,
+    insert_employees,
+    find_conflicting_column
+)
 
 router = APIRouter(prefix="/api/employees", tags=["employees"])
 
+# 一覧で並び替え可能な列（カーソル値の型変換に使う）
+EMPLOYEE_SORT_COLUMNS = {
+    "created_at": datetime.fromisoformat,
+    "full_name": str,
+    "email": str,
+    "employee_code": str,
+    "hire_date": date.fromisoformat,
+    "id": int
+}
+
+# (ソート列, id) のキーセット条件。NULLは昇順・降順とも末尾に並べる
+# 値のあるカーソルではソート列がNULLでない行だけを返す（NULLの行は呼び出し側で別クエリにより続けて取得する。
+# OR で結合すると (ソート列, id) のインデックスを範囲走査できないため）
+def employee_keyset_filter(sort_by: str, value, last_id: int, descending: bool):
+    column = getattr(User, sort_by)
+    
+    if value is None:
+        return and_(column == None, User.id < last_id if descending else User.id > last_id)
+    
+    if descending:
+        return tuple_(column, User.id) < tuple_(value, last_id)
+    return tuple_(column, User.id) > tuple_(value, last_id)
+
 # 従業員一覧取得（管理者のみ）
+# cursor を指定すると (ソート列, id) のキーセットで次ページを取得する（page は無視）
+# count は exact（COUNT(*)）、estimated（実行計画の推定値）、none（件数なし）から選ぶ
 @router.get("", response_model=EmployeeListResponse)
-async def get_employees(
+def get_employees(
     page: int = Query(1, ge=1, description="ページ番号"),
     per_page: int = Query(20, ge=1, le=100, description="1ページあたりの件数"),
     search: Optional[str] = Query(None, description="検索キーワード（名前、メール、社員コード）"),
     department_id: Optional[int] = Query(None, description="部署ID"),
     employment_type: Optional[str] = Query(None, description="雇用形態"),
     is_active: Optional[bool] = Query(None, description="アクティブステータス"),
-    sort_by: str = Query("created_at", description="ソートフィールド"),
+    sort_by: str = Query("created_at", regex="^(created_at|full_name|email|employee_code|hire_date|id)$", description="ソートフィールド"),
     sort_order: str = Query("desc", regex="^(asc|desc)$", description="ソート順"),
+    cursor: Optional[str] = Query(None, description="前ページのnext_cursor"),
+    count: str = Query("exact", regex="^(exact|estimated|none)$", description="総件数の取得方法"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     # 基本クエリ
-    query = db.query(User).options(joinedload(User.department))
+    query = db.query(User)
     
-    # 検索フィルタ
+    # 検索フィルタ（トライグラムのGINインデックスで部分一致を絞り込む）
     if search:
-        query = query.filter(
-            or_(
-                User.full_name.ilike(f"%{search}%"),
-                User.email.ilike(f"%{search}%"),
-                User.employee_code.ilike(f"%{search}%")
-            )
-        )
+        query = query.filter(employee_search_filter(search))
     
     # 部署フィルタ
     if department_id:
@@ -57,35 +106,221 @@ async def get_employees(
     if is_active is not None:
         query = query.filter(User.is_active == is_active)
     
-    # ソート
-    if hasattr(User, sort_by):
-        order_column = getattr(User, sort_by)
-        if sort_order == "desc":
-            query = query.order_by(order_column.desc())
-        else:
-            query = query.order_by(order_column.asc())
+    # 総件数
+    total = None
+    if count == "exact":
+        total = query.count()
+    elif count == "estimated":
+        total = estimate_count(query)
+    total_pages = (total + per_page - 1) // per_page if total is not None else None
+    filtered_query = query
+    
+    # ソート（同じ値の行はidで順序を固定する）
+    descending = sort_order == "desc"
+    order_column = getattr(User, sort_by)
+    id_order = User.id.desc() if descending else User.id.asc()
+    if descending:
+        query = query.order_by(order_column.desc().nulls_last(), id_order)
+    else:
+        query = query.order_by(order_column.asc().nulls_last(), id_order)
     
     # ページネーション
-    total = query.count()
-    total_pages = (total + per_page - 1) // per_page
-    offset = (page - 1) * per_page
+    cursor_value = None
+    cursor_values = decode_cursor(cursor, str, optional(EMPLOYEE_SORT_COLUMNS[sort_by]), int)
+    if cursor_values:
+        cursor_sort_by, cursor_value, cursor_id = cursor_values
+        if cursor_sort_by != sort_by:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="カーソルが不正です"
+            )
+        query = query.filter(employee_keyset_filter(sort_by, cursor_value, cursor_id, descending))
+    else:
+        query = query.offset((page - 1) * per_page)
+    
+    # 次ページの有無を判定するため1件多く取得
+    employees = query.options(joinedload(User.department)).limit(per_page + 1).all()
+    
+    # 値のあるカーソルでNULLでない行を使い切った場合は、ソート列がNULLの行を先頭から続けて取得する
+    if cursor_value is not None and len(employees) <= per_page:
+        employees += (
+            filtered_query.filter(order_column == None)
+            .order_by(id_order)
+            .options(joinedload(User.department))
+            .limit(per_page + 1 - len(employees))
+            .all()
+        )
+    has_more = len(employees) > per_page
+    employees = employees[:per_page]
     
-    employees = query.offset(offset).limit(per_page).all()
+    next_cursor = None
+    if has_more:
+        last = employees[-1]
+        next_cursor = encode_cursor(sort_by, getattr(last, sort_by), last.id)
     
     return EmployeeListResponse(
         items=employees,
         total=total,
+        total_is_estimate=count == "estimated",
         page=page,
         per_page=per_page,
-        total_pages=total_pages
+        total_pages=total_pages,
+        next_cursor=next_cursor
     )
 
+# 名前・メール・社員コードの部分一致条件
+def employee_search_filter(keyword: str):
+    pattern = f"%{escape_like(keyword)}%"
+    return or_(
+        User.full_name.ilike(pattern, escape="\\"),
+        User.email.ilike(pattern, escape="\\"),
+        User.employee_code.ilike(pattern, escape="\\")
+    )
+
+# 従業員のオートコンプリート（管理者のみ）
+# 部分一致する従業員を類似度の高い順に上位 limit 件だけ、表示に必要な列のみで返す
+@router.get("/autocomplete", response_model=List[EmployeeSuggestion])
+def autocomplete_employees(
+    q: str = Query(..., min_length=1, max_length=100, description="入力中のキーワード"),
+    limit: int = Query(10, ge=1, le=50, description="最大件数"),
+    include_inactive: bool = Query(False, description="無効な従業員も含める"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    # 空白のみの入力は全件一致になるため、候補なしとして返す
+    q = q.strip()
+    if not q:
+        return []
+    
+    keyword = literal(q)
+    rank = func.greatest(
+        func.similarity(User.full_name, keyword),
+        func.similarity(User.email, keyword),
+        func.coalesce(func.similarity(User.employee_code, keyword), 0)
+    )
+    
+    query = (
+        db.query(
+            User.id,
+            User.full_name,
+            User.email,
+            User.employee_code,
+            User.department_id,
+            User.position
+        )
+        .filter(employee_search_filter(q))
+    )
+    
+    if not include_inactive:
+        query = query.filter(User.is_active == True)
+    
+    rows = query.order_by(rank.desc(), User.id).limit(limit).all()
+    
+    return [
+        {
+            "id": row.id,
+            "full_name": row.full_name,
+            "email": row.email,
+            "employee_code": row.employee_code,
+            "department_id": row.department_id,
+            "position": row.position
+        }
+        for row in rows
+    ]
+
+# 従業員の一括登録（管理者のみ）
+# CSV（ヘッダー行あり）または JSON 配列を受け付け、行ごとのエラーを返す
+# skip_invalid=false の場合はエラーが1件でもあれば何も登録しない
+@router.post("/import", response_model=EmployeeImportResult)
+async def import_employees(
+    file: UploadFile = File(..., description="CSV または JSON ファイル"),
+    dry_run: bool = Query(False, description="検証のみ行い登録しない"),
+    skip_invalid: bool = Query(False, description="エラーのある行を除いて登録する"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    try:
+        rows = parse_import_file(await file.read(), file.filename or "")
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"ファイルを読み込めません: {e}"
+        )
+    
+    if not rows:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="登録する行がありません"
+        )
+    
+    if len(rows) > MAX_IMPORT_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"一度に登録できるのは{MAX_IMPORT_ROWS}行までです"
+        )
+    
+    # 行ごとの検証と、一意性・部署の一括検証
+    valid, errors = validate_rows(rows)
+    # 同期セッション（COPY を使うため）の処理はスレッドプールで実行し、イベントループを止めない
+    errors.extend(await run_in_threadpool(find_conflicts, db, valid))
+    # 検証のトランザクション（一時テーブル）はここで終え、ハッシュ化の間は接続・トランザクションを保持しない
+    await run_in_threadpool(db.rollback)
+    errors.sort(key=lambda error: error["row"])
+    
+    error_rows = {error["row"] for error in errors}
+    importable = [(row_no, employee) for row_no, employee in valid.items() if row_no not in error_rows]
+    
+    result = {
+        "total_rows": len(rows),
+        "imported_count": 0,
+        "error_count": len(error_rows),
+        "dry_run": dry_run,
+        "errors": errors,
+        "imported": []
+    }
+    
+    if dry_run or not importable or (errors and not skip_invalid):
+        return result
+    
+    # bcrypt はCPU負荷が高いため、ログインと同じ上限つきのスレッドプールで実行する
+    passwords = [employee.password for _, employee in importable]
+    hashed_passwords = await hash_passwords(passwords)
+    
+    # 1トランザクションでまとめて登録（検証後に他の登録処理で使われた値は insert_employees で飛ばす）
+    user_ids = await run_in_threadpool(
+        insert_employees, db, [employee for _, employee in importable], hashed_passwords
+    )
+    
+    # 検証後に他の登録処理と重複して飛ばされた行はエラーとして返す
+    skipped = [(row_no, employee) for (row_no, employee), user_id in zip(importable, user_ids) if user_id is None]
+    for row_no, employee in skipped:
+        field = await run_in_threadpool(find_conflicting_column, db, employee)
+        errors.append({"row": row_no, "field": field, "message": UNIQUE_COLUMNS[field]})
+    if skipped:
+        errors.sort(key=lambda error: error["row"])
+        result["error_count"] += len(skipped)
+        if not skip_invalid:
+            await run_in_threadpool(db.rollback)
+            return result
+    
+    await run_in_threadpool(db.commit)
+    invalidate_employee_directory()
+    
+    result["imported"] = [
+        {"row": row_no, "id": user_id, "username": employee.username}
+        for (row_no, employee), user_id in zip(importable, user_ids)
+        if user_id is not None
+    ]
+    result["imported_count"] = len(result["imported"])
+    
+    return result
+
 # 従業員詳細取得
 @router.get("/{employee_id}", response_model=EmployeeResponse)
-async def get_employee(
+def get_employee(
     employee_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     # 管理者または本人のみアクセス可能
     if current_user.role != "admin" and current_user.id != employee_id:
@@ -108,16 +343,18 @@ async def get_employee(
 @router.post("", response_model=EmployeeResponse)
 async def create_employee(
     employee_data: EmployeeCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     # 既存ユーザーのチェック
-    existing_user = db.query(User).filter(
-        or_(
-            User.username == employee_data.username,
-            User.email == employee_data.email
-        )
-    ).first()
+    existing_user = (await db.execute(
+        select(User.username, User.email).where(
+            or_(
+                User.username == employee_data.username,
+                User.email == employee_data.email
+            )
+        ).limit(1)
+    )).first()
     
     if existing_user:
         if existing_user.username == employee_data.username:
@@ -133,7 +370,9 @@ async def create_employee(
     
     # 社員番号の重複チェック
     if employee_data.employee_code:
-        existing_employee = db.query(User).filter(User.employee_code == employee_data.employee_code).first()
+        existing_employee = await db.scalar(
+            select(User.id).where(User.employee_code == employee_data.employee_code)
+        )
         if existing_employee:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -143,26 +382,31 @@ async def create_employee(
     # 新規ユーザー作成
     new_employee = User(
         **employee_data.dict(exclude={"password"}),
-        hashed_password=get_password_hash(employee_data.password),
+        hashed_password=await get_password_hash_async(employee_data.password),
         force_password_change=True  # 新規登録時は初回パスワード変更を必須にする
     )
     
     db.add(new_employee)
-    db.commit()
-    db.refresh(new_employee)
-    
-    # 部署情報を含めて返す
-    employee = db.query(User).options(joinedload(User.department)).filter(User.id == new_employee.id).first()
+    await db.commit()
+    invalidate_employee_directory()
+    
+    # 部署情報を含めて返す（非同期セッションでは遅延読み込みできないため、まとめて読み込む）
+    employee = await db.scalar(
+        select(User)
+        .options(joinedload(User.department))
+        .where(User.id == new_employee.id)
+        .execution_options(populate_existing=True)
+    )
     
     return employee
 
 # 従業員情報更新
 @router.put("/{employee_id}", response_model=EmployeeResponse)
-async def update_employee(
+def update_employee(
     employee_id: int,
     employee_data: EmployeeUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     # 管理者または本人のみ更新可能（ただし、本人は限定的な項目のみ）
     is_admin = current_user.role == "admin"
@@ -209,13 +453,23 @@ async def update_employee(
             )
     
     # 更新
+    was_active = employee.is_active
     for field, value in update_data.items():
         setattr(employee, field, value)
     
     employee.updated_at = datetime.now()
     
+    # 無効化した場合は発行済みのトークンをすべて失効させる（toggle_employee_active と同様）
+    revocation = None
+    if was_active and not employee.is_active:
+        revocation = revoke_user_tokens(db, employee.id, access_token_lifetime())
+    
     db.commit()
+    if revocation is not None:
+        revocation_filter.add(revocation)
     db.refresh(employee)
+    invalidate_employee_directory()
+    invalidate_principal(employee_id)
     
     # 部署情報を含めて返す
     employee = db.query(User).options(joinedload(User.department)).filter(User.id == employee_id).first()
@@ -226,33 +480,41 @@ async def update_employee(
 @router.post("/password/change")
 async def change_password(
     password_data: PasswordChange,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
+    user = await db.get(User, current_user.id)
+    
     # 現在のパスワードを確認
-    if not verify_password(password_data.current_password, current_user.hashed_password):
+    if not await verify_password_async(password_data.current_password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="現在のパスワードが正しくありません"
         )
     
     # 新しいパスワードを設定
-    current_user.hashed_password = get_password_hash(password_data.new_password)
-    current_user.force_password_change = False
-    current_user.updated_at = datetime.now()
+    user.hashed_password = await get_password_hash_async(password_data.new_password)
+    user.force_password_change = False
+    user.updated_at = datetime.now()
     
-    db.commit()
+    # 他の端末のセッションは失効させ、この端末には新しいトークンを発行する
+    revocation = await db.run_sync(revoke_user_tokens, user.id, access_token_lifetime())
+    tokens = create_token_pair(db, user)
     
-    return {"message": "パスワードが正常に変更されました"}
+    await db.commit()
+    revocation_filter.add(revocation)
+    invalidate_principal(user.id)
+    
+    return {"message": "パスワードが正常に変更されました", **tokens}
 
 # 管理者によるパスワードリセット
 @router.post("/password/reset")
 async def reset_password(
     reset_data: AdminPasswordReset,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_admin_user)
 ):
-    employee = db.query(User).filter(User.id == reset_data.user_id).first()
+    employee = await db.get(User, reset_data.user_id)
     
     if not employee:
         raise HTTPException(
@@ -261,20 +523,25 @@ async def reset_password(
         )
     
     # パスワードをリセット
-    employee.hashed_password = get_password_hash(reset_data.new_password)
+    employee.hashed_password = await get_password_hash_async(reset_data.new_password)
     employee.force_password_change = True  # 次回ログイン時に変更を強制
     employee.updated_at = datetime.now()
     
-    db.commit()
+    # 発行済みのトークンをすべて失効させる
+    revocation = await db.run_sync(revoke_user_tokens, employee.id, access_token_lifetime())
+    
+    await db.commit()
+    revocation_filter.add(revocation)
+    invalidate_principal(employee.id)
     
     return {"message": f"{employee.full_name}のパスワードがリセットされました"}
 
 # 従業員の無効化/有効化（管理者のみ）
 @router.put("/{employee_id}/toggle-active")
-async def toggle_employee_active(
+def toggle_employee_active(
     employee_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     employee = db.query(User).filter(User.id == employee_id).first()
     
@@ -294,7 +561,15 @@ async def toggle_employee_active(
     employee.is_active = not employee.is_active
     employee.updated_at = datetime.now()
     
+    # 無効化した場合は発行済みのトークンをすべて失効させ、他のワーカーでも数秒以内に拒否されるようにする
+    revocation = None
+    if not employee.is_active:
+        revocation = revoke_user_tokens(db, employee.id, access_token_lifetime())
+    
     db.commit()
+    if revocation is not None:
+        revocation_filter.add(revocation)
+    invalidate_principal(employee.id)
     
     action = "有効化" if employee.is_active else "無効化"
     return {"message": f"{employee.full_name}を{action}しました", "is_active": employee.is_active}
\ No newline at end of file
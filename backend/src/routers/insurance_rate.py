@@ -5,7 +5,7 @@ from typing import List, Optional
 from datetime import date
 
 from ..database import get_db
-from ..models.models import InsuranceRate, IncomeTaxRate, User
+from ..models.models import InsuranceRate, IncomeTaxRate
 from ..schemas.insurance_rate import (
     InsuranceRateCreate,
     InsuranceRateUpdate,
@@ -14,19 +14,19 @@ from ..schemas.insurance_rate import (
     IncomeTaxRateUpdate,
     IncomeTaxRateResponse
 )
-from ..auth.auth import get_current_admin_user
+from ..auth.auth import get_current_admin_user, Principal
 
 router = APIRouter(prefix="/api/insurance-rates", tags=["insurance_rates"])
 
 
 # 保険料率一覧取得（管理者のみ）
 @router.get("/", response_model=List[InsuranceRateResponse])
-async def get_insurance_rates(
+def get_insurance_rates(
     rate_type: Optional[str] = Query(None, description="料率タイプでフィルタ"),
     prefecture: Optional[str] = Query(None, description="都道府県でフィルタ"),
     active_only: bool = Query(True, description="有効な料率のみ表示"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     query = db.query(InsuranceRate)
     
@@ -53,10 +53,10 @@ async def get_insurance_rates(
 
 # 保険料率作成（管理者のみ）
 @router.post("/", response_model=InsuranceRateResponse)
-async def create_insurance_rate(
+def create_insurance_rate(
     rate_data: InsuranceRateCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     # 同じタイプ・地域・業種で期間が重複する料率がないかチェック
     existing = db.query(InsuranceRate).filter(
@@ -85,11 +85,11 @@ async def create_insurance_rate(
 
 # 保険料率更新（管理者のみ）
 @router.put("/{rate_id}", response_model=InsuranceRateResponse)
-async def update_insurance_rate(
+def update_insurance_rate(
     rate_id: int,
     rate_data: InsuranceRateUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     rate = db.query(InsuranceRate).filter(InsuranceRate.id == rate_id).first()
     
@@ -111,10 +111,10 @@ async def update_insurance_rate(
 
 # 保険料率削除（管理者のみ）
 @router.delete("/{rate_id}")
-async def delete_insurance_rate(
+def delete_insurance_rate(
     rate_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     rate = db.query(InsuranceRate).filter(InsuranceRate.id == rate_id).first()
     
@@ -132,12 +132,12 @@ async def delete_insurance_rate(
 
 # 所得税率一覧取得（管理者のみ）
 @router.get("/income-tax", response_model=List[IncomeTaxRateResponse])
-async def get_income_tax_rates(
+def get_income_tax_rates(
     withholding_type: Optional[str] = Query("monthly", description="源泉徴収タイプ"),
     dependent_count: Optional[int] = Query(0, description="扶養人数"),
     active_only: bool = Query(True, description="有効な税率のみ表示"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     query = db.query(IncomeTaxRate)
     
@@ -164,10 +164,10 @@ async def get_income_tax_rates(
 
 # 所得税率作成（管理者のみ）
 @router.post("/income-tax", response_model=IncomeTaxRateResponse)
-async def create_income_tax_rate(
+def create_income_tax_rate(
     rate_data: IncomeTaxRateCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     new_rate = IncomeTaxRate(**rate_data.dict())
     db.add(new_rate)
@@ -179,11 +179,11 @@ async def create_income_tax_rate(
 
 # 所得税率更新（管理者のみ）
 @router.put("/income-tax/{rate_id}", response_model=IncomeTaxRateResponse)
-async def update_income_tax_rate(
+def update_income_tax_rate(
     rate_id: int,
     rate_data: IncomeTaxRateUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     rate = db.query(IncomeTaxRate).filter(IncomeTaxRate.id == rate_id).first()
     
@@ -205,10 +205,10 @@ async def update_income_tax_rate(
 
 # 所得税率削除（管理者のみ）
 @router.delete("/income-tax/{rate_id}")
-async def delete_income_tax_rate(
+def delete_income_tax_rate(
     rate_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     rate = db.query(IncomeTaxRate).filter(IncomeTaxRate.id == rate_id).first()
     
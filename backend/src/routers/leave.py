@@ -1,47 +1,56 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_, extract
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import func, and_, or_, extract, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from typing import List, Optional
 from datetime import datetime, date, timedelta
 import calendar
 
 from ..database import get_db
-from ..models.models import Leave, LeaveAllocation, User
+from ..models.models import Leave, LeaveAllocation, LeaveConsumption, PaidLeaveBalance, User
 from ..schemas.leave import (
     LeaveCreate,
     LeaveUpdate,
     LeaveResponse,
-    LeaveWithUser,
+    LeaveListResponse,
+    TeamCalendarResponse,
+    ExpiringLeaveItem,
+    LeaveAccrualRun,
+    LeaveAccrualResult,
     LeaveBalance,
     LeaveBalanceUpdate,
     LeaveAllocation as LeaveAllocationSchema,
     LeaveType,
     LeaveStatus
 )
-from ..auth.auth import get_current_active_user, get_current_admin_user
+from ..auth.auth import get_current_active_user, get_current_admin_user, Principal
+from ..working_calendar import get_working_calendar
+from ..pagination import encode_cursor, decode_cursor
+from ..leave_accrual import run_statutory_accrual, add_months
 
 router = APIRouter(prefix="/api/leaves", tags=["leaves"])
 
 # 休暇日数を計算するヘルパー関数
-def calculate_leave_days(start_date: date, end_date: date) -> float:
-    # 平日のみをカウント（土日を除外）
-    days_count = 0
-    current_date = start_date
-    
-    while current_date <= end_date:
-        # 0: 月曜, 1: 火曜, ..., 5: 土曜, 6: 日曜
-        if current_date.weekday() < 5:  # 平日のみ
-            days_count += 1
-        current_date += timedelta(days=1)
-    
-    return days_count
+def calculate_leave_days(
+    db: Session,
+    start_date: date,
+    end_date: date,
+    start_half_day: bool = False,
+    end_half_day: bool = False
+) -> float:
+    # 営業日のみをカウント（土日・祝日を除外、半日休は0.5日）
+    return get_working_calendar(db).business_days(start_date, end_date, start_half_day, end_half_day)
+
+# 休暇期間が指定期間（両端を含む、省略時は無制限）と重なる条件
+def leave_period_overlaps(start_date: Optional[date], end_date: Optional[date]):
+    return Leave.period.overlaps(func.daterange(start_date, end_date, "[]"))
 
 # 休暇申請の作成
 @router.post("", response_model=LeaveResponse)
-async def create_leave_request(
+def create_leave_request(
     leave: LeaveCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     # 開始日が終了日より後の場合はエラー
     if leave.start_date > leave.end_date:
@@ -51,16 +60,24 @@ async def create_leave_request(
         )
     
     # 休暇日数を計算
-    days_count = calculate_leave_days(leave.start_date, leave.end_date)
+    days_count = calculate_leave_days(db, leave.start_date, leave.end_date, leave.start_half_day, leave.end_half_day)
+    
+    if days_count <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="指定された期間に営業日が含まれていません"
+        )
     
-    # 有給休暇の場合、残日数を確認
+    # 有給休暇の場合、申請中の日数を差し引いた残日数を確認（台帳を行ロックして同時申請を直列化）
+    balance = None
     if leave.leave_type == LeaveType.PAID:
-        leave_balance = get_user_leave_balance(db, current_user.id)
+        balance = get_paid_leave_balance(db, current_user.id, for_update=True)
+        available_days = balance.remaining_days - balance.pending_days
         
-        if days_count > leave_balance["remaining_paid_leave"]:
+        if days_count > available_days:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"有給休暇の残日数が不足しています。申請: {days_count}日, 残日数: {leave_balance['remaining_paid_leave']}日"
+                detail=f"有給休暇の残日数が不足しています。申請: {days_count}日, 残日数: {balance.remaining_days}日, 申請中: {balance.pending_days}日"
             )
     
     # 新しい休暇申請を作成
@@ -68,6 +85,8 @@ async def create_leave_request(
         user_id=current_user.id,
         start_date=leave.start_date,
         end_date=leave.end_date,
+        start_half_day=leave.start_half_day,
+        end_half_day=leave.end_half_day,
         days_count=days_count,
         leave_type=leave.leave_type.value if isinstance(leave.leave_type, LeaveType) else leave.leave_type,
         reason=leave.reason,
@@ -75,6 +94,11 @@ async def create_leave_request(
     )
     
     db.add(new_leave)
+    
+    # 申請中の日数を台帳に反映（休暇申請と同じトランザクション）
+    if balance is not None:
+        apply_leave_to_balance(db, balance, new_leave)
+    
     db.commit()
     db.refresh(new_leave)
     
@@ -82,29 +106,21 @@ async def create_leave_request(
 
 # 自分の休暇申請一覧を取得
 @router.get("/my-requests", response_model=List[LeaveResponse])
-async def get_my_leave_requests(
+def get_my_leave_requests(
     status: Optional[str] = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     query = db.query(Leave).filter(Leave.user_id == current_user.id)
     
     if status:
         query = query.filter(Leave.status == status)
     
-    if start_date:
-        query = query.filter(or_(
-            Leave.start_date >= start_date,
-            Leave.end_date >= start_date
-        ))
-    
-    if end_date:
-        query = query.filter(or_(
-            Leave.start_date <= end_date,
-            Leave.end_date <= end_date
-        ))
+    # 期間の重複検索（GiSTインデックスを利用）
+    if start_date or end_date:
+        query = query.filter(leave_period_overlaps(start_date, end_date))
     
     # 日付の降順でソート
     query = query.order_by(Leave.start_date.desc())
@@ -112,22 +128,28 @@ async def get_my_leave_requests(
     return query.all()
 
 # 管理者用：全ユーザーの休暇申請一覧を取得
-@router.get("/admin/all-requests", response_model=List[LeaveWithUser])
-async def get_all_leave_requests(
+# (start_date, id) の降順でキーセットページネーションし、next_cursor で次ページを取得する
+@router.get("/admin/all-requests", response_model=LeaveListResponse)
+def get_all_leave_requests(
     status: Optional[str] = None,
     user_id: Optional[int] = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
+    cursor: Optional[str] = Query(None, description="前ページのnext_cursor"),
+    limit: int = Query(50, ge=1, le=200, description="1ページあたりの件数"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
-    # 基本クエリ
+    # 承認者名は別名のUserを外部結合して同じクエリで取得
+    Admin = aliased(User)
     query = (
         db.query(
             Leave,
-            User.full_name.label("user_full_name")
+            User.full_name.label("user_full_name"),
+            Admin.full_name.label("admin_full_name")
         )
         .join(User, Leave.user_id == User.id)
+        .outerjoin(Admin, Leave.admin_id == Admin.id)
     )
     
     # フィルタリング
@@ -137,51 +159,124 @@ async def get_all_leave_requests(
     if user_id:
         query = query.filter(Leave.user_id == user_id)
     
-    if start_date:
-        query = query.filter(or_(
-            Leave.start_date >= start_date,
-            Leave.end_date >= start_date
-        ))
+    # 期間の重複検索（GiSTインデックスを利用）
+    if start_date or end_date:
+        query = query.filter(leave_period_overlaps(start_date, end_date))
     
-    if end_date:
-        query = query.filter(or_(
-            Leave.start_date <= end_date,
-            Leave.end_date <= end_date
-        ))
+    # カーソル位置より後ろの行のみ
+    cursor_values = decode_cursor(cursor, date.fromisoformat, int)
+    if cursor_values:
+        query = query.filter(tuple_(Leave.start_date, Leave.id) < tuple_(*cursor_values))
     
-    # 日付の降順でソート
-    query = query.order_by(Leave.start_date.desc())
+    # 日付の降順でソート（次ページの有無を判定するため1件多く取得）
+    rows = query.order_by(Leave.start_date.desc(), Leave.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
     
     # 結果を整形
     result = []
-    for leave, user_full_name in query.all():
+    for leave, user_full_name, admin_full_name in rows:
         leave_dict = {
             **vars(leave),
             "user_full_name": user_full_name,
-            "admin_full_name": None
+            "admin_full_name": admin_full_name
         }
         
-        # 管理者名を取得
-        if leave.admin_id:
-            admin = db.query(User).filter(User.id == leave.admin_id).first()
-            if admin:
-                leave_dict["admin_full_name"] = admin.full_name
-        
         # SQLAlchemyの内部属性を削除
         if "_sa_instance_state" in leave_dict:
             del leave_dict["_sa_instance_state"]
         
         result.append(leave_dict)
     
-    return result
+    next_cursor = None
+    if has_more:
+        last_leave = rows[-1][0]
+        next_cursor = encode_cursor(last_leave.start_date, last_leave.id)
+    
+    return {"items": result, "next_cursor": next_cursor}
+
+# 管理者用：部署のチーム休暇カレンダーを取得
+@router.get("/admin/team-calendar", response_model=TeamCalendarResponse)
+def get_team_calendar(
+    start_date: date = Query(..., description="開始日"),
+    end_date: date = Query(..., description="終了日"),
+    department_id: Optional[int] = Query(None, description="部署ID（省略時は全社）"),
+    include_pending: bool = Query(True, description="申請中の休暇を含める"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    if start_date > end_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="開始日は終了日より前である必要があります"
+        )
+    
+    if (end_date - start_date).days > 366:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="期間は1年以内で指定してください"
+        )
+    
+    # 期間と重なる休暇を1回のクエリで取得（GiSTインデックスを利用）
+    statuses = ["approved", "pending"] if include_pending else ["approved"]
+    query = (
+        db.query(Leave, User.full_name.label("user_full_name"))
+        .join(User, Leave.user_id == User.id)
+        .filter(
+            leave_period_overlaps(start_date, end_date),
+            Leave.status.in_(statuses)
+        )
+        .order_by(User.full_name, Leave.start_date)
+    )
+    
+    if department_id:
+        query = query.filter(User.department_id == department_id)
+    
+    # 日ごとに振り分け
+    calendar_days = {}
+    for leave, user_full_name in query.all():
+        current_date = max(leave.start_date, start_date)
+        last_date = min(leave.end_date, end_date)
+        while current_date <= last_date:
+            calendar_days.setdefault(current_date, []).append({
+                "user_id": leave.user_id,
+                "user_full_name": user_full_name,
+                "leave_id": leave.id,
+                "leave_type": leave.leave_type,
+                "status": leave.status,
+                "half_day": (
+                    (leave.start_half_day and current_date == leave.start_date)
+                    or (leave.end_half_day and current_date == leave.end_date)
+                )
+            })
+            current_date += timedelta(days=1)
+    
+    working_calendar = get_working_calendar(db)
+    days = []
+    for i in range((end_date - start_date).days + 1):
+        current_date = start_date + timedelta(days=i)
+        members = calendar_days.get(current_date, [])
+        days.append({
+            "date": current_date,
+            "is_business_day": working_calendar.is_business_day(current_date),
+            "absent_count": len({member["user_id"] for member in members}),
+            "members": members
+        })
+    
+    return {
+        "department_id": department_id,
+        "start_date": start_date,
+        "end_date": end_date,
+        "days": days
+    }
 
 # 管理者用：休暇申請の承認/拒否
 @router.put("/admin/{leave_id}", response_model=LeaveResponse)
-async def update_leave_request(
+def update_leave_request(
     leave_id: int,
     leave_data: LeaveUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     leave = db.query(Leave).filter(Leave.id == leave_id).first()
     
@@ -198,6 +293,10 @@ async def update_leave_request(
             detail=f"この休暇申請は既に {leave.status} 状態です"
         )
     
+    # 残高台帳を行ロックし、変更前の内容を取り消しておく
+    balance = get_paid_leave_balance(db, leave.user_id, for_update=True)
+    apply_leave_to_balance(db, balance, leave, sign=-1)
+    
     # データの更新
     if leave_data.start_date is not None:
         leave.start_date = leave_data.start_date
@@ -205,6 +304,12 @@ async def update_leave_request(
     if leave_data.end_date is not None:
         leave.end_date = leave_data.end_date
     
+    if leave_data.start_half_day is not None:
+        leave.start_half_day = leave_data.start_half_day
+    
+    if leave_data.end_half_day is not None:
+        leave.end_half_day = leave_data.end_half_day
+    
     if leave_data.leave_type is not None:
         leave.leave_type = leave_data.leave_type.value if isinstance(leave_data.leave_type, LeaveType) else leave_data.leave_type
     
@@ -218,12 +323,23 @@ async def update_leave_request(
     if leave_data.admin_comment is not None:
         leave.admin_comment = leave_data.admin_comment
     
-    # 日付が変更された場合は休暇日数を再計算
-    if leave_data.start_date is not None or leave_data.end_date is not None:
-        leave.days_count = calculate_leave_days(leave.start_date, leave.end_date)
+    # 期間が変更された場合や承認時は、最新の祝日で休暇日数を再計算
+    if (
+        leave_data.start_date is not None
+        or leave_data.end_date is not None
+        or leave_data.start_half_day is not None
+        or leave_data.end_half_day is not None
+        or leave.status == "approved"
+    ):
+        leave.days_count = calculate_leave_days(
+            db, leave.start_date, leave.end_date, leave.start_half_day, leave.end_half_day
+        )
     
     leave.updated_at = datetime.now()
     
+    # 変更後の内容を台帳に反映（承認済みの場合は付与から消化、休暇申請と同じトランザクション）
+    apply_leave_to_balance(db, balance, leave)
+    
     db.commit()
     db.refresh(leave)
     
@@ -231,9 +347,9 @@ async def update_leave_request(
 
 # 自分の有給休暇残日数を取得
 @router.get("/my-balance", response_model=LeaveBalance)
-async def get_my_leave_balance(
+def get_my_leave_balance(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     balance = get_user_leave_balance(db, current_user.id)
     
@@ -243,15 +359,17 @@ async def get_my_leave_balance(
         "total_paid_leave": balance["total_paid_leave"],
         "used_paid_leave": balance["used_paid_leave"],
         "remaining_paid_leave": balance["remaining_paid_leave"],
-        "upcoming_paid_leave": balance["upcoming_paid_leave"]
+        "upcoming_paid_leave": balance["upcoming_paid_leave"],
+        "expiring_paid_leave": balance["expiring_paid_leave"],
+        "next_expiry_date": balance["next_expiry_date"]
     }
 
 # 管理者用：ユーザーの有給休暇残日数を取得
 @router.get("/admin/user-balance/{user_id}", response_model=LeaveBalance)
-async def get_user_leave_balance_admin(
+def get_user_leave_balance_admin(
     user_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     user = db.query(User).filter(User.id == user_id).first()
     
@@ -269,15 +387,17 @@ async def get_user_leave_balance_admin(
         "total_paid_leave": balance["total_paid_leave"],
         "used_paid_leave": balance["used_paid_leave"],
         "remaining_paid_leave": balance["remaining_paid_leave"],
-        "upcoming_paid_leave": balance["upcoming_paid_leave"]
+        "upcoming_paid_leave": balance["upcoming_paid_leave"],
+        "expiring_paid_leave": balance["expiring_paid_leave"],
+        "next_expiry_date": balance["next_expiry_date"]
     }
 
 # 管理者用：有給休暇の付与
 @router.post("/admin/allocate", response_model=LeaveAllocationSchema)
-async def allocate_leave(
+def allocate_leave(
     allocation_data: LeaveBalanceUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     user = db.query(User).filter(User.id == allocation_data.user_id).first()
     
@@ -287,6 +407,9 @@ async def allocate_leave(
             detail="指定されたユーザーが見つかりません"
         )
     
+    # 残高台帳を行ロック
+    balance = get_paid_leave_balance(db, allocation_data.user_id, for_update=True)
+    
     # 新しい有給休暇付与を作成
     allocation = LeaveAllocation(
         user_id=allocation_data.user_id,
@@ -297,6 +420,15 @@ async def allocate_leave(
     )
     
     db.add(allocation)
+    
+    # 有効期限内の付与を台帳に反映（付与と同じトランザクション）
+    if allocation.expiry_date is None or allocation.expiry_date >= date.today():
+        balance.allocated_days += allocation.allocated_days
+        if allocation.expiry_date and (
+            balance.next_expiry_date is None or allocation.expiry_date < balance.next_expiry_date
+        ):
+            balance.next_expiry_date = allocation.expiry_date
+    
     db.commit()
     db.refresh(allocation)
     
@@ -308,44 +440,356 @@ async def allocate_leave(
         "effective_date": allocation.effective_date,
         "expiry_date": allocation.expiry_date,
         "reason": allocation.reason,
+        "source": allocation.source,
+        "used_days": allocation.used_days,
         "created_at": allocation.created_at,
         "updated_at": allocation.updated_at
     }
 
-# ユーザーの有給休暇残日数を計算するヘルパー関数
-def get_user_leave_balance(db: Session, user_id: int) -> dict:
-    # 付与された全有給休暇日数
-    allocations = db.query(LeaveAllocation).filter(
-        LeaveAllocation.user_id == user_id,
-        # 有効期限が過ぎていないか期限なし
-        or_(
-            LeaveAllocation.expiry_date >= date.today(),
+# 管理者用：指定日数以内に失効する有給休暇の一覧
+@router.get("/admin/expiring", response_model=List[ExpiringLeaveItem])
+def get_expiring_leave(
+    within_days: int = Query(31, ge=1, le=366),
+    department_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    today = date.today()
+    remaining = LeaveAllocation.allocated_days - LeaveAllocation.used_days
+    
+    # 残日数のある付与の部分インデックスを失効日の範囲で走査する
+    query = (
+        db.query(
+            User.id,
+            User.full_name,
+            func.sum(remaining).label("expiring_days"),
+            func.min(LeaveAllocation.expiry_date).label("expiry_date")
+        )
+        .join(User, User.id == LeaveAllocation.user_id)
+        .filter(
+            LeaveAllocation.used_days < LeaveAllocation.allocated_days,
+            LeaveAllocation.expiry_date >= today,
+            LeaveAllocation.expiry_date <= today + timedelta(days=within_days),
+            User.is_active == True
+        )
+    )
+    
+    if department_id is not None:
+        query = query.filter(User.department_id == department_id)
+    
+    rows = (
+        query
+        .group_by(User.id, User.full_name)
+        .order_by(func.min(LeaveAllocation.expiry_date).asc(), User.id.asc())
+        .all()
+    )
+    
+    return [
+        {
+            "user_id": user_id,
+            "user_full_name": full_name,
+            "expiring_days": expiring_days,
+            "expiry_date": expiry_date
+        }
+        for user_id, full_name, expiring_days, expiry_date in rows
+    ]
+
+# 管理者用：勤続年数に応じた法定有給休暇の一括付与
+@router.post("/admin/accrual/run", response_model=LeaveAccrualResult)
+def run_leave_accrual(
+    accrual_data: LeaveAccrualRun,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    result = run_statutory_accrual(
+        db,
+        as_of=accrual_data.as_of,
+        dry_run=accrual_data.dry_run,
+        start_date=accrual_data.start_date
+    )
+    
+    if not accrual_data.dry_run:
+        db.commit()
+    
+    return {
+        "as_of": result.as_of,
+        "dry_run": accrual_data.dry_run,
+        "granted_count": result.granted_count,
+        "granted_days": result.granted_days,
+        "affected_user_ids": result.affected_user_ids,
+        "skipped_user_ids": result.skipped_user_ids
+    }
+
+# 有給休暇残高台帳の各列をソーステーブル（LeaveAllocation, Leave）から集計するクエリを返すヘルパー関数
+def paid_leave_balance_source(db: Session, user_ids: Optional[List[int]] = None):
+    today = date.today()
+    
+    # 有効期限が過ぎていないか期限なしの付与
+    allocations = (
+        db.query(
+            LeaveAllocation.user_id.label("user_id"),
+            func.sum(LeaveAllocation.allocated_days).label("allocated_days"),
+            func.sum(LeaveAllocation.used_days).label("used_days"),
+            func.min(LeaveAllocation.expiry_date).label("next_expiry_date")
+        )
+        .filter(or_(
+            LeaveAllocation.expiry_date >= today,
             LeaveAllocation.expiry_date == None
+        ))
+        .group_by(LeaveAllocation.user_id)
+    )
+    
+    # 申請中の有給休暇（承認済みの日数は付与ごとの消化日数 used_days から集計する）
+    leaves = (
+        db.query(
+            Leave.user_id.label("user_id"),
+            func.sum(Leave.days_count).label("pending_days")
         )
-    ).all()
+        .filter(
+            Leave.leave_type == "paid",
+            Leave.status == "pending"
+        )
+        .group_by(Leave.user_id)
+    )
     
-    total_allocated = sum(alloc.allocated_days for alloc in allocations)
+    users = db.query(User.id)
+    if user_ids is not None:
+        allocations = allocations.filter(LeaveAllocation.user_id.in_(user_ids))
+        leaves = leaves.filter(Leave.user_id.in_(user_ids))
+        users = users.filter(User.id.in_(user_ids))
+    
+    allocations = allocations.subquery()
+    leaves = leaves.subquery()
+    
+    return (
+        users
+        .outerjoin(allocations, allocations.c.user_id == User.id)
+        .outerjoin(leaves, leaves.c.user_id == User.id)
+        .add_columns(
+            func.coalesce(allocations.c.allocated_days, 0).label("allocated_days"),
+            func.coalesce(allocations.c.used_days, 0).label("used_days"),
+            func.coalesce(leaves.c.pending_days, 0).label("pending_days"),
+            allocations.c.next_expiry_date.label("next_expiry_date"),
+            func.now().label("updated_at")
+        )
+    )
+
+# 有給休暇残高台帳をソーステーブルから再集計するヘルパー関数（書き込み処理と定期ジョブから呼ぶ）
+# user_ids を省略した場合は全ユーザーを1回のUPSERTで再集計する
+def rebuild_paid_leave_balances(db: Session, user_ids: Optional[List[int]] = None) -> None:
+    source = paid_leave_balance_source(db, user_ids)
+    
+    stmt = pg_insert(PaidLeaveBalance).from_select(
+        ["user_id", "allocated_days", "used_days", "pending_days", "next_expiry_date", "updated_at"],
+        source.statement
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PaidLeaveBalance.user_id],
+        set_={
+            "allocated_days": stmt.excluded.allocated_days,
+            "used_days": stmt.excluded.used_days,
+            "pending_days": stmt.excluded.pending_days,
+            "next_expiry_date": stmt.excluded.next_expiry_date,
+            "updated_at": stmt.excluded.updated_at
+        }
+    )
+    db.execute(stmt)
+
+# 台帳が未作成、または集計済みの付与が有効期限切れになっているか
+def is_paid_leave_balance_stale(balance: Optional[PaidLeaveBalance]) -> bool:
+    return balance is None or bool(balance.next_expiry_date and balance.next_expiry_date < date.today())
+
+# ユーザーの有給休暇残高台帳を取得するヘルパー関数（書き込み処理用）
+# 台帳が未作成、または集計済みの付与が有効期限切れになった場合のみ再集計する
+def get_paid_leave_balance(db: Session, user_id: int, for_update: bool = False) -> PaidLeaveBalance:
+    query = db.query(PaidLeaveBalance).filter(PaidLeaveBalance.user_id == user_id)
+    if for_update:
+        query = query.with_for_update()
+    
+    balance = query.first()
+    if is_paid_leave_balance_stale(balance):
+        rebuild_paid_leave_balances(db, [user_id])
+        balance = query.populate_existing().first()
+    
+    if balance is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="指定されたユーザーが見つかりません"
+        )
     
-    # 使用済み有給休暇日数（承認済みのみ）
-    used_leaves = db.query(func.sum(Leave.days_count)).filter(
-        Leave.user_id == user_id,
-        Leave.leave_type == "paid",
-        Leave.status == "approved"
-    ).scalar() or 0
+    return balance
+
+# ユーザーの有給休暇残高を読み取るヘルパー関数（参照用。行ロック・台帳の更新はしない）
+# 台帳が未作成・有効期限切れの場合はソーステーブルから集計した値を保存せずに返す
+def read_paid_leave_balance(db: Session, user_id: int) -> PaidLeaveBalance:
+    balance = db.query(PaidLeaveBalance).filter(PaidLeaveBalance.user_id == user_id).first()
+    if not is_paid_leave_balance_stale(balance):
+        return balance
+    
+    row = paid_leave_balance_source(db, [user_id]).first()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="指定されたユーザーが見つかりません"
+        )
+    
+    return PaidLeaveBalance(
+        user_id=user_id,
+        allocated_days=row.allocated_days,
+        used_days=row.used_days,
+        pending_days=row.pending_days,
+        next_expiry_date=row.next_expiry_date,
+        updated_at=row.updated_at
+    )
+
+# 承認済みの有給休暇を、取得日に有効な付与へ有効期限の近い順（FIFO）に割り当てるヘルパー関数
+# 有効期限内の付与から消化した日数を残高台帳に加算する
+def consume_leave_allocations(db: Session, balance: PaidLeaveBalance, leave: Leave) -> None:
+    allocations = (
+        db.query(LeaveAllocation)
+        .filter(
+            LeaveAllocation.user_id == leave.user_id,
+            LeaveAllocation.effective_date <= leave.start_date,
+            or_(
+                LeaveAllocation.expiry_date >= leave.start_date,
+                LeaveAllocation.expiry_date == None
+            ),
+            LeaveAllocation.used_days < LeaveAllocation.allocated_days
+        )
+        .order_by(
+            LeaveAllocation.expiry_date.asc().nulls_last(),
+            LeaveAllocation.effective_date.asc(),
+            LeaveAllocation.id.asc()
+        )
+        .with_for_update()
+        .all()
+    )
+    
+    available = sum(allocation.remaining_days for allocation in allocations)
+    if leave.days_count > available:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"有給休暇の残日数が不足しています。申請: {leave.days_count}日, 取得日時点の残日数: {available}日"
+        )
+    
+    today = date.today()
+    remaining = leave.days_count
+    for allocation in allocations:
+        if remaining <= 0:
+            break
+        
+        days = min(remaining, allocation.remaining_days)
+        allocation.used_days += days
+        db.add(LeaveConsumption(leave=leave, allocation=allocation, days=days))
+        
+        if allocation.expiry_date is None or allocation.expiry_date >= today:
+            balance.used_days += days
+        remaining -= days
+
+# 有給休暇の消化明細を削除し、付与と残高台帳から消化日数を戻すヘルパー関数
+def release_leave_allocations(db: Session, balance: PaidLeaveBalance, leave: Leave) -> None:
+    consumptions = (
+        db.query(LeaveConsumption, LeaveAllocation)
+        .join(LeaveAllocation, LeaveAllocation.id == LeaveConsumption.allocation_id)
+        .filter(LeaveConsumption.leave_id == leave.id)
+        .with_for_update()
+        .all()
+    )
     
-    # 申請中の有給休暇日数
-    pending_leaves = db.query(func.sum(Leave.days_count)).filter(
-        Leave.user_id == user_id,
-        Leave.leave_type == "paid",
-        Leave.status == "pending"
-    ).scalar() or 0
+    today = date.today()
+    for consumption, allocation in consumptions:
+        allocation.used_days -= consumption.days
+        if allocation.expiry_date is None or allocation.expiry_date >= today:
+            balance.used_days -= consumption.days
+        db.delete(consumption)
+
+# 休暇申請1件分を残高台帳に反映するヘルパー関数（sign=-1 で取り消し）
+def apply_leave_to_balance(db: Session, balance: PaidLeaveBalance, leave: Leave, sign: int = 1) -> None:
+    if leave.leave_type != "paid":
+        return
+    
+    if leave.status == "approved":
+        if sign > 0:
+            consume_leave_allocations(db, balance, leave)
+        else:
+            release_leave_allocations(db, balance, leave)
+    elif leave.status == "pending":
+        balance.pending_days += sign * leave.days_count
+
+# 承認済みの有給休暇を付与へ割り当て直すヘルパー関数（既存データの移行・不整合の修復用）
+# 付与と休暇をユーザー単位でまとめて読み込み、取得日順にFIFOで再計算する
+def rebuild_leave_consumptions(db: Session, user_ids: Optional[List[int]] = None) -> int:
+    allocation_query = db.query(LeaveAllocation)
+    leave_query = db.query(Leave).filter(Leave.leave_type == "paid", Leave.status == "approved")
+    delete_query = db.query(LeaveConsumption)
+    if user_ids is not None:
+        allocation_query = allocation_query.filter(LeaveAllocation.user_id.in_(user_ids))
+        leave_query = leave_query.filter(Leave.user_id.in_(user_ids))
+        delete_query = delete_query.filter(
+            LeaveConsumption.leave_id.in_(db.query(Leave.id).filter(Leave.user_id.in_(user_ids)))
+        )
     
-    # 残り有給休暇日数
-    remaining_leave = total_allocated - float(used_leaves)
+    delete_query.delete(synchronize_session=False)
+    
+    allocations_by_user = {}
+    for allocation in allocation_query.order_by(
+        LeaveAllocation.expiry_date.asc().nulls_last(),
+        LeaveAllocation.effective_date.asc(),
+        LeaveAllocation.id.asc()
+    ):
+        allocation.used_days = 0
+        allocations_by_user.setdefault(allocation.user_id, []).append(allocation)
+    
+    unassigned = 0
+    consumptions = []
+    for leave in leave_query.order_by(Leave.start_date.asc(), Leave.id.asc()):
+        remaining = leave.days_count
+        for allocation in allocations_by_user.get(leave.user_id, []):
+            if remaining <= 0:
+                break
+            if allocation.effective_date > leave.start_date:
+                continue
+            if allocation.expiry_date is not None and allocation.expiry_date < leave.start_date:
+                continue
+            
+            days = min(remaining, allocation.remaining_days)
+            if days <= 0:
+                continue
+            allocation.used_days += days
+            consumptions.append({"leave_id": leave.id, "allocation_id": allocation.id, "days": days})
+            remaining -= days
+        
+        if remaining > 0:
+            unassigned += 1
+    
+    if consumptions:
+        db.bulk_insert_mappings(LeaveConsumption, consumptions)
+    db.flush()
+    
+    # 付与に割り当てられなかった承認済み休暇の件数
+    return unassigned
+
+# ユーザーの有給休暇残日数を取得するヘルパー関数
+# 失効予定日数は (user_id, expiry_date) インデックスで1か月以内に失効する付与だけを集計する
+def get_user_leave_balance(db: Session, user_id: int) -> dict:
+    balance = read_paid_leave_balance(db, user_id)
+    
+    today = date.today()
+    expiring = (
+        db.query(func.coalesce(func.sum(LeaveAllocation.allocated_days - LeaveAllocation.used_days), 0))
+        .filter(
+            LeaveAllocation.user_id == user_id,
+            LeaveAllocation.expiry_date >= today,
+            LeaveAllocation.expiry_date <= add_months(today, 1)
+        )
+        .scalar()
+    )
     
     return {
-        "total_paid_leave": total_allocated,
-        "used_paid_leave": float(used_leaves),
-        "remaining_paid_leave": remaining_leave,
-        "upcoming_paid_leave": float(pending_leaves)
-    } 
\ No newline at end of file
+        "total_paid_leave": balance.allocated_days,
+        "used_paid_leave": balance.used_days,
+        "remaining_paid_leave": balance.remaining_days,
+        "upcoming_paid_leave": balance.pending_days,
+        "expiring_paid_leave": expiring,
+        "next_expiry_date": balance.next_expiry_date
+    }
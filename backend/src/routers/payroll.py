@@ -12,17 +12,17 @@ import json
 from ..database import get_db
 from ..models.models import User, Attendance, PayrollSetting
 from ..schemas.attendance import MonthlyAttendanceStats
-from ..auth.auth import get_current_active_user, get_current_admin_user
+from ..auth.auth import get_current_active_user_record, get_current_admin_user, Principal
 
 router = APIRouter(prefix="/api/payroll", tags=["payroll"])
 
 # 給与明細を取得する（ユーザー自身）
 @router.get("/my-payslip", response_model=MonthlyAttendanceStats)
-async def get_my_payslip(
+def get_my_payslip(
     year: int = Query(..., description="年（例：2023）"),
     month: int = Query(..., description="月（1-12）"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user_record)
 ):
     # 月の開始日と終了日を計算
     start_date = date(year, month, 1)
@@ -67,11 +67,11 @@ async def get_my_payslip(
 
 # CSVで給与明細をダウンロードする（ユーザー自身）
 @router.get("/my-payslip/download")
-async def download_my_payslip(
+def download_my_payslip(
     year: int = Query(..., description="年（例：2023）"),
     month: int = Query(..., description="月（1-12）"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user_record)
 ):
     # 月の開始日と終了日を計算
     start_date = date(year, month, 1)
@@ -157,11 +157,11 @@ async def download_my_payslip(
 
 # 管理者用：全従業員の給与明細を取得
 @router.get("/admin/payslips", response_model=List[MonthlyAttendanceStats])
-async def get_all_payslips(
+def get_all_payslips(
     year: int = Query(..., description="年（例：2023）"),
     month: int = Query(..., description="月（1-12）"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     # 月の開始日と終了日を計算
     start_date = date(year, month, 1)
@@ -213,11 +213,11 @@ async def get_all_payslips(
 
 # 管理者用：全従業員の給与明細をCSVでダウンロード
 @router.get("/admin/payslips/download")
-async def download_all_payslips(
+def download_all_payslips(
     year: int = Query(..., description="年（例：2023）"),
     month: int = Query(..., description="月（1-12）"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     # 月の開始日と終了日を計算
     start_date = date(year, month, 1)
@@ -19,17 +19,19 @@ from ..schemas.payslip import (
     PayslipPaymentRequest,
     PayslipDetailCreate
 )
-from ..auth.auth import get_current_active_user, get_current_admin_user
+from ..auth.auth import get_current_active_user_record, get_current_admin_user, Principal
+from ..department_tree import in_department_subtree
+from ..employee_directory import get_employee_directory
 
 router = APIRouter(prefix="/api/payslips", tags=["payslips"])
 
 # 自分の給与明細一覧取得
 @router.get("/my-payslips", response_model=PayslipListResponse)
-async def get_my_payslips(
+def get_my_payslips(
     year: Optional[int] = Query(None, description="年"),
     status: Optional[str] = Query(None, description="ステータス"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user_record)
 ):
     query = db.query(Payslip).filter(Payslip.user_id == current_user.id)
     
@@ -53,11 +55,11 @@ async def get_my_payslips(
 
 # 特定の給与明細取得
 @router.get("/my-payslips/{year}/{month}", response_model=PayslipResponse)
-async def get_my_payslip(
+def get_my_payslip(
     year: int,
     month: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user_record)
 ):
     payslip = db.query(Payslip).options(joinedload(Payslip.details)).filter(
         Payslip.user_id == current_user.id,
@@ -80,15 +82,17 @@ async def get_my_payslip(
 
 # 管理者用：全従業員の給与明細一覧
 @router.get("/admin", response_model=PayslipListResponse)
-async def get_all_payslips(
+def get_all_payslips(
     year: Optional[int] = Query(None, description="年"),
     month: Optional[int] = Query(None, description="月"),
     user_id: Optional[int] = Query(None, description="ユーザーID"),
     status: Optional[str] = Query(None, description="ステータス"),
+    department_id: Optional[int] = Query(None, description="部署ID（配下の部署を含む）"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
-    query = db.query(Payslip).options(joinedload(Payslip.user))
+    # ユーザー情報は従業員ディレクトリから補完するため読み込まない
+    query = db.query(Payslip)
     
     if year:
         query = query.filter(Payslip.year == year)
@@ -102,25 +106,32 @@ async def get_all_payslips(
     if status:
         query = query.filter(Payslip.status == status)
     
+    # 配下の部署を含めて絞り込む
+    if department_id:
+        query = query.join(User, Payslip.user_id == User.id).filter(
+            in_department_subtree(User.department_id, department_id)
+        )
+    
     query = query.order_by(Payslip.year.desc(), Payslip.month.desc(), Payslip.user_id)
     
     payslips = query.all()
     
     # ユーザー情報を追加
+    directory = get_employee_directory(db, {payslip.user_id for payslip in payslips})
     for payslip in payslips:
-        user = payslip.user
-        payslip.user_name = user.full_name
-        payslip.employee_code = user.employee_code
-        payslip.department_name = user.department.name if user.department else None
+        entry = directory.get(payslip.user_id)
+        payslip.user_name = entry.full_name if entry else None
+        payslip.employee_code = entry.employee_code if entry else None
+        payslip.department_name = entry.department_name if entry else None
     
     return PayslipListResponse(items=payslips, total=len(payslips))
 
 # 給与計算実行（管理者のみ）
 @router.post("/admin/calculate", response_model=PayslipCalculateResponse)
-async def calculate_payslips(
+def calculate_payslips(
     request: PayslipCalculateRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     created_count = 0
     updated_count = 0
@@ -342,11 +353,11 @@ async def calculate_payslips(
 
 # 給与明細の更新（管理者のみ）
 @router.put("/{payslip_id}", response_model=PayslipResponse)
-async def update_payslip(
+def update_payslip(
     payslip_id: int,
     update_data: PayslipUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     payslip = db.query(Payslip).filter(Payslip.id == payslip_id).first()
     
@@ -393,10 +404,10 @@ async def update_payslip(
 
 # 給与明細の確定（管理者のみ）
 @router.post("/admin/confirm")
-async def confirm_payslips(
+def confirm_payslips(
     request: PayslipConfirmRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     confirmed_count = 0
     
@@ -415,10 +426,10 @@ async def confirm_payslips(
 
 # 給与支払い記録（管理者のみ）
 @router.post("/admin/payment")
-async def record_payment(
+def record_payment(
     request: PayslipPaymentRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     paid_count = 0
     
@@ -1,22 +1,36 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
+from sqlalchemy import func, and_, case, literal, tuple_, cast, select, Date, Float
 from typing import List, Optional
 from datetime import datetime, date, timedelta
 import calendar
+import html
+import re
 
 from ..database import get_db
-from ..models.models import Report, User
-from ..schemas.report import ReportCreate, ReportUpdate, ReportResponse, ReportWithUser
-from ..auth.auth import get_current_active_user, get_current_admin_user
+from ..models.models import Attendance, Department, Report, User
+from ..schemas.report import (
+    ReportCreate,
+    ReportUpdate,
+    ReportResponse,
+    ReportWithUser,
+    ReportSummaryListResponse,
+    ReportComplianceResponse,
+    ReportSearchResponse
+)
+from ..auth.auth import get_current_active_user, get_current_admin_user, Principal
+from ..pagination import encode_cursor, decode_cursor
+from ..search import escape_like
+from ..employee_directory import get_employee_directory
 
 router = APIRouter(prefix="/api/reports", tags=["reports"])
 
 # 日報の作成
 @router.post("", response_model=ReportResponse)
-async def create_report(
+def create_report(
     report: ReportCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     # 同じ日の日報が既に存在するか確認
     existing_report = db.query(Report).filter(
@@ -48,11 +62,11 @@ async def create_report(
 
 # 日報の更新
 @router.put("/{report_id}", response_model=ReportResponse)
-async def update_report(
+def update_report(
     report_id: int,
     report_data: ReportUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     # 日報を取得
     report = db.query(Report).filter(Report.id == report_id).first()
@@ -92,11 +106,11 @@ async def update_report(
 
 # 自分の日報一覧を取得
 @router.get("/my-reports", response_model=List[ReportResponse])
-async def get_my_reports(
+def get_my_reports(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     query = db.query(Report).filter(Report.user_id == current_user.id)
     
@@ -113,10 +127,10 @@ async def get_my_reports(
 
 # 特定の日の日報を取得
 @router.get("/date/{report_date}", response_model=ReportResponse)
-async def get_report_by_date(
+def get_report_by_date(
     report_date: date,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     report = db.query(Report).filter(
         Report.user_id == current_user.id,
@@ -131,23 +145,74 @@ async def get_report_by_date(
     
     return report
 
-# 管理者用：全ユーザーの日報を取得
-@router.get("/admin/all-reports", response_model=List[ReportWithUser])
-async def get_all_reports(
+# 一覧に表示する本文の先頭文字数
+REPORT_PREVIEW_CHARS = 100
+
+# 日報一覧を (report_date, id) の降順でキーセットページネーションするヘルパー関数
+# 本文は先頭 REPORT_PREVIEW_CHARS 文字だけをDB側で切り出し、全文は詳細取得時のみ読み込む
+def paginate_report_summaries(db: Session, query, cursor: Optional[str], limit: int) -> dict:
+    cursor_values = decode_cursor(cursor, date.fromisoformat, int)
+    if cursor_values:
+        query = query.filter(tuple_(Report.report_date, Report.id) < tuple_(*cursor_values))
+    
+    # 日付の降順でソート（次ページの有無を判定するため1件多く取得）
+    rows = query.order_by(Report.report_date.desc(), Report.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    # 氏名は従業員ディレクトリから補完する
+    directory = get_employee_directory(db, {row.user_id for row in rows})
+    
+    result = [
+        {
+            "id": row.id,
+            "user_id": row.user_id,
+            "user_full_name": directory.full_name(row.user_id),
+            "report_date": row.report_date,
+            "content_preview": row.content_preview,
+            "content_truncated": row.content_length > REPORT_PREVIEW_CHARS,
+            "has_issues": row.has_issues,
+            "created_at": row.created_at,
+            "updated_at": row.updated_at
+        }
+        for row in rows
+    ]
+    
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(rows[-1].report_date, rows[-1].id)
+    
+    return {"items": result, "next_cursor": next_cursor}
+
+# 日報一覧用の列（本文は先頭のみ、氏名は結合せずディレクトリから補完）
+def report_summary_query(db: Session):
+    return (
+        db.query(
+            Report.id,
+            Report.user_id,
+            Report.report_date,
+            func.substr(Report.content, 1, REPORT_PREVIEW_CHARS).label("content_preview"),
+            func.length(Report.content).label("content_length"),
+            and_(Report.issues != None, Report.issues != "").label("has_issues"),
+            Report.created_at,
+            Report.updated_at
+        )
+    )
+
+# 管理者用：全ユーザーの日報一覧を取得
+# (report_date, id) の降順でキーセットページネーションし、next_cursor で次ページを取得する
+@router.get("/admin/all-reports", response_model=ReportSummaryListResponse)
+def get_all_reports(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
     user_id: Optional[int] = None,
+    cursor: Optional[str] = Query(None, description="前ページのnext_cursor"),
+    limit: int = Query(50, ge=1, le=200, description="1ページあたりの件数"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     # 基本クエリ
-    query = (
-        db.query(
-            Report,
-            User.full_name.label("user_full_name")
-        )
-        .join(User, Report.user_id == User.id)
-    )
+    query = report_summary_query(db)
     
     # フィルタリング
     if start_date:
@@ -159,35 +224,21 @@ async def get_all_reports(
     if user_id:
         query = query.filter(Report.user_id == user_id)
     
-    # 日付の降順、ユーザーIDの昇順でソート
-    query = query.order_by(Report.report_date.desc(), User.id)
-    
-    # 結果を整形
-    result = []
-    for report, user_full_name in query.all():
-        report_dict = {
-            **vars(report),
-            "user_full_name": user_full_name
-        }
-        # SQLAlchemyの内部属性を削除
-        if "_sa_instance_state" in report_dict:
-            del report_dict["_sa_instance_state"]
-        
-        result.append(report_dict)
-    
-    return result
+    return paginate_report_summaries(db, query, cursor, limit)
 
 # 管理者用：特定ユーザーの日報一覧を取得
-@router.get("/admin/user/{user_id}", response_model=List[ReportWithUser])
-async def get_user_reports(
+@router.get("/admin/user/{user_id}", response_model=ReportSummaryListResponse)
+def get_user_reports(
     user_id: int,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
+    cursor: Optional[str] = Query(None, description="前ページのnext_cursor"),
+    limit: int = Query(50, ge=1, le=200, description="1ページあたりの件数"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     # ユーザーの存在確認
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.query(User.id).filter(User.id == user_id).first()
     
     if not user:
         raise HTTPException(
@@ -196,13 +247,191 @@ async def get_user_reports(
         )
     
     # 基本クエリ
+    query = report_summary_query(db).filter(Report.user_id == user_id)
+    
+    # フィルタリング
+    if start_date:
+        query = query.filter(Report.report_date >= start_date)
+    
+    if end_date:
+        query = query.filter(Report.report_date <= end_date)
+    
+    return paginate_report_summaries(db, query, cursor, limit)
+
+# 日報提出状況の集計期間の上限（日数）
+COMPLIANCE_MAX_DAYS = 92
+
+# 管理者用：部署・日付ごとの出勤者数と日報提出数、未提出者の一覧
+# 出勤した (ユーザー, 日付) に日報を外部結合し、日報のない行（アンチジョイン）を1クエリで集計する
+@router.get("/admin/compliance", response_model=ReportComplianceResponse)
+def get_report_compliance(
+    start_date: date,
+    end_date: date,
+    department_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    if start_date > end_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="開始日は終了日より前である必要があります"
+        )
+    
+    if (end_date - start_date).days >= COMPLIANCE_MAX_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"集計期間は{COMPLIANCE_MAX_DAYS}日以内で指定してください"
+        )
+    
+    # 出勤した (ユーザー, 日付)。check_in_time のインデックスで期間を絞り込む
+    attended = (
+        select(
+            Attendance.user_id.label("user_id"),
+            cast(Attendance.check_in_time, Date).label("work_date")
+        )
+        .where(
+            Attendance.check_in_time >= datetime.combine(start_date, datetime.min.time()),
+            Attendance.check_in_time < datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+        )
+        .distinct()
+        .subquery()
+    )
+    
+    missing = Report.id == None
     query = (
         db.query(
-            Report,
-            User.full_name.label("user_full_name")
+            User.department_id,
+            Department.name.label("department_name"),
+            attended.c.work_date,
+            func.count().label("attended_count"),
+            func.count(Report.id).label("submitted_count"),
+            func.json_agg(
+                func.json_build_object("user_id", User.id, "user_full_name", User.full_name)
+            ).filter(missing).label("missing")
+        )
+        .select_from(attended)
+        .join(User, User.id == attended.c.user_id)
+        .outerjoin(Department, Department.id == User.department_id)
+        .outerjoin(Report, and_(
+            Report.user_id == attended.c.user_id,
+            Report.report_date == attended.c.work_date
+        ))
+    )
+    
+    if department_id is not None:
+        query = query.filter(User.department_id == department_id)
+    
+    rows = (
+        query
+        .group_by(User.department_id, Department.name, attended.c.work_date)
+        .order_by(attended.c.work_date, User.department_id)
+        .all()
+    )
+    
+    days = []
+    attended_total = 0
+    submitted_total = 0
+    for row in rows:
+        attended_total += row.attended_count
+        submitted_total += row.submitted_count
+        days.append({
+            "department_id": row.department_id,
+            "department_name": row.department_name,
+            "date": row.work_date,
+            "attended_count": row.attended_count,
+            "submitted_count": row.submitted_count,
+            "missing": sorted(row.missing or [], key=lambda member: member["user_id"])
+        })
+    
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "attended_total": attended_total,
+        "submitted_total": submitted_total,
+        "submission_rate": round(submitted_total / attended_total, 4) if attended_total else None,
+        "days": days
+    }
+
+# 検索結果のハイライト対象とスニペットの長さ
+SEARCH_HIGHLIGHT_FIELDS = ("content", "tasks_completed", "issues")
+SNIPPET_CONTEXT_CHARS = 40
+
+# 最初の一致箇所の前後だけをDB側で切り出す列を返すヘルパー関数（本文全体は読み込まない）
+# (抜粋, 抜粋の開始位置, 列の文字数) の3列。どのキーワードも含まない場合、抜粋は NULL になる
+def snippet_columns(field: str, keywords: List[str]):
+    column = getattr(Report, field)
+    lowered = func.lower(column)
+    # 同じ位置で一致した場合はハイライトと同じく長いキーワードを優先する
+    ordered = sorted(set(keywords), key=len, reverse=True)
+    positions = [func.nullif(func.strpos(lowered, func.lower(literal(keyword))), 0) for keyword in ordered]
+    position = func.least(*positions)
+    match_length = case(
+        *[(keyword_position == position, len(keyword)) for keyword, keyword_position in zip(ordered, positions)]
+    )
+    start = func.greatest(position - SNIPPET_CONTEXT_CHARS, 1)
+    length = position - start + match_length + SNIPPET_CONTEXT_CHARS
+    return (
+        func.substr(column, start, length).label(f"{field}_excerpt"),
+        start.label(f"{field}_start"),
+        func.length(column).label(f"{field}_length")
+    )
+
+# 切り出した抜粋のキーワードを <mark> で囲んだスニペットを作成するヘルパー関数
+def build_snippet(excerpt: Optional[str], start: int, text_length: int, pattern: "re.Pattern") -> Optional[str]:
+    if not excerpt:
+        return None
+    
+    snippet = ""
+    position = 0
+    for hit in pattern.finditer(excerpt):
+        snippet += html.escape(excerpt[position:hit.start()]) + "<mark>" + html.escape(hit.group()) + "</mark>"
+        position = hit.end()
+    snippet += html.escape(excerpt[position:])
+    
+    end = start + len(excerpt) - 1
+    return ("…" if start > 1 else "") + snippet + ("…" if end < text_length else "")
+
+# 管理者用：日報のキーワード検索
+# 空白区切りの全キーワードを含む日報を pg_trgm のGINインデックスで絞り込み、類似度または日付順に返す
+@router.get("/admin/search", response_model=ReportSearchResponse)
+def search_reports(
+    q: str = Query(..., min_length=1, max_length=200),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    user_id: Optional[int] = None,
+    department_id: Optional[int] = None,
+    sort: str = Query("relevance", pattern="^(relevance|date)$"),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    keywords = q.split()
+    if not keywords:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="検索キーワードを指定してください"
+        )
+    
+    # word_similarity は real（単精度）を返すため、倍精度に変換してから並び替え・カーソル比較に使う
+    # （単精度のままではカーソルに保存した値と比較時に一致せず、同じ類似度の行が重複・欠落する）
+    rank = cast(func.word_similarity(literal(" ".join(keywords)), Report.search_text), Float(precision=53))
+    
+    # 本文は読み込まず、ハイライト対象の列の一致箇所周辺だけを取得
+    query = (
+        db.query(
+            Report.id,
+            Report.user_id,
+            User.full_name,
+            Report.report_date,
+            *[column for field in SEARCH_HIGHLIGHT_FIELDS for column in snippet_columns(field, keywords)],
+            rank.label("rank")
         )
         .join(User, Report.user_id == User.id)
-        .filter(Report.user_id == user_id)
+        .filter(and_(*[
+            Report.search_text.ilike(f"%{escape_like(keyword)}%", escape="\\")
+            for keyword in keywords
+        ]))
     )
     
     # フィルタリング
@@ -212,20 +441,103 @@ async def get_user_reports(
     if end_date:
         query = query.filter(Report.report_date <= end_date)
     
-    # 日付の降順でソート
-    query = query.order_by(Report.report_date.desc())
+    if user_id:
+        query = query.filter(Report.user_id == user_id)
     
-    # 結果を整形
-    result = []
-    for report, user_full_name in query.all():
-        report_dict = {
-            **vars(report),
-            "user_full_name": user_full_name
-        }
-        # SQLAlchemyの内部属性を削除
-        if "_sa_instance_state" in report_dict:
-            del report_dict["_sa_instance_state"]
+    if department_id:
+        query = query.filter(User.department_id == department_id)
+    
+    # 並び順に合わせたキーセットページネーション
+    if sort == "relevance":
+        sort_keys = (rank, Report.report_date, Report.id)
+    else:
+        sort_keys = (Report.report_date, Report.id)
+    
+    if sort == "relevance":
+        values = decode_cursor(cursor, float, date.fromisoformat, int)
+    else:
+        values = decode_cursor(cursor, date.fromisoformat, int)
+    if values is not None:
+        query = query.filter(tuple_(*sort_keys) < tuple_(*values))
+    
+    rows = query.order_by(*[key.desc() for key in sort_keys]).limit(limit + 1).all()
+    
+    # ハイライト用のパターン（長いキーワードを優先して一致させる）
+    pattern = re.compile(
+        "|".join(re.escape(keyword) for keyword in sorted(set(keywords), key=len, reverse=True)),
+        re.IGNORECASE
+    )
+    
+    items = []
+    for row in rows[:limit]:
+        highlights = []
+        for field in SEARCH_HIGHLIGHT_FIELDS:
+            snippet = build_snippet(
+                getattr(row, f"{field}_excerpt"),
+                getattr(row, f"{field}_start"),
+                getattr(row, f"{field}_length"),
+                pattern
+            )
+            if snippet:
+                highlights.append({"field": field, "snippet": snippet})
         
-        result.append(report_dict)
+        items.append({
+            "id": row.id,
+            "user_id": row.user_id,
+            "user_full_name": row.full_name,
+            "report_date": row.report_date,
+            "rank": row.rank,
+            "highlights": highlights
+        })
+    
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        if sort == "relevance":
+            next_cursor = encode_cursor(last.rank, last.report_date, last.id)
+        else:
+            next_cursor = encode_cursor(last.report_date, last.id)
+    
+    return {"items": items, "next_cursor": next_cursor}
+
+# 日報の詳細（全文）を取得
+@router.get("/{report_id}", response_model=ReportWithUser)
+def get_report(
+    report_id: int,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    row = (
+        db.query(
+            Report,
+            User.full_name.label("user_full_name")
+        )
+        .join(User, Report.user_id == User.id)
+        .filter(Report.id == report_id)
+        .first()
+    )
+    
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="指定された日報が見つかりません"
+        )
+    
+    report, user_full_name = row
+    
+    # 所有者または管理者のみ閲覧可能
+    if report.user_id != current_user.id and current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="この日報を閲覧する権限がありません"
+        )
+    
+    report_dict = {
+        **vars(report),
+        "user_full_name": user_full_name
+    }
+    # SQLAlchemyの内部属性を削除
+    if "_sa_instance_state" in report_dict:
+        del report_dict["_sa_instance_state"]
     
-    return result 
\ No newline at end of file
+    return report_dict
@@ -1,14 +1,25 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List
 from datetime import datetime
 from .base import BaseResponse, AdminActionMixin, UserInfoMixin, OrmConfigMixin
 
+# 打刻の列はタイムゾーンなし（サーバーのローカル時刻）のため、
+# "Z" やオフセット付きで送られた日時はローカル時刻に変換してから保存する（asyncpg は変換せずにエラーにする）
+def to_naive_local(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
 class AttendanceBase(BaseModel):
     check_in_time: datetime
     check_out_time: Optional[datetime] = None
     break_start_time: Optional[datetime] = None
     break_end_time: Optional[datetime] = None
     memo: Optional[str] = None
+    
+    _naive_times = field_validator(
+        "check_in_time", "check_out_time", "break_start_time", "break_end_time"
+    )(to_naive_local)
 
 class AttendanceCreate(AttendanceBase):
     pass
@@ -18,6 +29,8 @@ class AttendanceUpdate(BaseModel):
     break_start_time: Optional[datetime] = None
     break_end_time: Optional[datetime] = None
     memo: Optional[str] = None
+    
+    _naive_times = field_validator("check_out_time", "break_start_time", "break_end_time")(to_naive_local)
 
 class AttendanceResponse(AttendanceBase, BaseResponse):
     user_id: int
@@ -66,6 +79,14 @@ class TimeAdjustmentRequestCreate(BaseModel):
     requested_break_end: Optional[datetime] = None
     reason: str
     
+    _naive_times = field_validator(
+        "request_date",
+        "requested_check_in",
+        "requested_check_out",
+        "requested_break_start",
+        "requested_break_end"
+    )(to_naive_local)
+    
 class TimeAdjustmentRequestUpdate(BaseModel):
     status: str
     admin_comment: Optional[str] = None
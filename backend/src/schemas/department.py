@@ -7,6 +7,7 @@ class DepartmentBase(BaseModel):
     name: str
     description: Optional[str] = None
     location: Optional[str] = None
+    parent_id: Optional[int] = None  # 上位部署（NULL=最上位）
 
 class DepartmentCreate(DepartmentBase):
     pass
@@ -16,12 +17,16 @@ class DepartmentUpdate(BaseModel):
     description: Optional[str] = None
     location: Optional[str] = None
     is_active: Optional[bool] = None
+    parent_id: Optional[int] = None  # null を明示すると最上位に移動
 
 class DepartmentResponse(DepartmentBase, BaseResponse):
     is_active: bool
 
 class DepartmentWithUsers(DepartmentResponse):
-    user_count: int
+    user_count: int           # 主所属と兼務の合計
+    primary_count: int = 0    # 主所属（User.department_id）の人数
+    secondary_count: int = 0  # 兼務（UserDepartment）の人数
+    active_count: int = 0     # 主所属のうち有効なユーザー数
 
 class UserDepartmentAssign(BaseModel):
     user_id: int
@@ -31,4 +36,21 @@ class UserDepartmentResponse(OrmConfigMixin):
     user_id: int
     department_id: int
     user_name: str
-    department_name: str 
\ No newline at end of file
+    department_name: str
+
+class DepartmentMember(UserDepartmentResponse):
+    employee_code: Optional[str] = None
+    position: Optional[str] = None
+    is_active: bool
+    membership: str  # primary（主所属）, secondary（兼務）
+
+class DepartmentMemberListResponse(BaseModel):
+    items: List[DepartmentMember]
+    next_cursor: Optional[str] = None  # 次ページがない場合はNone
+
+class DepartmentTreeNode(BaseModel):
+    id: int
+    name: str
+    parent_id: Optional[int] = None
+    is_active: bool
+    depth: int  # 起点の部署からの階層の深さ（起点=0）
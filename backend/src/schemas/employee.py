@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr, validator
+from pydantic import BaseModel, EmailStr, Field, validator
 from typing import Optional, List
 from datetime import date, datetime
 from .base import BaseResponse
@@ -39,6 +39,7 @@ class EmployeeBase(BaseModel):
     position: Optional[str] = None
     employment_type: Optional[EmploymentType] = EmploymentType.FULL_TIME
     hire_date: Optional[date] = None
+    weekly_work_days: Optional[int] = Field(None, ge=1, le=7)  # 週所定労働日数（未設定は週5日）
     
     # 給与情報
     hourly_rate: Optional[int] = 1000
@@ -66,6 +67,7 @@ class EmployeeUpdate(BaseModel):
     position: Optional[str] = None
     employment_type: Optional[EmploymentType] = None
     hire_date: Optional[date] = None
+    weekly_work_days: Optional[int] = Field(None, ge=1, le=7)  # 週所定労働日数（未設定は週5日）
     
     # 給与情報
     hourly_rate: Optional[int] = None
@@ -88,10 +90,40 @@ class EmployeeResponse(EmployeeBase, BaseResponse):
 
 class EmployeeListResponse(BaseModel):
     items: List[EmployeeResponse]
-    total: int
+    total: Optional[int] = None        # count=none の場合はNone
+    total_is_estimate: bool = False    # count=estimated の場合はTrue（概算値）
     page: int
     per_page: int
-    total_pages: int
+    total_pages: Optional[int] = None
+    next_cursor: Optional[str] = None  # 次ページがない場合はNone
+
+# オートコンプリート用の従業員候補（最小限の項目のみ）
+class EmployeeSuggestion(BaseModel):
+    id: int
+    full_name: str
+    email: str
+    employee_code: Optional[str] = None
+    department_id: Optional[int] = None
+    position: Optional[str] = None
+
+# 一括登録の行ごとのエラー
+class EmployeeImportError(BaseModel):
+    row: int      # 行番号（1始まり、CSVのヘッダー行を除く）
+    field: str
+    message: str
+
+class EmployeeImportedRow(BaseModel):
+    row: int
+    id: int
+    username: str
+
+class EmployeeImportResult(BaseModel):
+    total_rows: int
+    imported_count: int
+    error_count: int  # エラーのある行数
+    dry_run: bool
+    errors: List[EmployeeImportError]
+    imported: List[EmployeeImportedRow]
 
 # パスワード変更
 class PasswordChange(BaseModel):
@@ -20,6 +20,8 @@ class LeaveBase(BaseModel):
     user_id: int
     start_date: date
     end_date: date
+    start_half_day: bool = False
+    end_half_day: bool = False
     leave_type: LeaveType = LeaveType.PAID
     reason: Optional[str] = None
     status: LeaveStatus = LeaveStatus.PENDING
@@ -27,12 +29,16 @@ class LeaveBase(BaseModel):
 class LeaveCreate(BaseModel):
     start_date: date
     end_date: date
+    start_half_day: bool = False  # 開始日を半日休とする
+    end_half_day: bool = False    # 終了日を半日休とする
     leave_type: LeaveType = LeaveType.PAID
     reason: Optional[str] = None
     
 class LeaveUpdate(BaseModel):
     start_date: Optional[date] = None
     end_date: Optional[date] = None
+    start_half_day: Optional[bool] = None
+    end_half_day: Optional[bool] = None
     leave_type: Optional[LeaveType] = None
     reason: Optional[str] = None
     status: Optional[LeaveStatus] = None
@@ -44,11 +50,17 @@ class LeaveResponse(LeaveBase, BaseResponse, AdminActionMixin):
 class LeaveWithUser(LeaveResponse, UserInfoMixin):
     admin_full_name: Optional[str] = None
 
+class LeaveListResponse(BaseModel):
+    items: List[LeaveWithUser]
+    next_cursor: Optional[str] = None  # 次ページがない場合はNone
+
 class LeaveBalance(UserInfoMixin, OrmConfigMixin):
     total_paid_leave: float       # 付与されている有給日数
     used_paid_leave: float        # 使用済み有給日数
     remaining_paid_leave: float   # 残りの有給日数
     upcoming_paid_leave: float    # 承認待ちの有給日数
+    expiring_paid_leave: float = 0           # 1か月以内に失効する有給日数
+    next_expiry_date: Optional[date] = None  # 直近の失効日
 
 class LeaveBalanceUpdate(BaseModel):
     user_id: int
@@ -60,4 +72,45 @@ class LeaveAllocation(BaseResponse, UserInfoMixin):
     allocated_days: float
     effective_date: date
     expiry_date: Optional[date] = None
-    reason: Optional[str] = None 
\ No newline at end of file
+    reason: Optional[str] = None 
+    source: str = "manual"
+    used_days: float = 0
+
+class ExpiringLeaveItem(BaseModel):
+    user_id: int
+    user_full_name: str
+    expiring_days: float  # 期間内に失効する未消化日数
+    expiry_date: date     # 期間内で最も早い失効日
+
+class LeaveAccrualRun(BaseModel):
+    as_of: Optional[date] = None  # 省略時は当日
+    start_date: Optional[date] = None  # この日以降の付与のみ登録（省略時は LEAVE_ACCRUAL_START_DATE、未設定なら as_of）
+    dry_run: bool = False
+
+class LeaveAccrualResult(BaseModel):
+    as_of: date
+    dry_run: bool
+    granted_count: int
+    granted_days: float
+    affected_user_ids: List[int]
+    skipped_user_ids: List[int]  # 週所定労働日数が未設定のため付与できなかったユーザー
+
+class TeamCalendarMember(BaseModel):
+    user_id: int
+    user_full_name: str
+    leave_id: int
+    leave_type: LeaveType
+    status: LeaveStatus
+    half_day: bool = False
+
+class TeamCalendarDay(BaseModel):
+    date: date
+    is_business_day: bool
+    absent_count: int
+    members: List[TeamCalendarMember]
+
+class TeamCalendarResponse(BaseModel):
+    department_id: Optional[int] = None
+    start_date: date
+    end_date: date
+    days: List[TeamCalendarDay]
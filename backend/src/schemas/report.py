@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime, date
-from .base import BaseResponse, UserInfoMixin
+from .base import BaseResponse, UserInfoMixin, TimestampMixin
 
 class ReportBase(BaseModel):
     user_id: int
@@ -28,4 +28,49 @@ class ReportResponse(ReportBase, BaseResponse):
     pass
 
 class ReportWithUser(ReportResponse, UserInfoMixin):
-    pass 
\ No newline at end of file
+    pass
+
+class ReportSummary(UserInfoMixin, TimestampMixin):
+    id: int
+    report_date: date
+    content_preview: str     # 本文の先頭部分
+    content_truncated: bool  # 本文が省略されている場合はTrue（全文は詳細APIで取得）
+    has_issues: bool
+
+class ReportSummaryListResponse(BaseModel):
+    items: List[ReportSummary]
+    next_cursor: Optional[str] = None  # 次ページがない場合はNone
+
+class ReportHighlight(BaseModel):
+    field: str    # content, tasks_completed, issues
+    snippet: str  # 一致箇所の前後を切り出し、一致部分を <mark> で囲んだ文字列（HTMLエスケープ済み）
+
+class ReportSearchHit(UserInfoMixin):
+    id: int
+    report_date: date
+    rank: float  # キーワードとの類似度（0〜1）
+    highlights: List[ReportHighlight]
+
+class ReportSearchResponse(BaseModel):
+    items: List[ReportSearchHit]
+    next_cursor: Optional[str] = None  # 次ページがない場合はNone
+
+class ReportComplianceMember(BaseModel):
+    user_id: int
+    user_full_name: str
+
+class ReportComplianceDay(BaseModel):
+    department_id: Optional[int] = None  # 部署未所属はNone
+    department_name: Optional[str] = None
+    date: date
+    attended_count: int   # 出勤者数
+    submitted_count: int  # 出勤者のうち日報を提出した人数
+    missing: List[ReportComplianceMember]  # 出勤したが日報を提出していないユーザー
+
+class ReportComplianceResponse(BaseModel):
+    start_date: date
+    end_date: date
+    attended_total: int
+    submitted_total: int
+    submission_rate: Optional[float] = None  # 出勤がない場合はNone
+    days: List[ReportComplianceDay]
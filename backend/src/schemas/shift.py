@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, List, Dict
 from datetime import datetime, date, time
 from enum import Enum
@@ -39,7 +39,9 @@ class ShiftUpdate(BaseModel):
     status: Optional[ShiftStatus] = None
 
 class ShiftResponse(ShiftBase, BaseResponse, AdminActionMixin):
+    id: Optional[int] = None  # 固定シフトパターンから展開した仮想シフトはNone
     status: ShiftStatus
+    pattern_id: Optional[int] = None
 
 class ShiftWithUser(ShiftResponse, UserInfoMixin):
     pass
@@ -56,6 +58,38 @@ class ShiftTemplateCreate(ShiftTemplate):
 class ShiftTemplateResponse(ShiftTemplate, BaseResponse):
     pass
 
+class ShiftPatternBase(BaseModel):
+    user_id: int
+    weekday: int = Field(..., ge=0, le=6)  # 0: 月曜 〜 6: 日曜
+    template_id: Optional[int] = None
+    start_time: Optional[time] = None
+    end_time: Optional[time] = None
+    availability: ShiftAvailability = ShiftAvailability.AVAILABLE
+    status: ShiftStatus = ShiftStatus.CONFIRMED
+    memo: Optional[str] = None
+    valid_from: date
+    valid_to: Optional[date] = None
+
+class ShiftPatternCreate(ShiftPatternBase):
+    @model_validator(mode="after")
+    def validate_pattern(self):
+        if self.template_id is None and (self.start_time is None or self.end_time is None):
+            raise ValueError("テンプレートまたは開始・終了時刻を指定してください")
+        if self.valid_to and self.valid_to < self.valid_from:
+            raise ValueError("有効期限は開始日以降である必要があります")
+        return self
+
+class ShiftPatternResponse(ShiftPatternBase, BaseResponse):
+    admin_id: Optional[int] = None
+
+class ShiftPatternMaterialize(BaseModel):
+    date: date
+    availability: Optional[ShiftAvailability] = None
+    start_time: Optional[time] = None
+    end_time: Optional[time] = None
+    status: ShiftStatus = ShiftStatus.CONFIRMED
+    admin_comment: Optional[str] = None
+
 class MonthlyShiftRequest(BaseModel):
     year: int
     month: int
@@ -70,4 +104,66 @@ class ShiftSummaryResponse(BaseModel):
     date: date
     total_shifts: int
     confirmed_shifts: int
-    users: List[Dict] 
\ No newline at end of file
+    users: List[Dict]
+
+class ReconciliationStatus(str, Enum):
+    ON_TIME = "on_time"           # 定時出勤・定時退勤
+    LATE = "late"                 # 遅刻
+    EARLY_LEAVE = "early_leave"   # 早退
+    NO_SHOW = "no_show"           # 無断欠勤（確定シフトに打刻なし）
+    UNSCHEDULED = "unscheduled"   # シフト外勤務（打刻のみ）
+    SCHEDULED = "scheduled"       # 未到来の確定シフト
+
+class ShiftReconciliationItem(BaseModel):
+    work_date: date
+    user_id: int
+    user_full_name: str
+    shift_id: Optional[int] = None
+    pattern_id: Optional[int] = None  # 固定シフトパターンから展開したシフトの場合
+    attendance_id: Optional[int] = None
+    scheduled_start: Optional[datetime] = None
+    scheduled_end: Optional[datetime] = None
+    check_in_time: Optional[datetime] = None
+    check_out_time: Optional[datetime] = None
+    status: ReconciliationStatus
+    check_in_delta_minutes: Optional[int] = None   # 正: 遅れ / 負: 早め
+    check_out_delta_minutes: Optional[int] = None  # 正: 残業 / 負: 早退
+
+class ShiftReconciliationListResponse(BaseModel):
+    items: List[ShiftReconciliationItem]
+    total: int
+    page: int
+    per_page: int
+    total_pages: int
+    summary: Dict[str, int]  # ステータスごとの件数
+
+class LaborForecastUser(BaseModel):
+    user_id: int
+    user_name: str
+    department_id: Optional[int] = None
+    department_name: Optional[str] = None
+    confirmed_shifts_count: int
+    hourly_rate: int
+    total_hours: float
+    regular_hours: float
+    overtime_hours: float
+    regular_pay: int
+    overtime_pay: int
+    estimated_salary: int
+
+class LaborForecastDepartment(BaseModel):
+    department_id: Optional[int] = None
+    department_name: Optional[str] = None
+    user_count: int
+    confirmed_shifts_count: int
+    total_hours: float
+    overtime_hours: float
+    estimated_salary: int
+
+class LaborForecastResponse(BaseModel):
+    year: int
+    month: int
+    users: List[LaborForecastUser]
+    departments: List[LaborForecastDepartment]
+    total_hours: float
+    estimated_salary: int
@@ -0,0 +1,139 @@
+"""
+ログイン集中時のスループットと、同時に行う打刻のレイテンシを計測するスクリプト
+
+起動済みのAPIサーバーに対して、次の2フェーズを順に実行する。
+1. ベースライン: 打刻（POST /api/attendance/check-in）のみを一定間隔で送信
+2. ログイン集中: 複数の並列ワーカーで POST /api/auth/token を送り続けながら、同じ間隔で打刻を送信
+
+打刻は2回目以降「すでに本日の勤怠記録が存在します」(400) になるが、認証とDB問い合わせを含む同じ処理を通るため、
+ステータスに関係なく応答までの時間を計測する。ログインは 200 / 429（試行回数の制限）/ 503（bcrypt の実行枠が満杯）/ その他
+に分けて集計する。同じユーザー・IPからログインを繰り返すため、bcrypt の負荷を計測する場合はサーバー側で
+LOGIN_USERNAME_CAPACITY / LOGIN_IP_CAPACITY を十分大きくして起動すること。
+
+使い方:
+    python -m src.scripts.benchmark_login --username taro --password secret
+    python -m src.scripts.benchmark_login --base-url http://localhost:8000 --concurrency 64 --duration 20
+"""
+import sys
+import os
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime
+
+import httpx
+
+
+def percentile(values, ratio):
+    """昇順に並べた値から指定割合の位置の値を返す"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(len(values) * ratio))
+    return values[index]
+
+
+def summarize_latencies(label, latencies):
+    """レイテンシ（秒）の分布をミリ秒で表示"""
+    values = sorted(latencies)
+    if not values:
+        print(f"{label}: 計測なし")
+        return
+
+    print(
+        f"{label}: n={len(values)} "
+        f"p50={percentile(values, 0.50) * 1000:.1f}ms "
+        f"p95={percentile(values, 0.95) * 1000:.1f}ms "
+        f"p99={percentile(values, 0.99) * 1000:.1f}ms "
+        f"max={values[-1] * 1000:.1f}ms "
+        f"mean={statistics.mean(values) * 1000:.1f}ms"
+    )
+
+
+async def login(client, username, password):
+    return await client.post("/api/auth/token", data={"username": username, "password": password})
+
+
+async def probe_punches(client, token, interval, stop_at, latencies):
+    """一定間隔で打刻を送り、応答までの時間を記録する"""
+    headers = {"Authorization": f"Bearer {token}"}
+    while time.monotonic() < stop_at:
+        started = time.perf_counter()
+        await client.post(
+            "/api/attendance/check-in",
+            json={"check_in_time": datetime.now().isoformat()},
+            headers=headers
+        )
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+
+
+async def flood_logins(client, username, password, stop_at, counts):
+    """停止時刻までログインを送り続ける"""
+    while time.monotonic() < stop_at:
+        response = await login(client, username, password)
+        if response.status_code == 200:
+            counts["ok"] += 1
+        elif response.status_code == 429:
+            counts["throttled"] += 1
+        elif response.status_code == 503:
+            counts["rejected"] += 1
+        else:
+            counts["error"] += 1
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 8)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client:
+        response = await login(client, args.username, args.password)
+        if response.status_code != 200:
+            print(f"ログインに失敗しました: {response.status_code} {response.text}")
+            return 1
+        token = response.json()["access_token"]
+
+        # 1. ベースライン
+        baseline = []
+        stop_at = time.monotonic() + args.baseline_duration
+        await probe_punches(client, token, args.punch_interval, stop_at, baseline)
+
+        # 2. ログイン集中
+        loaded = []
+        counts = {"ok": 0, "throttled": 0, "rejected": 0, "error": 0}
+        started = time.monotonic()
+        stop_at = started + args.duration
+        await asyncio.gather(
+            probe_punches(client, token, args.punch_interval, stop_at, loaded),
+            *[
+                flood_logins(client, args.username, args.password, stop_at, counts)
+                for _ in range(args.concurrency)
+            ]
+        )
+        elapsed = time.monotonic() - started
+
+    print(f"対象: {args.base_url}  並列ログイン数: {args.concurrency}  計測時間: {args.duration}秒")
+    print(
+        f"ログイン: 成功 {counts['ok']} ({counts['ok'] / elapsed:.1f} req/s)  "
+        f"429 {counts['throttled']}  503 {counts['rejected']}  その他 {counts['error']}"
+    )
+    summarize_latencies("打刻（ベースライン）", baseline)
+    summarize_latencies("打刻（ログイン集中時）", loaded)
+    return 0
+
+
+def main():
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="ログインスループットと打刻レイテンシの計測")
+    parser.add_argument("--base-url", default=os.getenv("BENCHMARK_BASE_URL", "http://localhost:8000"))
+    parser.add_argument("--username", default=os.getenv("BENCHMARK_USERNAME", "admin"))
+    parser.add_argument("--password", default=os.getenv("BENCHMARK_PASSWORD", "admin"))
+    parser.add_argument("--concurrency", type=int, default=32, help="並列にログインを送るワーカー数")
+    parser.add_argument("--duration", type=float, default=10, help="ログイン集中フェーズの秒数")
+    parser.add_argument("--baseline-duration", type=float, default=5, help="ベースラインフェーズの秒数")
+    parser.add_argument("--punch-interval", type=float, default=0.05, help="打刻を送る間隔（秒）")
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+同時リクエスト数を段階的に増やし、1ワーカーあたりの実効並列度を計測するスクリプト
+
+起動済みのAPIサーバー（計測時は uvicorn --workers 1 で起動する）に対して、同時接続数ごとに
+一定時間リクエストを送り続け、スループットとレイテンシを集計する。
+
+実効並列度 = スループット × 同時接続数1のときの平均レイテンシ
+（同時接続数を増やしても1件ずつしか処理できない場合は約1に留まり、
+DB待ちの間に他のリクエストを処理できる場合は同時接続数に近づく）
+
+使い方:
+    python -m src.scripts.load_benchmark --username taro --password secret
+    python -m src.scripts.load_benchmark --path /api/attendance/monthly-stats?year=2024&month=4 --levels 1,8,32,64
+"""
+import sys
+import os
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from .benchmark_login import percentile
+
+
+async def send_requests(client, path, headers, stop_at, latencies, counts):
+    """停止時刻までリクエストを送り続ける"""
+    while time.monotonic() < stop_at:
+        started = time.perf_counter()
+        response = await client.get(path, headers=headers)
+        latencies.append(time.perf_counter() - started)
+        if response.status_code == 200:
+            counts["ok"] += 1
+        else:
+            counts["error"] += 1
+
+
+async def run_level(client, path, headers, concurrency, duration):
+    """指定した同時接続数で duration 秒間計測する"""
+    latencies = []
+    counts = {"ok": 0, "error": 0}
+    started = time.monotonic()
+    stop_at = started + duration
+    await asyncio.gather(*[
+        send_requests(client, path, headers, stop_at, latencies, counts)
+        for _ in range(concurrency)
+    ])
+    elapsed = time.monotonic() - started
+    return latencies, counts, elapsed
+
+
+async def run(args):
+    levels = [int(level) for level in args.levels.split(",")]
+    limits = httpx.Limits(max_connections=max(levels) + 8)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client:
+        response = await client.post(
+            "/api/auth/token", data={"username": args.username, "password": args.password}
+        )
+        if response.status_code != 200:
+            print(f"ログインに失敗しました: {response.status_code} {response.text}")
+            return 1
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        # 接続の確立や各種キャッシュの読み込みを計測から除く
+        await run_level(client, args.path, headers, 1, 1)
+
+        print(f"対象: {args.base_url}{args.path}  計測時間: {args.duration}秒/段階")
+        base_latency = None
+        for concurrency in levels:
+            latencies, counts, elapsed = await run_level(
+                client, args.path, headers, concurrency, args.duration
+            )
+            if not latencies:
+                print(f"同時接続数 {concurrency}: 計測なし")
+                continue
+
+            values = sorted(latencies)
+            throughput = len(values) / elapsed
+            if base_latency is None:
+                base_latency = statistics.mean(values)
+
+            print(
+                f"同時接続数 {concurrency:>4}: "
+                f"{throughput:8.1f} req/s  "
+                f"p50={percentile(values, 0.50) * 1000:.1f}ms "
+                f"p95={percentile(values, 0.95) * 1000:.1f}ms "
+                f"p99={percentile(values, 0.99) * 1000:.1f}ms  "
+                f"実効並列度={throughput * base_latency:.1f}  "
+                f"エラー {counts['error']}"
+            )
+    return 0
+
+
+def main():
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="同時接続数ごとのスループットと実効並列度の計測")
+    parser.add_argument("--base-url", default=os.getenv("BENCHMARK_BASE_URL", "http://localhost:8000"))
+    parser.add_argument("--username", default=os.getenv("BENCHMARK_USERNAME", "admin"))
+    parser.add_argument("--password", default=os.getenv("BENCHMARK_PASSWORD", "admin"))
+    parser.add_argument("--path", default="/api/attendance/my-records", help="計測するGETエンドポイント")
+    parser.add_argument("--levels", default="1,4,16,64", help="同時接続数（カンマ区切り、先頭が基準）")
+    parser.add_argument("--duration", type=float, default=10, help="各段階の秒数")
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
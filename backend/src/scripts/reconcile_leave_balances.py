@@ -0,0 +1,44 @@
+"""
+有給休暇残高台帳（paid_leave_balances）を LeaveAllocation と Leave から再集計するスクリプト
+承認済みの有給休暇の付与への割り当て（leave_consumptions）も取得日順に再計算する
+
+使い方:
+    python -m src.scripts.reconcile_leave_balances            # 全ユーザー
+    python -m src.scripts.reconcile_leave_balances 1 2 3      # 指定ユーザーのみ
+"""
+import sys
+import os
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.database import SessionLocal
+from src.models.models import PaidLeaveBalance
+from src.routers.leave import rebuild_leave_consumptions, rebuild_paid_leave_balances
+
+
+def main():
+    """メイン処理"""
+    user_ids = [int(arg) for arg in sys.argv[1:]] or None
+    db = SessionLocal()
+    
+    try:
+        unassigned = rebuild_leave_consumptions(db, user_ids)
+        rebuild_paid_leave_balances(db, user_ids)
+        db.commit()
+        
+        if unassigned:
+            print(f"付与に割り当てられなかった承認済み休暇があります（{unassigned}件）")
+        
+        count = db.query(PaidLeaveBalance).count() if user_ids is None else len(user_ids)
+        print(f"有給休暇残高台帳を再集計しました（{count}件）")
+        
+    except Exception as e:
+        print(f"エラーが発生しました: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
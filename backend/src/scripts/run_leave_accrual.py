@@ -0,0 +1,54 @@
+"""
+勤続年数に応じた法定有給休暇を一括付与するスクリプト（日次バッチ想定）
+
+使い方:
+    python -m src.scripts.run_leave_accrual                  # 当日基準で付与
+    python -m src.scripts.run_leave_accrual 2026-04-01       # 基準日を指定
+    python -m src.scripts.run_leave_accrual 2026-04-01 --dry-run
+    python -m src.scripts.run_leave_accrual --from=2026-01-01  # 2026-01-01 以降の付与漏れも登録
+"""
+import sys
+import os
+import time
+from datetime import date
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.database import SessionLocal
+from src.leave_accrual import run_statutory_accrual
+
+
+def main():
+    """メイン処理"""
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    dry_run = "--dry-run" in sys.argv[1:]
+    as_of = date.fromisoformat(args[0]) if args else None
+    start_date = None
+    for arg in sys.argv[1:]:
+        if arg.startswith("--from="):
+            start_date = date.fromisoformat(arg[len("--from="):])
+    db = SessionLocal()
+    
+    try:
+        started = time.perf_counter()
+        result = run_statutory_accrual(db, as_of=as_of, dry_run=dry_run, start_date=start_date)
+        if not dry_run:
+            db.commit()
+        elapsed = time.perf_counter() - started
+        
+        label = "付与予定" if dry_run else "付与"
+        print(f"基準日 {result.as_of}: {result.granted_count}件 / {result.granted_days}日を{label}しました"
+              f"（対象 {len(result.affected_user_ids)}名、{elapsed:.2f}秒）")
+        if result.skipped_user_ids:
+            print(f"週所定労働日数が未設定のためスキップ: {result.skipped_user_ids}")
+        
+    except Exception as e:
+        print(f"エラーが発生しました: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
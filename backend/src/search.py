@@ -0,0 +1,3 @@
+def escape_like(keyword: str) -> str:
+    """LIKE / ILIKE 用にワイルドカード（%, _）とエスケープ文字をエスケープ（escape="\\" を指定して使う）"""
+    return keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
@@ -0,0 +1,84 @@
+from bisect import bisect_left, bisect_right
+from datetime import date
+from typing import Iterable
+
+from sqlalchemy.orm import Session
+
+from .cache import VersionedCache
+from .models.models import Holiday
+
+
+def count_weekdays(start_date: date, end_date: date) -> int:
+    """期間内（両端を含む）の平日数を O(1) で数える"""
+    if start_date > end_date:
+        return 0
+
+    total_days = (end_date - start_date).days + 1
+    full_weeks, remainder = divmod(total_days, 7)
+
+    # 端数の日数分だけ開始曜日から数える（最大6日）
+    start_weekday = start_date.weekday()
+    extra = sum(1 for i in range(remainder) if (start_weekday + i) % 7 < 5)
+
+    return full_weeks * 5 + extra
+
+
+class WorkingCalendar:
+    """平日の祝日をソート済み配列で保持し、営業日数を計算する"""
+
+    def __init__(self, holidays: Iterable[date]):
+        # 土日の祝日は平日数に含まれないので除外しておく
+        self.holidays = sorted({d for d in holidays if d.weekday() < 5})
+
+    def is_business_day(self, target_date: date) -> bool:
+        if target_date.weekday() >= 5:
+            return False
+        index = bisect_left(self.holidays, target_date)
+        return not (index < len(self.holidays) and self.holidays[index] == target_date)
+
+    def count_holidays(self, start_date: date, end_date: date) -> int:
+        """期間内の平日の祝日数"""
+        if start_date > end_date:
+            return 0
+        return bisect_right(self.holidays, end_date) - bisect_left(self.holidays, start_date)
+
+    def business_days(
+        self,
+        start_date: date,
+        end_date: date,
+        start_half_day: bool = False,
+        end_half_day: bool = False
+    ) -> float:
+        """
+        期間内の営業日数（土日・祝日を除く）
+        start_half_day / end_half_day が指定された場合、開始日・終了日を0.5日として数える。
+        """
+        days = float(count_weekdays(start_date, end_date) - self.count_holidays(start_date, end_date))
+
+        if start_date == end_date:
+            if (start_half_day or end_half_day) and self.is_business_day(start_date):
+                days -= 0.5
+            return days
+
+        if start_half_day and self.is_business_day(start_date):
+            days -= 0.5
+        if end_half_day and self.is_business_day(end_date):
+            days -= 0.5
+
+        return days
+
+
+# 祝日カレンダーのキャッシュ
+# Holiday を更新する処理では必ず invalidate_holiday_calendar() を呼ぶこと
+_holiday_calendar_cache = VersionedCache(ttl_seconds=3600)
+
+
+def get_working_calendar(db: Session) -> WorkingCalendar:
+    def load():
+        return WorkingCalendar(d for (d,) in db.query(Holiday.date).all())
+
+    return _holiday_calendar_cache.get(load)
+
+
+def invalidate_holiday_calendar() -> None:
+    _holiday_calendar_cache.invalidate()
@@ -0,0 +1,167 @@
+import asyncio
+import ipaddress
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from src import rate_limit
+from src.rate_limit import (
+    InMemoryTokenBucketBackend,
+    LoginThrottle,
+    RedisTokenBucketBackend,
+    TokenBucketBackend,
+    get_client_ip,
+)
+
+PROXIES = [ipaddress.ip_network("172.16.0.0/12")]
+
+
+class FakeClock:
+    """time.monotonic / time.time の代わりに使う時計"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    monkeypatch.setattr(rate_limit.time, "time", clock)
+    return clock
+
+
+def consume(backend, key, capacity=3, refill_per_second=1.0):
+    return asyncio.run(backend.consume(key, capacity, refill_per_second))
+
+
+def test_backend_is_abstract():
+    with pytest.raises(TypeError):
+        TokenBucketBackend()
+
+
+def test_in_memory_consumes_up_to_capacity(clock):
+    backend = InMemoryTokenBucketBackend()
+
+    assert [consume(backend, "a") for _ in range(3)] == [0, 0, 0]
+    assert consume(backend, "a") == pytest.approx(1.0)
+    # 別のキーは影響を受けない
+    assert consume(backend, "b") == 0
+
+
+def test_in_memory_refills_over_time(clock):
+    backend = InMemoryTokenBucketBackend()
+    for _ in range(3):
+        consume(backend, "a", refill_per_second=0.5)
+
+    assert consume(backend, "a", refill_per_second=0.5) == pytest.approx(2.0)
+    clock.now += 2
+    assert consume(backend, "a", refill_per_second=0.5) == 0
+    # 長時間経過しても capacity を超えては補充されない
+    clock.now += 3600
+    assert [consume(backend, "a", refill_per_second=0.5) for _ in range(4)][-1] > 0
+
+
+def test_in_memory_reset_and_eviction(clock):
+    backend = InMemoryTokenBucketBackend(max_keys=2)
+    for _ in range(3):
+        consume(backend, "a")
+
+    asyncio.run(backend.reset("a"))
+    assert consume(backend, "a") == 0
+
+    consume(backend, "b")
+    consume(backend, "c")
+    # 最も古いキー a が破棄され、満杯のバケットから始まる
+    assert len(backend._buckets) == 2
+    assert "a" not in backend._buckets
+
+
+def test_login_throttle_rejects_with_retry_after(clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "LOGIN_USERNAME_CAPACITY", 2)
+    monkeypatch.setattr(rate_limit, "LOGIN_USERNAME_REFILL_PER_SECOND", 0.1)
+    throttle = LoginThrottle(InMemoryTokenBucketBackend())
+
+    asyncio.run(throttle.check("Taro", "192.0.2.1"))
+    asyncio.run(throttle.check(" taro ", "192.0.2.1"))
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(throttle.check("TARO", "192.0.2.1"))
+
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.headers["Retry-After"] == "10"
+    # 他のIPアドレスからの本人のログインは妨げない
+    asyncio.run(throttle.check("taro", "192.0.2.2"))
+
+
+def make_request(peer, forwarded_for=None):
+    headers = [(b"x-forwarded-for", value.encode()) for value in forwarded_for or []]
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": headers, "client": (peer, 50000)})
+
+
+def test_client_ip_ignores_forwarded_for_from_untrusted_peer():
+    request = make_request("203.0.113.7", ["198.51.100.1"])
+    assert get_client_ip(request, PROXIES) == "203.0.113.7"
+
+
+def test_client_ip_behind_trusted_proxy():
+    # nginx は $proxy_add_x_forwarded_for でクライアントが送った値の右に接続元を追加する
+    request = make_request("172.18.0.5", ["10.9.9.9, 198.51.100.1"])
+    assert get_client_ip(request, PROXIES) == "198.51.100.1"
+
+    # 多段のプロキシは右から辿って信頼するものを飛ばす
+    request = make_request("172.18.0.5", ["198.51.100.1", "172.18.0.9"])
+    assert get_client_ip(request, PROXIES) == "198.51.100.1"
+
+    # ヘッダーがない場合は接続元
+    assert get_client_ip(make_request("172.18.0.5"), PROXIES) == "172.18.0.5"
+
+
+def test_login_throttle_behind_proxy_limits_each_client(clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "LOGIN_IP_CAPACITY", 3)
+    monkeypatch.setattr(rate_limit, "LOGIN_IP_REFILL_PER_SECOND", 0.1)
+    throttle = LoginThrottle(InMemoryTokenBucketBackend())
+
+    def login(client):
+        request = make_request("172.18.0.5", [client])
+        asyncio.run(throttle.check("someone", get_client_ip(request, PROXIES)))
+
+    for _ in range(3):
+        login("198.51.100.1")
+    with pytest.raises(HTTPException):
+        login("198.51.100.1")
+
+    # 同じプロキシ経由でも、他のクライアントは上限に影響されない
+    login("198.51.100.2")
+
+
+def test_redis_backend_matches_in_memory(clock):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+
+    async def run():
+        backend = RedisTokenBucketBackend(fakeredis.FakeAsyncRedis())
+        results = [await backend.consume("a", 3, 1.0) for _ in range(4)]
+        clock.now += 1
+        results.append(await backend.consume("a", 3, 1.0))
+        await backend.reset("a")
+        results.append(await backend.consume("a", 3, 1.0))
+        return results
+
+    assert asyncio.run(run()) == [0, 0, 0, pytest.approx(1.0), 0, 0]
+
+
+def test_redis_backend_allows_when_unavailable():
+    class BrokenClient:
+        async def eval(self, *args):
+            raise ConnectionError("down")
+
+        async def delete(self, *args):
+            raise ConnectionError("down")
+
+    backend = RedisTokenBucketBackend(BrokenClient())
+    assert asyncio.run(backend.consume("a", 1, 1.0)) == 0
+    asyncio.run(backend.reset("a"))
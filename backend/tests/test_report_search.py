@@ -0,0 +1,77 @@
+"""
+日報検索の類似度順ページネーション（PostgreSQL + pg_trgm が必要）
+
+TEST_DATABASE_URL に接続先を指定した場合のみ実行する。テーブルは専用のスキーマに作成し、終了時に削除する。
+"""
+import os
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from src.models.models import Base, Department, Report, User
+from src.routers.report import search_reports
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+SCHEMA = "test_report_search"
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL が未設定")
+
+
+@pytest.fixture
+def db():
+    admin_engine = create_engine(TEST_DATABASE_URL)
+    with admin_engine.begin() as connection:
+        if not connection.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first():
+            pytest.skip("pg_trgm が利用できません")
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+
+    engine = create_engine(TEST_DATABASE_URL, connect_args={"options": f"-csearch_path={SCHEMA},public"})
+    Base.metadata.create_all(engine, tables=[Department.__table__, User.__table__, Report.__table__])
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+        with admin_engine.begin() as connection:
+            connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+        admin_engine.dispose()
+
+
+def search(db, cursor=None, limit=2):
+    return search_reports(
+        q="abcd", start_date=None, end_date=None, user_id=None, department_id=None,
+        sort="relevance", cursor=cursor, limit=limit, db=db, current_user=None
+    )
+
+
+def test_relevance_pages_across_tied_non_dyadic_ranks(db):
+    user = User(username="taro", email="taro@example.com", full_name="太郎", hashed_password="x")
+    db.add(user)
+    db.flush()
+    # 同じ類似度（2進数で割り切れない値）の日報を複数作る
+    contents = ["xabcdx"] * 4 + ["abcdx"] * 3 + ["abcd"] * 2
+    for day, content in enumerate(contents, start=1):
+        db.add(Report(user_id=user.id, report_date=date(2026, 10, day), content=content))
+    db.commit()
+
+    everything = search(db, limit=100)["items"]
+    ranks = {item["rank"] for item in everything}
+    assert any((rank * 2 ** 20) % 1 for rank in ranks), "2進数で割り切れない類似度が必要"
+
+    seen = []
+    cursor = None
+    for _ in range(len(contents)):
+        page = search(db, cursor=cursor)
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert cursor is None
+    assert seen == [item["id"] for item in everything]
+    assert len(seen) == len(contents)
@@ -18,6 +18,7 @@ import {
   VisibilityOff,
 } from "@mui/icons-material";
 import { authApi } from "../api/client";
+import { saveTokens } from "../services/api";
 
 interface PasswordChangeDialogProps {
   open: boolean;
@@ -67,11 +68,14 @@ const PasswordChangeDialog: React.FC<PasswordChangeDialogProps> = ({
     setLoading(true);
 
     try {
-      await authApi.changePasswordApiAuthChangePasswordPost({
+      const response = await authApi.changePasswordApiAuthChangePasswordPost({
         current_password: currentPassword,
         new_password: newPassword,
       });
 
+      // 他の端末のセッションは失効するため、この端末には再発行されたトークンを保存する
+      saveTokens(response.data as { access_token?: string; refresh_token?: string });
+
       setSuccess(true);
       
       // パスワード変更完了を記録（通知用）
@@ -5,7 +5,7 @@ import React, {
   useEffect,
   ReactNode,
 } from "react";
-import api from "../services/api";
+import api, { saveTokens, clearTokens } from "../services/api";
 
 // ユーザーの型定義
 interface User {
@@ -67,8 +67,7 @@ export const AuthProvider: React.FC<AuthProviderProps> = ({ children }) => {
         } catch (err) {
           // トークンが無効な場合はクリア
           console.error("認証エラー:", err);
-          localStorage.removeItem("token");
-          api.defaults.headers.common["Authorization"] = "";
+          clearTokens();
           setIsAuthenticated(false);
           setUser(null);
         }
@@ -100,11 +99,8 @@ export const AuthProvider: React.FC<AuthProviderProps> = ({ children }) => {
         }
       );
 
-      const { access_token } = response.data;
-
-      // トークンを保存
-      localStorage.setItem("token", access_token);
-      api.defaults.headers.common["Authorization"] = `Bearer ${access_token}`;
+      // トークンを保存（アクセストークンは短命のため、期限切れ時はリフレッシュトークンで再発行する）
+      saveTokens(response.data);
 
       // ユーザー情報を取得
       const userResponse = await api.get("/api/auth/me");
@@ -122,8 +118,19 @@ export const AuthProvider: React.FC<AuthProviderProps> = ({ children }) => {
 
   // ログアウト処理
   const logout = () => {
-    localStorage.removeItem("token");
-    api.defaults.headers.common["Authorization"] = "";
+    // サーバー側でもトークンを失効させる（失敗してもローカルのログアウトは行う）
+    const token = localStorage.getItem("token");
+    const refreshToken = localStorage.getItem("refreshToken");
+    if (token) {
+      api
+        .post(
+          "/api/auth/logout",
+          { refresh_token: refreshToken },
+          { headers: { Authorization: `Bearer ${token}` } }
+        )
+        .catch(() => {});
+    }
+    clearTokens();
     setIsAuthenticated(false);
     setUser(null);
   };
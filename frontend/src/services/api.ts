@@ -21,15 +21,74 @@ api.interceptors.request.use(
   }
 );
 
+// トークンを保存（リフレッシュトークンが含まれていれば併せて保存）
+export const saveTokens = (tokens: { access_token?: string; refresh_token?: string | null }) => {
+  if (tokens.access_token) {
+    localStorage.setItem("token", tokens.access_token);
+    api.defaults.headers.common["Authorization"] = `Bearer ${tokens.access_token}`;
+  }
+  if (tokens.refresh_token) {
+    localStorage.setItem("refreshToken", tokens.refresh_token);
+  }
+};
+
+// トークンを破棄
+export const clearTokens = () => {
+  localStorage.removeItem("token");
+  localStorage.removeItem("refreshToken");
+  api.defaults.headers.common["Authorization"] = "";
+};
+
+// アクセストークンを再発行（同時に複数のリクエストが401になっても、再発行は1回だけ行う）
+let refreshPromise: Promise<string | null> | null = null;
+
+const refreshAccessToken = (): Promise<string | null> => {
+  if (!refreshPromise) {
+    const refreshToken = localStorage.getItem("refreshToken");
+    const request = refreshToken
+      ? axios
+          .post(`${api.defaults.baseURL}/api/auth/refresh`, { refresh_token: refreshToken })
+          .then((response) => {
+            saveTokens(response.data);
+            return response.data.access_token as string;
+          })
+          .catch(() => {
+            // 別のタブが先に再発行していれば、そのトークンを使う
+            const latest = localStorage.getItem("refreshToken");
+            return latest && latest !== refreshToken ? localStorage.getItem("token") : null;
+          })
+      : Promise.resolve(null);
+    refreshPromise = request.finally(() => {
+      refreshPromise = null;
+    });
+  }
+  return refreshPromise;
+};
+
+// 再発行の対象外とする認証API（ログイン失敗などの401はそのまま返す）
+const NO_REFRESH_PATHS = ["/api/auth/token", "/api/auth/refresh", "/api/auth/logout"];
+
 // レスポンスインターセプター
 api.interceptors.response.use(
   (response) => {
     return response;
   },
-  (error) => {
+  async (error) => {
     // 認証エラー時の処理
     if (error.response && error.response.status === 401) {
-      localStorage.removeItem("token");
+      const original = error.config;
+
+      // アクセストークンの期限切れは、リフレッシュトークンで再発行して1回だけ再試行する
+      if (original && !original._retry && !NO_REFRESH_PATHS.some((path) => original.url?.includes(path))) {
+        original._retry = true;
+        const token = await refreshAccessToken();
+        if (token) {
+          original.headers.Authorization = `Bearer ${token}`;
+          return api(original);
+        }
+      }
+
+      clearTokens();
       // ウィンドウをリロードして認証状態をリセット
       if (window.location.pathname !== "/login") {
         window.location.href = "/login";